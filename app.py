@@ -1,27 +1,218 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory
-from flask_socketio import SocketIO, emit, join_room, leave_room
+from flask import Flask, render_template, request, jsonify, send_from_directory, abort, Response, g, has_app_context
+from flask_socketio import SocketIO, emit, join_room, leave_room, rooms
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from sqlalchemy import func, case, event, insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import joinedload
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from datetime import datetime, timedelta, timezone
 import os
-import uuid
-from werkzeug.utils import secure_filename
+import json
+import atexit
+import base64
+import sqlite3
+import threading
+import mimetypes
+import hashlib
+import io
+import time
+from functools import wraps
+from collections import namedtuple
+from werkzeug.security import safe_join
+from werkzeug.exceptions import HTTPException
+from urllib.parse import urlsplit, urlencode
+from migrations import run_migrations, TIMELINE_MAX_ENTRIES, FANOUT_FOLLOWER_LIMIT
+from cache import LRUCache, ActiveStoryIndex, FollowGraph, ResponseCache, PostStats
+from imaging import ImagePipeline, can_process, strip_metadata
+from storage import ContentStore
+from backplane import LocalQueueManager
+from writebehind import GroupCommitWriter, LikeBuffer, LikeJournal
+from realtime import TypingCoalescer, EngagementCoalescer
+from search import SEARCH_TABLE, normalize_text, match_query, initial_match_query, match_rank
+from responses import FastJSONProvider, compress_response, parse_fields, project
+from metrics import Registry, QUERY_COUNT_BUCKETS
 
 # ساخت اپلیکیشن
 app = Flask(__name__)
+app.json = FastJSONProvider(app)  # orjson در صورت نصب بودن
 app.config['SECRET_KEY'] = 'instagram-clone-secret-key'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///instagram.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///instagram.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['UPLOAD_FOLDER'] = 'static/uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB
+app.config['MEDIA_URL_PREFIX'] = '/media'  # مسیر عمومی فایل‌های داخل UPLOAD_FOLDER
+app.config['MEDIA_MAX_AGE'] = 365 * 24 * 3600  # نام فایل‌ها یکتا و تغییرناپذیرند
+# واگذاری ارسال فایل به وب‌سرور جلویی: X-Sendfile (آپاچی/lighttpd) یا X-Accel-Redirect (nginx)
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE') == '1'
+app.config['MEDIA_ACCEL_REDIRECT'] = os.environ.get('MEDIA_ACCEL_REDIRECT')  # مثلاً /protected-media
+# صف پیام مشترک بین پردازه‌ها برای emit به room ها؛ redis://... یا local://host:port
+app.config['SOCKETIO_MESSAGE_QUEUE'] = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+app.config['FEED_PAGE_SIZE'] = 20
+app.config['PROFILE_PAGE_SIZE'] = 12
+app.config['MAX_PAGE_SIZE'] = 50
+app.config['TIMELINE_MAX_ENTRIES'] = TIMELINE_MAX_ENTRIES  # سقف تایم‌لاین هر کاربر
+app.config['TIMELINE_TRIM_INTERVAL'] = 30  # فاصله کوتاه کردن تایم‌لاین‌های بیش از سقف (ثانیه)؛ 0 یعنی غیرفعال
+app.config['TIMELINE_TRIM_BATCH'] = 500  # تعداد کاربر بررسی‌شده در هر تراکنش کوتاه‌سازی
+app.config['FANOUT_FOLLOWER_LIMIT'] = FANOUT_FOLLOWER_LIMIT  # بیشتر از این، fan-out هنگام خواندن
+app.config['TIMELINE_BACKFILL'] = 20  # پست‌های اخیر که بعد از فالو اضافه می‌شوند
+# بارگذاری دوباره گراف فالو از دیتابیس (ثانیه) تا تغییرات پردازه‌های دیگر دیده شوند؛ 0 یعنی غیرفعال
+app.config['FOLLOW_GRAPH_RELOAD_INTERVAL'] = 300
+app.config['SUGGESTIONS_LIMIT'] = 10
+app.config['USER_CACHE_SIZE'] = 10000  # ظرفیت کش نام کاربری -> پروفایل
+app.config['RESPONSE_CACHE_SIZE'] = 2048  # تعداد پاسخ‌های GET نگه‌داشته‌شده
+app.config['RESPONSE_CACHE_MAX_AGE'] = 30  # سقف عمر پاسخ کش‌شده (ثانیه)؛ 0 یعنی کش غیرفعال
+app.config['COMPRESS_MIN_SIZE'] = 1024  # پاسخ‌های کوچک‌تر از این (بایت) فشرده نمی‌شوند
+app.config['COMPRESS_LEVEL'] = 6  # سطح gzip/brotli
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '1') != '0'
+app.config['QUERY_BUDGET'] = 20  # درخواست با کوئری بیشتر از این گزارش می‌شود (نشانه N+1)
+app.config['BATCH_MAX_REQUESTS'] = 10  # حداکثر زیردرخواست در هر /api/batch
+app.config['SEARCH_RESULTS'] = 10  # تعداد نتایج جستجوی کاربران
+app.config['SEARCH_CANDIDATES'] = 50  # نامزدهای FTS پیش از رتبه‌بندی نهایی
+app.config['STORY_TTL'] = 24 * 3600  # عمر استوری به ثانیه
+app.config['STORY_REAPER_INTERVAL'] = 60  # فاصله اجرای پاک‌کننده؛ 0 یعنی غیرفعال
+app.config['STORY_REAPER_BATCH'] = 500  # تعداد استوری حذف‌شده در هر تراکنش
+# تعداد پردازه‌های ساخت نسخه تصویر؛ 0 یعنی پردازش همزمان در همان درخواست
+app.config['IMAGE_PIPELINE_WORKERS'] = int(os.environ.get('IMAGE_PIPELINE_WORKERS', '2'))
+app.config['CHAT_FLUSH_INTERVAL'] = 0.005  # حداکثر انتظار پیام چت در صف پیش از commit (ثانیه)
+app.config['CHAT_FLUSH_BATCH'] = 200  # حداکثر پیام در هر commit گروهی
+app.config['CHAT_SEND_TIMEOUT'] = 5  # انتظار /api/chat/send برای ذخیره شدن پیام (ثانیه)
+app.config['CHAT_PAGE_SIZE'] = 30  # تعداد پیام‌های هر صفحه تاریخچه چت
+app.config['CHAT_SNIPPET_LENGTH'] = 100  # طول خلاصه آخرین پیام در صندوق پیام
+app.config['TYPING_WINDOW'] = 0.5  # حداکثر یک رویداد user_typing برای هر کاربر در این بازه (ثانیه)
+app.config['TYPING_IDLE_TIMEOUT'] = 5  # پایان خودکار «در حال تایپ» پس از این مدت بی‌فعالیتی
+app.config['ENGAGEMENT_WINDOW'] = 1.0  # حداکثر دو رویداد post_stats برای هر پست در این بازه (ثانیه)
+app.config['WATCH_POSTS_LIMIT'] = 200  # حداکثر room پست برای هر اتصال سوکت
+# بافر لایک درون‌حافظه‌ای؛ با LIKE_BUFFER=0 هر لایک همان لحظه ذخیره می‌شود (پیش‌فرض run.py --workers)
+app.config['LIKE_BUFFER'] = os.environ.get('LIKE_BUFFER', '1') != '0'
+app.config['LIKE_FLUSH_INTERVAL'] = 0.5  # فاصله ذخیره تغییرهای خالص بافر لایک (ثانیه)
+# ژورنال بازیابی بافر لایک؛ رشته خالی یعنی بدون ژورنال (تغییرهای ذخیره‌نشده با crash از بین می‌روند)
+app.config['LIKE_JOURNAL_DIR'] = os.environ.get('LIKE_JOURNAL_DIR', os.path.join(app.instance_path, 'like-journal'))
+# تنظیمات اتصال SQLite؛ با SQLITE_TUNING=0 غیرفعال می‌شود (برای مقایسه بنچمارک)
+app.config['SQLITE_TUNING'] = os.environ.get('SQLITE_TUNING', '1') != '0'
+app.config['SQLITE_PRAGMAS'] = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'busy_timeout': 5000,  # میلی‌ثانیه
+}
 
 # ایجاد پوشه‌های آپلود
 os.makedirs('static/uploads/posts', exist_ok=True)
 os.makedirs('static/uploads/stories', exist_ok=True)
 os.makedirs('static/uploads/profiles', exist_ok=True)
 
+# تنظیم SQLite روی هر اتصال جدید
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection) or not app.config['SQLITE_TUNING']:
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in app.config['SQLITE_PRAGMAS'].items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
 # راه‌اندازی دیتابیس و سوکت
 db = SQLAlchemy(app)
-socketio = SocketIO(app, cors_allowed_origins="*")
+
+socketio_options = {}
+message_queue = app.config['SOCKETIO_MESSAGE_QUEUE']
+if message_queue and message_queue.startswith('local://'):
+    socketio_options['client_manager'] = LocalQueueManager(message_queue)
+elif message_queue:
+    socketio_options['message_queue'] = message_queue
+socketio = SocketIO(app, cors_allowed_origins="*", **socketio_options)
+
+# ============ Metrics ============
+metrics = Registry()
+http_latency = metrics.histogram(
+    'instaclone_http_request_duration_seconds', 'زمان پاسخ هر مسیر', ('method', 'route'))
+http_requests = metrics.counter(
+    'instaclone_http_requests_total', 'تعداد درخواست‌ها به تفکیک وضعیت', ('method', 'route', 'status'))
+http_queries = metrics.histogram(
+    'instaclone_http_request_queries', 'تعداد کوئری SQL هر درخواست', ('method', 'route'), QUERY_COUNT_BUCKETS)
+http_query_time = metrics.histogram(
+    'instaclone_http_request_query_seconds', 'زمان کل کوئری‌های SQL هر درخواست', ('method', 'route'))
+query_budget_exceeded = metrics.counter(
+    'instaclone_query_budget_exceeded_total', 'درخواست‌ها و رویدادهای بیش از QUERY_BUDGET کوئری', ('route',))
+socket_event_latency = metrics.histogram(
+    'instaclone_socketio_event_duration_seconds', 'زمان اجرای handler رویدادهای سوکت', ('event',))
+socket_event_queries = metrics.histogram(
+    'instaclone_socketio_event_queries', 'تعداد کوئری SQL هر رویداد سوکت', ('event',), QUERY_COUNT_BUCKETS)
+socket_clients = metrics.gauge('instaclone_socketio_connected_clients', 'اتصال‌های باز Socket.IO این پردازه')
+background_queries = metrics.counter(
+    'instaclone_background_queries_total', 'کوئری‌های SQL خارج از درخواست و رویداد (کارهای پس‌زمینه)')
+
+def start_tracking():
+    """شروع شمارش کوئری‌ها و زمان برای درخواست یا رویداد جاری"""
+    g.metrics_start = time.perf_counter()
+    g.query_count = 0
+    g.query_time = 0.0
+
+def check_query_budget(route):
+    """گزارش درخواست/رویداد با کوئری بیش از QUERY_BUDGET
+    
+    درخواستی که ساخت یک‌باره اسکیما (create_tables) در آن اجرا شده
+    گزارش نمی‌شود.
+    """
+    if g.query_count > app.config['QUERY_BUDGET'] and not g.get('schema_setup'):
+        query_budget_exceeded.inc(route)
+        app.logger.warning('%s: %d کوئری (سقف %d)', route, g.query_count, app.config['QUERY_BUDGET'])
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def query_started(connection, cursor, statement, parameters, context, executemany):
+    connection.info.setdefault('query_start', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def query_finished(connection, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - connection.info['query_start'].pop()
+    if not app.config['METRICS_ENABLED']:
+        return
+    if has_app_context() and 'query_count' in g:
+        g.query_count += 1
+        g.query_time += elapsed
+    else:
+        background_queries.inc()
+
+@app.before_request
+def start_request_metrics():
+    if app.config['METRICS_ENABLED']:
+        start_tracking()
+
+@app.after_request
+def record_request_metrics(response):
+    """ثبت زمان، وضعیت و کوئری‌های درخواست
+
+    این hook پیش از hook فشرده‌سازی ثبت شده و Flask آن‌ها را به ترتیب
+    معکوس اجرا می‌کند، پس زمان فشرده‌سازی هم جزو زمان پاسخ است. مسیرهای
+    بی‌قاعده (404) یک برچسب مشترک می‌گیرند تا تعداد سری‌ها محدود بماند.
+    """
+    if 'metrics_start' not in g:
+        return response
+    route = request.url_rule.rule if request.url_rule else '<unmatched>'
+    method = request.method
+    http_latency.observe(time.perf_counter() - g.metrics_start, method, route)
+    http_requests.inc(method, route, str(response.status_code))
+    http_queries.observe(g.query_count, method, route)
+    http_query_time.observe(g.query_time, method, route)
+    check_query_budget(route)
+    return response
+
+def socket_event(name):
+    """ثبت handler رویداد سوکت همراه با متریک تعداد، زمان و کوئری‌ها"""
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(*args):
+            if not app.config['METRICS_ENABLED']:
+                return handler(*args)
+            start_tracking()
+            try:
+                return handler(*args)
+            finally:
+                socket_event_latency.observe(time.perf_counter() - g.metrics_start, name)
+                socket_event_queries.observe(g.query_count, name)
+                check_query_budget(f'socket:{name}')
+        return socketio.on(name)(wrapper)
+    return decorator
 
 # مدل کاربر
 class User(db.Model):
@@ -31,6 +222,8 @@ class User(db.Model):
     bio = db.Column(db.Text, default='')
     profile_pic = db.Column(db.String(200), default='default_profile.jpg')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # حساب پرمخاطب: پست‌هایش به جای fan-out هنگام خواندن تایم‌لاین ادغام می‌شوند
+    fanout_on_read = db.Column(db.Boolean, nullable=False, default=False, server_default='0')
     
     posts = db.relationship('Post', backref='author', lazy=True)
     stories = db.relationship('Story', backref='author', lazy=True)
@@ -48,9 +241,20 @@ class Post(db.Model):
     image_url = db.Column(db.String(200), nullable=False)
     caption = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # شمارنده‌های ذخیره‌شده؛ در همان تراکنش لایک/کامنت به‌روز می‌شوند
+    likes_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    comments_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    variants = db.Column(db.Text)  # JSON نقشه نسخه‌های تصویر
+    media_hash = db.Column(db.String(64))  # blob محتوامحور (برای آپلودهای قدیمی خالی)
     
     likes = db.relationship('Like', backref='post', lazy=True, cascade='all, delete-orphan')
     comments = db.relationship('Comment', backref='post', lazy=True, cascade='all, delete-orphan')
+    
+    __table_args__ = (
+        db.Index('ix_post_created', 'created_at', 'id'),
+        db.Index('ix_post_user_created', 'user_id', 'created_at', 'id'),
+        db.Index('ix_post_media_hash', 'media_hash'),
+    )
 
 # مدل استوری
 class Story(db.Model):
@@ -59,6 +263,14 @@ class Story(db.Model):
     media_url = db.Column(db.String(200), nullable=False)
     media_type = db.Column(db.String(10), default='image')  # image or video
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    variants = db.Column(db.Text)  # JSON نقشه نسخه‌های تصویر
+    media_hash = db.Column(db.String(64))  # blob محتوامحور (برای آپلودهای قدیمی خالی)
+    
+    __table_args__ = (
+        db.Index('ix_story_created', 'created_at'),
+        db.Index('ix_story_user_created', 'user_id', 'created_at'),
+        db.Index('ix_story_media_hash', 'media_hash'),
+    )
 
 # مدل لایک
 class Like(db.Model):
@@ -67,7 +279,15 @@ class Like(db.Model):
     post_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    __table_args__ = (db.UniqueConstraint('user_id', 'post_id', name='unique_like'),)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'post_id', name='unique_like'),
+        db.Index('ix_like_post_user', 'post_id', 'user_id'),
+    )
+
+# آخرین segment ژورنال لایک هر پردازه که تغییرهایش commit شده است
+class LikeJournalCheckpoint(db.Model):
+    writer = db.Column(db.String(40), primary_key=True)
+    seq = db.Column(db.Integer, nullable=False)
 
 # مدل کامنت
 class Comment(db.Model):
@@ -76,6 +296,8 @@ class Comment(db.Model):
     post_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=False)
     text = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (db.Index('ix_comment_post_created', 'post_id', 'created_at'),)
 
 # مدل فالو
 class Follow(db.Model):
@@ -84,7 +306,10 @@ class Follow(db.Model):
     followed_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    __table_args__ = (db.UniqueConstraint('follower_id', 'followed_id', name='unique_follow'),)
+    __table_args__ = (
+        db.UniqueConstraint('follower_id', 'followed_id', name='unique_follow'),
+        db.Index('ix_follow_followed', 'followed_id', 'follower_id'),
+    )
 
 # مدل پیام
 class Message(db.Model):
@@ -94,32 +319,1267 @@ class Message(db.Model):
     content = db.Column(db.Text, nullable=False)
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_message_pair_created', 'sender_id', 'receiver_id', 'created_at'),
+        # جفت مرتب (کوچک‌تر، بزرگ‌تر) هر دو جهت گفتگو را در یک بازه ایندکس کنار هم می‌گذارد
+        db.Index('ix_message_ordered_pair',
+                 func.min(sender_id, receiver_id), func.max(sender_id, receiver_id), id),
+    )
+
+# مدل فایل محتوامحور با شمارنده ارجاع
+class MediaBlob(db.Model):
+    digest = db.Column(db.String(64), primary_key=True)  # SHA-256 محتوا
+    path = db.Column(db.String(200), nullable=False)  # مسیر نسبی داخل مخزن
+    size = db.Column(db.Integer, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    variants = db.Column(db.Text)  # JSON نقشه نسخه‌های تصویر
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# مدل تایم‌لاین شخصی (fan-out هنگام نوشتن)
+class TimelineEntry(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=False)
+    author_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)  # زمان ایجاد پست
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'post_id', name='unique_timeline_entry'),
+        db.Index('ix_timeline_user_created', 'user_id', 'created_at', 'post_id'),
+    )
+
+# مدل گفتگو: یک ردیف برای هر (کاربر، طرف مقابل) با آخرین پیام و شمارنده خوانده‌نشده
+class Conversation(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    peer_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    unread_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_message_id = db.Column(db.Integer)
+    last_sender_id = db.Column(db.Integer)
+    last_message = db.Column(db.String(200))  # خلاصه آخرین پیام
+    last_message_at = db.Column(db.DateTime)
+    
+    __table_args__ = (db.Index('ix_conversation_user_recent', 'user_id', 'last_message_at', 'peer_id'),)
+
+# ============ User Cache ============
+# نسخه فقط‌خواندنی پروفایل که در کش نگه داشته می‌شود
+CachedUser = namedtuple('CachedUser', ['id', 'username', 'display_name', 'profile_pic', 'bio'])
+
+user_cache = LRUCache(app.config['USER_CACHE_SIZE'])
+
+def cache_user(user):
+    """ذخیره نسخه فقط‌خواندنی کاربر در کش"""
+    cached = CachedUser(user.id, user.username, user.display_name, user.profile_pic, user.bio)
+    user_cache.set(user.username, cached)
+    return cached
+
+def invalidate_user(username):
+    """حذف کاربر از کش؛ بعد از هر تغییر پروفایل با UPDATE دسته‌ای صدا زده شود"""
+    user_cache.pop(username)
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def invalidate_cached_user(mapper, connection, target):
+    """پاک کردن کش با هر تغییر پروفایل از طریق ORM (شامل نام کاربری قبلی)"""
+    history = db.inspect(target).attrs.username.history
+    for username in (history.deleted or ()):
+        invalidate_user(username)
+    invalidate_user(target.username)
+
+def find_user(username):
+    """دریافت کاربر از کش یا دیتابیس بدون ایجاد؛ None اگر وجود نداشته باشد"""
+    cached = user_cache.get(username)
+    if cached is not None:
+        return cached
+    user = User.query.filter_by(username=username).first()
+    return cache_user(user) if user else None
+
+# ============ Response Cache ============
+response_cache = ResponseCache(app.config['RESPONSE_CACHE_SIZE'], app.config['RESPONSE_CACHE_MAX_AGE'])
+post_stats = PostStats()
+
+def viewer_scope(username):
+    """دامنه وضعیت‌های مخصوص یک بیننده (is_liked)؛ لایک فقط پاسخ‌های همان کاربر را بی‌اعتبار می‌کند"""
+    return ('viewer', username)
+
+def overlay_post_stats(body, post_ids, since):
+    """اعمال شمارنده‌های تازه post_stats روی پاسخ کش‌شده
+    
+    خروجی: (body, seq) جدید یا None اگر از since تغییری نبوده
+    """
+    seq = post_stats.seq()
+    changed = post_stats.changed_since(post_ids, since)
+    if not changed:
+        return None
+    payload = app.json.loads(body)
+    for post in payload['posts']:
+        for field, value in changed.get(post.get('id'), {}).items():
+            if field in post:
+                post[field] = value
+    return app.json.dumps(payload).encode(), seq
+
+def cached_response(*scopes, viewer_arg=None):
+    """کش پاسخ JSON یک مسیر GET بر اساس مسیر، پارامترها و نسخه دامنه‌ها
+    
+    پارامترهای کوئری (از جمله username/viewer) جزو کلیدند، پس پاسخ هر
+    بیننده جدا نگه داشته می‌شود؛ viewer_arg پارامتری است که پاسخ به دامنه
+    viewer_scope آن بیننده هم وابسته باشد. فقط پاسخ‌های موفق کش می‌شوند.
+    شمارنده‌های پست‌های داخل پاسخ از post_stats به‌روز می‌شوند، پس لایک و
+    کامنت پاسخ را بی‌اعتبار نمی‌کنند. ETag از محتوای پاسخ ساخته می‌شود و
+    درخواست شرطی با If-None-Match پاسخ 304 می‌گیرد.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not app.config['RESPONSE_CACHE_MAX_AGE']:
+                return view(*args, **kwargs)
+            
+            key = (request.endpoint, tuple(sorted(kwargs.items())),
+                   tuple(sorted(request.args.items(multi=True))))
+            request_scopes = scopes
+            if viewer_arg and request.args.get(viewer_arg):
+                request_scopes += (viewer_scope(request.args.get(viewer_arg)),)
+            now = time.monotonic()
+            cached = response_cache.get(key, request_scopes, now)
+            if cached is not None:
+                body, etag, meta = cached
+                refreshed = overlay_post_stats(body, *meta) if meta else None
+                if refreshed is not None:
+                    body, seq = refreshed
+                    etag = hashlib.sha1(body).hexdigest()
+                    meta = (meta[0], seq)
+                    response_cache.refresh(key, body, etag, meta)
+                response = Response(body, mimetype='application/json')
+            else:
+                stamp = response_cache.versions(request_scopes)
+                seq = post_stats.seq()
+                response = app.make_response(view(*args, **kwargs))
+                payload = response.get_json(silent=True) or {}
+                if response.status_code != 200 or not payload.get('success'):
+                    return response
+                body = response.get_data()
+                etag = hashlib.sha1(body).hexdigest()
+                meta = None
+                if 'posts' in payload:
+                    meta = ([post['id'] for post in payload['posts'] if 'id' in post], seq)
+                response_cache.set(key, stamp, now, body, etag, meta)
+            
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
+
+# ============ Response Encoding ============
+@app.after_request
+def encode_response(response):
+    """فشرده‌سازی gzip/brotli پاسخ‌های بزرگ بر اساس Accept-Encoding"""
+    return compress_response(response, request, app.config['COMPRESS_MIN_SIZE'],
+                             app.config['COMPRESS_LEVEL'])
+
+def requested_items(items):
+    """اعمال ?fields=a,b روی آیتم‌های لیست پاسخ"""
+    return project(items, parse_fields(request.args.get('fields')))
+
+def user_table(users):
+    """جدول کناری کاربران پاسخ: آیتم‌ها فقط user_id دارند و اطلاعات هر
+    کاربر یک‌بار در این جدول (کلید: شناسه کاربر) می‌آید
+    
+    اگر ?fields= داده شده و user_id جزو آن نباشد جدول خالی است.
+    """
+    fields = parse_fields(request.args.get('fields'))
+    if fields is not None and 'user_id' not in fields:
+        return {}
+    return {
+        user.id: {
+            'username': user.username,
+            'display_name': user.display_name,
+            'profile_pic': user.profile_pic
+        }
+        for user in users
+    }
 
 # ============ Helper Functions ============
 def get_or_create_user(username):
-    """دریافت کاربر یا ایجاد کاربر جدید"""
-    user = User.query.filter_by(username=username).first()
-    if not user:
-        user = User(
-            username=username,
-            display_name=username,
-            bio='کاربر جدید اینستاگرام'
+    """دریافت کاربر یا ایجاد کاربر جدید
+    
+    ایجاد به صورت INSERT OR IGNORE و سپس خواندن دوباره انجام می‌شود تا
+    دو درخواست همزمان برای یک کاربر جدید به محدودیت unique برخورد نکنند.
+    """
+    user = find_user(username)
+    if user:
+        return user
+    
+    db.session.execute(
+        sqlite_insert(User)
+        .values(username=username, display_name=username, bio='کاربر جدید اینستاگرام')
+        .on_conflict_do_nothing(index_elements=['username'])
+    )
+    db.session.commit()
+    return find_user(username)
+
+def get_liked_post_ids(post_ids, viewer_username=None):
+    """شناسه پست‌هایی از این صفحه که کاربر جاری لایک کرده (یک کوئری)
+    
+    لایک‌های بافرشده‌ای که هنوز ذخیره نشده‌اند هم اعمال می‌شوند.
+    """
+    if not post_ids or not viewer_username:
+        return set()
+    
+    viewer = find_user(viewer_username)
+    if not viewer:
+        return set()
+    rows = db.session.execute(
+        db.select(Like.post_id).where(Like.post_id.in_(post_ids), Like.user_id == viewer.id)
+    )
+    return like_buffer.overlay_liked(viewer.id, post_ids, {post_id for post_id, in rows})
+
+def post_entry(post, liked_ids=()):
+    """نمایش یک پست در فید؛ اطلاعات نویسنده جدا در user_table می‌آید"""
+    return {
+        'id': post.id,
+        'user_id': post.user_id,
+        'image_url': post.image_url,
+        'caption': post.caption,
+        'created_at': post.created_at.isoformat(),
+        'likes_count': post.likes_count + like_buffer.pending_delta(post.id),
+        'comments_count': post.comments_count,
+        'is_liked': post.id in liked_ids,
+        'variants': load_variants(post.variants)
+    }
+
+def change_post_counter(post_id, column, delta):
+    """افزایش/کاهش اتمی شمارنده پست در تراکنش جاری و برگرداندن مقدار جدید"""
+    return db.session.execute(
+        db.update(Post)
+        .where(Post.id == post_id)
+        .values({column: column + delta})
+        .returning(column)
+    ).scalar()
+
+def reconcile_post_counters():
+    """محاسبه دوباره شمارنده‌ها به صورت دسته‌ای و اصلاح انحراف‌ها
+    
+    خروجی: تعداد پست‌هایی که شمارنده‌شان اصلاح شد
+    """
+    actual_likes = db.select(func.count(Like.id))\
+        .where(Like.post_id == Post.id).correlate(Post).scalar_subquery()
+    actual_comments = db.select(func.count(Comment.id))\
+        .where(Comment.post_id == Post.id).correlate(Post).scalar_subquery()
+    
+    result = db.session.execute(
+        db.update(Post)
+        .where((Post.likes_count != actual_likes) | (Post.comments_count != actual_comments))
+        .values(likes_count=actual_likes, comments_count=actual_comments)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
+
+def encode_cursor(sort_value, row_id):
+    """ساخت cursor مبهم از کلید (زمان، شناسه) آخرین ردیف صفحه"""
+    raw = f'{sort_value.isoformat()}|{row_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """بازکردن cursor به (زمان، شناسه)؛ برای cursor نامعتبر ValueError"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, row_id = base64.urlsafe_b64decode(padded).decode().split('|')
+        return datetime.fromisoformat(sort_value), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('cursor نامعتبر است')
+
+def get_page_size(default):
+    """اندازه صفحه از پارامتر limit با سقف MAX_PAGE_SIZE"""
+    limit = request.args.get('limit', default, type=int)
+    return max(1, min(limit, app.config['MAX_PAGE_SIZE']))
+
+def paginate_keyset(query, cursor, limit, sort_column, id_column, key=None):
+    """صفحه‌بندی keyset روی (sort_column, id_column) به ترتیب نزولی
+    
+    به جای OFFSET از آخرین کلید صفحه قبل ادامه می‌دهد تا هزینه صفحه‌های
+    عمیق با صفحه اول برابر بماند. key(row) کلید (زمان، شناسه) هر ردیف را
+    برمی‌گرداند؛ پیش‌فرض خواندن همان نام ستون‌ها از ردیف است.
+    خروجی: (rows, next_cursor)
+    """
+    if key is None:
+        key = lambda row: (getattr(row, sort_column.key), getattr(row, id_column.key))
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor)
+        query = query.filter(
+            (sort_column < sort_value) |
+            ((sort_column == sort_value) & (id_column < row_id))
+        )
+    
+    rows = query.order_by(sort_column.desc(), id_column.desc()).limit(limit + 1).all()
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(*key(rows[-1]))
+    return rows, next_cursor
+
+def post_key(post):
+    """کلید صفحه‌بندی پست"""
+    return post.created_at, post.id
+
+def paginate_posts(query, cursor, limit, created_column=Post.created_at, id_column=Post.id):
+    """صفحه‌بندی پست‌ها روی (created_at, id)
+    
+    ستون‌های کلید قابل تعویض‌اند تا مرتب‌سازی از روی ایندکس جدول دیگری
+    (مثل تایم‌لاین) انجام شود؛ مقدارشان باید با زمان و شناسه پست برابر باشد.
+    خروجی: (posts, next_cursor)
+    """
+    return paginate_keyset(query, cursor, limit, created_column, id_column, key=post_key)
+
+# ============ Timeline (Fan-out) ============
+# کاربرانی که از آخرین کوتاه‌سازی ورودی تازه گرفته‌اند؛ timeline_trim_loop بررسی‌شان می‌کند
+timeline_trim_pending = set()
+timeline_trim_lock = threading.Lock()
+
+def push_to_timelines(user_ids, posts):
+    """افزودن پست‌ها به تایم‌لاین چند کاربر
+    
+    کوتاه کردن تایم‌لاین‌ها روی مسیر نوشتن انجام نمی‌شود؛ کاربران فقط برای
+    timeline_trim_loop علامت می‌خورند.
+    """
+    if not user_ids or not posts:
+        return
+    
+    rows = [
+        {'user_id': user_id, 'post_id': post.id, 'author_id': post.user_id, 'created_at': post.created_at}
+        for user_id in user_ids for post in posts
+    ]
+    db.session.execute(sqlite_insert(TimelineEntry).on_conflict_do_nothing(), rows)
+    with timeline_trim_lock:
+        timeline_trim_pending.update(user_ids)
+
+def trim_timelines(user_ids):
+    """نگه داشتن فقط TIMELINE_MAX_ENTRIES ورودی آخر تایم‌لاین‌هایی که از سقف گذشته‌اند
+    
+    کاربران بیش از سقف با شمارش روی ایندکس ix_timeline_user_created پیدا
+    می‌شوند و DELETE با ROW_NUMBER فقط روی همان‌ها اجرا می‌شود.
+    خروجی: تعداد ورودی‌های حذف‌شده
+    """
+    over_limit = db.session.scalars(
+        db.select(TimelineEntry.user_id)
+        .where(TimelineEntry.user_id.in_(user_ids))
+        .group_by(TimelineEntry.user_id)
+        .having(func.count() > app.config['TIMELINE_MAX_ENTRIES'])
+    ).all()
+    if not over_limit:
+        return 0
+    
+    ranked = db.select(
+        TimelineEntry.id,
+        func.row_number().over(
+            partition_by=TimelineEntry.user_id,
+            order_by=(TimelineEntry.created_at.desc(), TimelineEntry.post_id.desc())
+        ).label('position')
+    ).where(TimelineEntry.user_id.in_(over_limit)).subquery()
+    
+    return db.session.execute(
+        db.delete(TimelineEntry)
+        .where(TimelineEntry.id.in_(
+            db.select(ranked.c.id).where(ranked.c.position > app.config['TIMELINE_MAX_ENTRIES'])
+        ))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+def trim_pending_timelines():
+    """کوتاه کردن تایم‌لاین کاربران علامت‌خورده، هر TIMELINE_TRIM_BATCH کاربر در یک تراکنش
+    
+    خروجی: تعداد ورودی‌های حذف‌شده
+    """
+    with timeline_trim_lock:
+        pending = sorted(timeline_trim_pending)
+        timeline_trim_pending.clear()
+    
+    batch_size = app.config['TIMELINE_TRIM_BATCH']
+    trimmed = 0
+    for start in range(0, len(pending), batch_size):
+        try:
+            trimmed += trim_timelines(pending[start:start + batch_size])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            with timeline_trim_lock:
+                timeline_trim_pending.update(pending[start:])
+            raise
+    return trimmed
+
+def timeline_trim_loop():
+    """کار پس‌زمینه: کوتاه کردن تایم‌لاین‌هایی که از آخرین اجرا ورودی گرفته‌اند"""
+    while True:
+        socketio.sleep(app.config['TIMELINE_TRIM_INTERVAL'])
+        with app.app_context():
+            try:
+                trim_pending_timelines()
+            except Exception as e:
+                print(f"❌ خطا در کوتاه کردن تایم‌لاین‌ها: {e}")
+
+def fan_out_post(post):
+    """پخش پست جدید در تایم‌لاین دنبال‌کنندگان (در تراکنش جاری)
+    
+    برای حساب‌هایی که بیش از FANOUT_FOLLOWER_LIMIT دنبال‌کننده دارند
+    fan-out انجام نمی‌شود و پست‌هایشان هنگام خواندن ادغام می‌شوند.
+    """
+    limit = app.config['FANOUT_FOLLOWER_LIMIT']
+    follower_ids = db.session.scalars(
+        db.select(Follow.follower_id).where(Follow.followed_id == post.user_id).limit(limit + 1)
+    ).all()
+    
+    if len(follower_ids) > limit:
+        db.session.execute(
+            db.update(User).where(User.id == post.user_id).values(fanout_on_read=True)
+        )
+        follower_ids = []
+    
+    push_to_timelines(follower_ids + [post.user_id], [post])
+
+def backfill_timeline(follower_id, author):
+    """افزودن پست‌های اخیر حساب فالوشده به تایم‌لاین دنبال‌کننده"""
+    if author.fanout_on_read:
+        return
+    posts = Post.query.filter_by(user_id=author.id)\
+        .order_by(Post.created_at.desc(), Post.id.desc())\
+        .limit(app.config['TIMELINE_BACKFILL']).all()
+    push_to_timelines([follower_id], posts)
+
+def drop_author_from_timeline(follower_id, author_id):
+    """حذف پست‌های حساب آنفالوشده از تایم‌لاین"""
+    db.session.execute(
+        db.delete(TimelineEntry)
+        .where(TimelineEntry.user_id == follower_id, TimelineEntry.author_id == author_id)
+        .execution_options(synchronize_session=False)
+    )
+
+def get_following_feed(username, cursor, limit):
+    """فید شخصی: خواندن بازه‌ای از تایم‌لاین به همراه ادغام حساب‌های پرمخاطب
+    
+    خروجی: (posts, next_cursor)
+    """
+    viewer = find_user(username)
+    if viewer is None:
+        return [], None
+    viewer_id = viewer.id
+    
+    timeline_query = Post.query.options(joinedload(Post.author))\
+        .join(TimelineEntry, TimelineEntry.post_id == Post.id)\
+        .filter(TimelineEntry.user_id == viewer_id)
+    posts, next_cursor = paginate_posts(
+        timeline_query, cursor, limit, TimelineEntry.created_at, TimelineEntry.post_id
+    )
+    
+    # fan-out هنگام خواندن برای حساب‌های پرمخاطبی که کاربر دنبال می‌کند
+    high_fanout_ids = db.session.scalars(
+        db.select(Follow.followed_id)
+        .join(User, User.id == Follow.followed_id)
+        .where(Follow.follower_id == viewer_id, User.fanout_on_read.is_(True))
+    ).all()
+    if not high_fanout_ids:
+        return posts, next_cursor
+    
+    pulled, pulled_cursor = paginate_posts(
+        Post.query.options(joinedload(Post.author)).filter(Post.user_id.in_(high_fanout_ids)),
+        cursor, limit
+    )
+    merged = {post.id: post for post in posts + pulled}
+    ordered = sorted(merged.values(), key=lambda post: (post.created_at, post.id), reverse=True)
+    has_more = bool(next_cursor or pulled_cursor) or len(ordered) > limit
+    ordered = ordered[:limit]
+    return ordered, encode_cursor(*post_key(ordered[-1])) if has_more and ordered else None
+
+# ============ Follow Graph ============
+follow_graph = FollowGraph()
+
+def load_follow_graph():
+    """بارگذاری کامل گراف فالو از دیتابیس (یک کوئری روی دو ستون)"""
+    follow_graph.replace(db.session.execute(db.select(Follow.follower_id, Follow.followed_id)))
+    response_cache.bump('follows')
+
+def follow_graph_loop():
+    """کار پس‌زمینه: همگام‌سازی گراف با فالوهایی که پردازه‌های دیگر ثبت کرده‌اند"""
+    while True:
+        socketio.sleep(app.config['FOLLOW_GRAPH_RELOAD_INTERVAL'])
+        with app.app_context():
+            try:
+                load_follow_graph()
+            except Exception as e:
+                db.session.rollback()
+                print(f"❌ خطا در بارگذاری گراف فالو: {e}")
+
+def users_by_ids(user_ids):
+    """کاربران به ترتیب شناسه‌های ورودی (یک کوئری)"""
+    if not user_ids:
+        return []
+    users = {user.id: user for user in User.query.filter(User.id.in_(user_ids))}
+    return [users[user_id] for user_id in user_ids if user_id in users]
+
+def viewer_follow_flags(viewer, user_ids):
+    """رابطه فالو viewer با چند کاربر از دیتابیس (یک کوئری)
+    
+    گراف درون‌حافظه فقط هر FOLLOW_GRAPH_RELOAD_INTERVAL با پردازه‌های دیگر
+    همگام می‌شود؛ پرچم‌هایی که کاربر بر اساسشان دکمه فالو را می‌زند از
+    دیتابیس خوانده می‌شوند تا با آن تناقض نداشته باشند.
+    خروجی: (شناسه‌هایی که viewer دنبال می‌کند, شناسه‌هایی که viewer را دنبال می‌کنند)
+    """
+    following, followers = set(), set()
+    if not viewer or not user_ids:
+        return following, followers
+    
+    rows = db.session.execute(
+        db.select(Follow.follower_id, Follow.followed_id).where(db.or_(
+            db.and_(Follow.follower_id == viewer.id, Follow.followed_id.in_(user_ids)),
+            db.and_(Follow.followed_id == viewer.id, Follow.follower_id.in_(user_ids))
+        ))
+    )
+    for follower_id, followed_id in rows:
+        if follower_id == viewer.id:
+            following.add(followed_id)
+        else:
+            followers.add(follower_id)
+    return following, followers
+
+def follow_list_entry(user, flags):
+    """یک کاربر در لیست دنبال‌کنندگان/دنبال‌شده‌ها یا پیشنهادها؛ flags خروجی viewer_follow_flags"""
+    following, followers = flags
+    return {
+        'id': user.id,
+        'username': user.username,
+        'display_name': user.display_name,
+        'profile_pic': user.profile_pic,
+        'is_following': user.id in following,
+        'follows_you': user.id in followers
+    }
+
+# ============ Image Variants ============
+image_pipeline = ImagePipeline(app.config['IMAGE_PIPELINE_WORKERS'])
+
+def load_variants(raw):
+    """تبدیل ستون variants به دیکشنری"""
+    return json.loads(raw) if raw else {}
+
+def process_image_variants(blob):
+    """ساخت نسخه‌های تصویر یک blob خارج از thread درخواست
+    
+    پس از پایان، نقشه نسخه‌ها روی blob و همه پست‌ها/استوری‌های ارجاع‌دهنده
+    ذخیره می‌شود و آدرس اصلی‌شان به نسخه full (بدون EXIF) تغییر می‌کند.
+    """
+    digest = blob.digest
+    filepath = media_store.absolute_path(blob.path)
+    url_prefix = media_store.url_for(os.path.dirname(blob.path))
+    
+    def on_done(variants):
+        if not variants:
+            print(f"❌ ساخت نسخه‌های تصویر ناموفق بود: {filepath}")
+            return
+        raw, full_url = json.dumps(variants), variants['full']['jpeg']
+        with app.app_context():
+            db.session.execute(
+                db.update(MediaBlob).where(MediaBlob.digest == digest).values(variants=raw)
+            )
+            db.session.execute(
+                db.update(Post).where(Post.media_hash == digest)
+                .values(variants=raw, image_url=full_url)
+            )
+            db.session.execute(
+                db.update(Story).where(Story.media_hash == digest, Story.media_type == 'image')
+                .values(variants=raw, media_url=full_url)
+            )
+            db.session.commit()
+        story_index.update_media(digest, full_url, variants)
+        response_cache.bump('posts', 'stories')
+    
+    image_pipeline.submit(filepath, os.path.dirname(filepath), digest, url_prefix, on_done)
+
+# ============ Media Storage ============
+media_store = ContentStore(
+    os.path.join(app.config['UPLOAD_FOLDER'], 'blobs'), f"{app.config['MEDIA_URL_PREFIX']}/blobs"
+)
+
+def upload_path_from_url(url):
+    """مسیر فایل روی دیسک برای آدرس‌های /media و /static/uploads؛ None برای آدرس‌های بیرونی"""
+    for prefix in (app.config['MEDIA_URL_PREFIX'] + '/', '/static/uploads/'):
+        if url and url.startswith(prefix):
+            return safe_join(app.config['UPLOAD_FOLDER'], url[len(prefix):])
+    return None
+
+def store_upload(file):
+    """ذخیره فایل آپلودشده در مخزن محتوامحور و افزایش شمارنده ارجاع (در تراکنش جاری)
+    
+    تصویرها پیش از هش شدن بدون EXIF بازنویسی می‌شوند، چون فایل اصلی زیر
+    /media عمومی است. فایل هنگام نوشتن هش می‌شود؛ اگر blob با همین هش وجود
+    داشته باشد فایل جدید دور ریخته می‌شود و فقط شمارنده ارجاع بالا می‌رود.
+    خروجی: (blob, created) که created یعنی فایل جدید روی دیسک نوشته شد
+    """
+    extension = file.filename.rsplit('.', 1)[1].lower()
+    stream = strip_metadata(file.stream) if can_process(file.filename) else file.stream
+    pending = media_store.ingest(stream)
+    try:
+        db.session.execute(
+            sqlite_insert(MediaBlob)
+            .values(
+                digest=pending.digest,
+                path=media_store.relative_path(pending.digest, extension),
+                size=pending.size,
+                ref_count=1
+            )
+            .on_conflict_do_update(
+                index_elements=['digest'], set_={'ref_count': MediaBlob.ref_count + 1}
+            )
         )
-        db.session.add(user)
+        blob = db.session.get(MediaBlob, pending.digest, populate_existing=True)
+    except Exception:
+        media_store.discard(pending)
+        raise
+    return blob, media_store.commit(pending, blob.path)
+
+def media_url(blob):
+    """آدرس قابل نمایش blob: نسخه full اگر ساخته شده، وگرنه فایل اصلی"""
+    variants = load_variants(blob.variants)
+    return variants['full']['jpeg'] if variants else media_store.url_for(blob.path)
+
+def release_media(digest):
+    """کاهش شمارنده ارجاع blob در تراکنش جاری
+    
+    اگر ارجاعی باقی نماند رکورد blob حذف می‌شود. خروجی (digest, paths) است
+    که پس از commit باید به delete_media_files داده شود.
+    """
+    if not digest:
+        return None
+    row = db.session.execute(
+        db.update(MediaBlob)
+        .where(MediaBlob.digest == digest)
+        .values(ref_count=MediaBlob.ref_count - 1)
+        .returning(MediaBlob.ref_count, MediaBlob.path, MediaBlob.variants)
+    ).first()
+    if row is None or row.ref_count > 0:
+        return None
+    
+    db.session.execute(
+        db.delete(MediaBlob).where(MediaBlob.digest == digest, MediaBlob.ref_count <= 0)
+    )
+    paths = [row.path]
+    for variant in load_variants(row.variants).values():
+        paths += [media_store.path_from_url(variant[fmt]) for fmt in ('webp', 'jpeg')]
+    return digest, [path for path in paths if path]
+
+def delete_media_files(released):
+    """حذف فایل‌های blob های آزادشده پس از commit
+    
+    اگر در این فاصله همان محتوا دوباره آپلود شده باشد فایل‌ها نگه داشته می‌شوند.
+    """
+    for digest, paths in filter(None, released):
+        if db.session.get(MediaBlob, digest) is not None:
+            continue
+        for path in paths:
+            media_store.delete(path)
+
+def dedupe_legacy_uploads():
+    """انتقال آپلودهای قدیمی (نام uuid) به مخزن محتوامحور و حذف نسخه‌های تکراری
+    
+    خروجی: (تعداد رکوردهای منتقل‌شده، بایت‌های آزادشده)
+    """
+    migrated, reclaimed = 0, 0
+    moved = {}  # مسیر قدیمی -> blob
+    legacy_files = []
+    
+    for model, url_attr in ((Post, 'image_url'), (Story, 'media_url')):
+        for record in model.query.filter(model.media_hash.is_(None)).all():
+            old_url = getattr(record, url_attr)
+            old_path = upload_path_from_url(old_url)
+            if not old_path or not os.path.isfile(old_path):
+                continue
+            
+            blob = moved.get(old_path)
+            if blob is None:
+                extension = old_path.rsplit('.', 1)[-1].lower()
+                with open(old_path, 'rb') as stream:
+                    pending = media_store.ingest(
+                        strip_metadata(stream) if can_process(old_path) else stream
+                    )
+                blob = db.session.get(MediaBlob, pending.digest)
+                if blob is None:
+                    blob = MediaBlob(
+                        digest=pending.digest,
+                        path=media_store.relative_path(pending.digest, extension),
+                        size=pending.size,
+                        ref_count=0
+                    )
+                    db.session.add(blob)
+                    media_store.commit(pending, blob.path)
+                else:
+                    media_store.discard(pending)
+                    reclaimed += pending.size
+                moved[old_path] = blob
+                legacy_files.append(old_path)
+            
+            variants = load_variants(record.variants)
+            if variants:
+                new_url = media_store.url_for(blob.path)
+                for variant in variants.values():
+                    for fmt, url in variant.items():
+                        if url == old_url:
+                            variant[fmt] = new_url
+                record.variants = json.dumps(variants)
+            else:
+                # رکوردهای بدون نسخه از نسخه‌های ساخته‌شده همان blob استفاده می‌کنند
+                new_url = media_url(blob)
+                record.variants = blob.variants
+            
+            setattr(record, url_attr, new_url)
+            record.media_hash = blob.digest
+            blob.ref_count += 1
+            migrated += 1
+    
+    db.session.commit()
+    
+    for old_path in legacy_files:
+        os.remove(old_path)
+    return migrated, reclaimed
+
+# ============ Stories ============
+story_index = ActiveStoryIndex()
+
+def story_cutoff():
+    """زمانی که استوری‌های قدیمی‌تر از آن منقضی شده‌اند"""
+    return datetime.utcnow() - timedelta(seconds=app.config['STORY_TTL'])
+
+def story_entry(story, user):
+    """تبدیل استوری و نویسنده به ورودی ایندکس استوری‌های فعال"""
+    return (
+        {
+            'id': user.id,
+            'username': user.username,
+            'display_name': user.display_name,
+            'profile_pic': user.profile_pic
+        },
+        {
+            'id': story.id,
+            'media_url': story.media_url,
+            'media_type': story.media_type,
+            'created_at': story.created_at,
+            'variants': load_variants(story.variants),
+            'media_hash': story.media_hash
+        }
+    )
+
+def load_story_index():
+    """بارگذاری دوباره استوری‌های فعال از دیتابیس (یک کوئری)"""
+    stories = Story.query.options(joinedload(Story.author))\
+        .filter(Story.created_at > story_cutoff()).all()
+    story_index.replace(story_entry(story, story.author) for story in stories)
+    response_cache.bump('stories')
+
+def reap_expired_stories():
+    """حذف دسته‌ای استوری‌های منقضی و فایل‌هایشان
+    
+    هر دسته در تراکنش جداگانه حذف می‌شود تا قفل نوشتن SQLite کوتاه بماند.
+    فایل‌های محتوامحور با شمارنده ارجاع آزاد می‌شوند و فایل‌های قدیمی
+    (بدون media_hash) مستقیماً حذف می‌شوند. خروجی: تعداد استوری‌های حذف‌شده
+    """
+    cutoff = story_cutoff()
+    batch = app.config['STORY_REAPER_BATCH']
+    total = 0
+    
+    while True:
+        ids = db.session.scalars(
+            db.select(Story.id).where(Story.created_at <= cutoff)
+            .order_by(Story.created_at).limit(batch)
+        ).all()
+        if not ids:
+            break
+        
+        rows = db.session.execute(
+            db.delete(Story).where(Story.id.in_(ids))
+            .returning(Story.id, Story.media_hash, Story.media_url, Story.variants)
+            .execution_options(synchronize_session=False)
+        ).all()
+        released = [release_media(row.media_hash) for row in rows if row.media_hash]
         db.session.commit()
-    return user
+        
+        delete_media_files(released)
+        for row in rows:
+            if not row.media_hash:
+                urls = [row.media_url] + [
+                    variant[fmt] for variant in load_variants(row.variants).values() for fmt in ('webp', 'jpeg')
+                ]
+                for path in filter(None, map(upload_path_from_url, urls)):
+                    if os.path.isfile(path):
+                        os.remove(path)
+        
+        story_index.remove(row.id for row in rows)
+        response_cache.bump('stories')
+        total += len(rows)
+        if len(ids) < batch:
+            break
+    
+    return total
+
+def story_reaper_loop():
+    """کار پس‌زمینه: حذف استوری‌های منقضی و همگام‌سازی ایندکس با دیتابیس
+    
+    بارگذاری دوباره ایندکس استوری‌هایی را که پردازه‌های دیگر ساخته‌اند هم
+    در همین بازه وارد ایندکس این پردازه می‌کند.
+    """
+    while True:
+        socketio.sleep(app.config['STORY_REAPER_INTERVAL'])
+        with app.app_context():
+            try:
+                reaped = reap_expired_stories()
+                load_story_index()
+                if reaped:
+                    print(f"🧹 {reaped} استوری منقضی حذف شد")
+            except Exception as e:
+                db.session.rollback()
+                print(f"❌ خطا در حذف استوری‌های منقضی: {e}")
 
 def allowed_file(filename):
     """بررسی مجاز بودن فایل"""
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'mp4', 'mov', 'avi'}
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+# ============ Chat Persistence ============
+def chat_room(user1, user2):
+    """نام room گفتگوی دو نفره؛ همان قاعده getChatRoom در کلاینت"""
+    return '_'.join(sorted([user1, user2]))
+
+def chat_peer_from_room(room, sender):
+    """طرف مقابل گفتگو از روی نام room (برای کلاینت‌هایی که receiver نمی‌فرستند)"""
+    if room and room.startswith(sender + '_'):
+        return room[len(sender) + 1:]
+    if room and room.endswith('_' + sender):
+        return room[:-len(sender) - 1]
+    return None
+
+def update_conversations(rows, message_ids):
+    """به‌روزرسانی ردیف‌های گفتگو برای یک دسته پیام (در همان تراکنش)
+    
+    برای هر دو طرف، آخرین پیام دسته در ردیف گفتگو نوشته می‌شود و برای
+    گیرنده شمارنده خوانده‌نشده زیاد می‌شود.
+    خروجی: {receiver_id: (مجموع خوانده‌نشده، {sender_id: خوانده‌نشده})}
+    """
+    snippet_length = app.config['CHAT_SNIPPET_LENGTH']
+    conversations = {}
+    for row, message_id in zip(rows, message_ids):
+        last = {
+            'last_message_id': message_id,
+            'last_sender_id': row['sender_id'],
+            'last_message': row['content'][:snippet_length],
+            'last_message_at': row['created_at']
+        }
+        received = conversations.setdefault((row['receiver_id'], row['sender_id']), {'unread_count': 0})
+        received['unread_count'] += 1
+        received.update(last)
+        conversations.setdefault((row['sender_id'], row['receiver_id']), {'unread_count': 0}).update(last)
+    
+    statement = sqlite_insert(Conversation)
+    db.session.execute(
+        statement.on_conflict_do_update(
+            index_elements=['user_id', 'peer_id'],
+            set_={
+                'unread_count': Conversation.unread_count + statement.excluded.unread_count,
+                'last_message_id': statement.excluded.last_message_id,
+                'last_sender_id': statement.excluded.last_sender_id,
+                'last_message': statement.excluded.last_message,
+                'last_message_at': statement.excluded.last_message_at
+            }
+        ),
+        [dict(values, user_id=user_id, peer_id=peer_id)
+         for (user_id, peer_id), values in conversations.items()]
+    )
+    
+    receiver_ids = {row['receiver_id'] for row in rows}
+    counts = {user_id: (0, {}) for user_id in receiver_ids}
+    for user_id, peer_id, count in db.session.query(
+        Conversation.user_id, Conversation.peer_id, Conversation.unread_count
+    ).filter(Conversation.user_id.in_(receiver_ids), Conversation.unread_count > 0):
+        total, by_peer = counts[user_id]
+        by_peer[peer_id] = count
+        counts[user_id] = (total + count, by_peer)
+    return counts
+
+def get_unread_counts(user_id):
+    """شمارنده‌های خوانده‌نشده کاربر: (مجموع، {نام کاربری طرف مقابل: تعداد})"""
+    rows = db.session.query(User.username, Conversation.unread_count).join(
+        User, User.id == Conversation.peer_id
+    ).filter(
+        Conversation.user_id == user_id,
+        Conversation.unread_count > 0
+    ).all()
+    return sum(count for _, count in rows), dict(rows)
+
+def mark_conversation_read(reader, peer, up_to_id=None):
+    """علامت‌گذاری پیام‌های دریافتی از peer به عنوان خوانده‌شده با یک UPDATE
+    
+    با up_to_id فقط پیام‌های تا آن شناسه خوانده می‌شوند.
+    خروجی: (تعداد پیام‌های علامت‌خورده، بزرگ‌ترین شناسه علامت‌خورده)
+    """
+    conditions = [
+        Message.sender_id == peer.id,
+        Message.receiver_id == reader.id,
+        Message.is_read.is_(False)
+    ]
+    if up_to_id is not None:
+        conditions.append(Message.id <= up_to_id)
+    marked = db.session.execute(
+        db.update(Message).where(*conditions).values(is_read=True).returning(Message.id)
+    ).scalars().all()
+    if marked:
+        db.session.execute(
+            db.update(Conversation).where(
+                Conversation.user_id == reader.id,
+                Conversation.peer_id == peer.id
+            ).values(unread_count=func.max(Conversation.unread_count - len(marked), 0))
+        )
+    db.session.commit()
+    return len(marked), max(marked, default=None)
+
+def push_read_state(reader, peer, marked, last_read_id):
+    """ارسال شمارنده جدید به سوکت‌های خواننده و رسید خواندن به فرستنده"""
+    total, by_peer = get_unread_counts(reader.id)
+    socketio.emit('unread_update', {
+        'peer': peer.username,
+        'unread_count': by_peer.get(peer.username, 0),
+        'total_unread': total
+    }, to=user_room(reader.username))
+    if marked:
+        socketio.emit('messages_read', {
+            'reader': reader.username,
+            'peer': peer.username,
+            'up_to_id': last_read_id
+        }, to=user_room(peer.username))
+
+def user_room(username):
+    """room شخصی هر کاربر برای اعلان‌ها (همه تب‌ها و دستگاه‌های او)"""
+    return f'user:{username}'
+
+def flush_chat_messages(rows):
+    """ذخیره یک دسته پیام با یک INSERT چندردیفه و یک commit
+    
+    خروجی: به ترتیب ورودی، شناسه هر پیام و شمارنده‌های خوانده‌نشده گیرنده
+    پس از این دسته
+    """
+    with app.app_context():
+        try:
+            ids = db.session.execute(
+                insert(Message).returning(Message.id, sort_by_parameter_order=True),
+                rows
+            ).scalars().all()
+            unread = update_conversations(rows, ids)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+    return [
+        {
+            'id': message_id,
+            'unread_count': unread[row['receiver_id']][1].get(row['sender_id'], 0),
+            'total_unread': unread[row['receiver_id']][0]
+        }
+        for message_id, row in zip(ids, rows)
+    ]
+
+chat_writer = GroupCommitWriter(
+    socketio, flush_chat_messages,
+    max_batch=app.config['CHAT_FLUSH_BATCH'],
+    max_delay=app.config['CHAT_FLUSH_INTERVAL']
+)
+atexit.register(chat_writer.drain)  # پیام‌های مانده در صف هنگام خروج
+
+def queue_chat_message(sender, receiver, content, on_durable):
+    """قرار دادن پیام در صف نوشتن گروهی
+    
+    on_durable(message, error) پس از commit دسته صدا زده می‌شود؛ message
+    دیکشنری پیام ذخیره‌شده با شناسه است. پس از ذخیره، پیام به room گفتگو و
+    room شخصی هر دو طرف فرستاده می‌شود و شمارنده خوانده‌نشده گیرنده با
+    unread_update به‌روز می‌شود.
+    """
+    sender_obj = get_or_create_user(sender)
+    receiver_obj = get_or_create_user(receiver)
+    created_at = datetime.utcnow()
+    
+    def done(saved, error):
+        if error is not None:
+            on_durable(None, error)
+            return
+        message_id = saved['id']
+        message = {
+            'id': message_id,
+            'sender': sender_obj.username,
+            'receiver': receiver_obj.username,
+            'content': content,
+            'created_at': created_at.isoformat()
+        }
+        socketio.emit('new_message', {
+            'id': message_id,
+            'sender': sender_obj.username,
+            'receiver': receiver_obj.username,
+            'message': content,
+            'timestamp': message['created_at']
+        }, to=[chat_room(sender_obj.username, receiver_obj.username),
+               user_room(sender_obj.username), user_room(receiver_obj.username)])
+        socketio.emit('unread_update', {
+            'peer': sender_obj.username,
+            'unread_count': saved['unread_count'],
+            'total_unread': saved['total_unread']
+        }, to=user_room(receiver_obj.username))
+        on_durable(message, None)
+    
+    chat_writer.submit({
+        'sender_id': sender_obj.id,
+        'receiver_id': receiver_obj.id,
+        'content': content,
+        'is_read': False,
+        'created_at': created_at
+    }, done)
+
+typing_coalescer = TypingCoalescer(
+    window=app.config['TYPING_WINDOW'],
+    idle_timeout=app.config['TYPING_IDLE_TIMEOUT']
+)
+
+def emit_typing_events(events):
+    for room, username, is_typing, sid in events:
+        socketio.emit('user_typing', {
+            'username': username,
+            'is_typing': is_typing
+        }, to=room, skip_sid=sid)
+
+def typing_sweeper_loop():
+    """کار پس‌زمینه: ارسال تغییرهای معوق تایپ و پایان تایپ‌های منقضی"""
+    while True:
+        socketio.sleep(app.config['TYPING_WINDOW'])
+        try:
+            emit_typing_events(typing_coalescer.sweep())
+        except Exception as e:
+            print(f"❌ خطا در ارسال وضعیت تایپ: {e}")
+
+# ============ Like Buffer ============
+def like_unchanged_since(user_id, post_id, durable, changed_at):
+    """آیا وضعیت لایک در دیتابیس هنوز همان durable است و پس از changed_at لایک تازه‌ای ثبت نشده؟
+    
+    برای بازپخش ژورنال: اگر پردازه دیگری بعد از crash این کلید را تغییر
+    داده باشد، تغییر قدیمی ژورنال روی آن نوشته نمی‌شود.
+    """
+    created_at = db.session.scalar(
+        db.select(Like.created_at).where(Like.user_id == user_id, Like.post_id == post_id)
+    )
+    if (created_at is not None) != durable:
+        return False
+    changed_at = datetime.fromtimestamp(changed_at, timezone.utc).replace(tzinfo=None)
+    return created_at is None or created_at <= changed_at
+
+def write_like_changes(changes, checkpoints=None):
+    """ذخیره تغییرهای خالص لایک و checkpoint ژورنال در یک تراکنش
+    
+    INSERT OR IGNORE و DELETE با محدودیت unique_like بی‌خطر و تکرارپذیرند؛
+    شمارنده هر پست فقط به اندازه ردیف‌هایی که واقعاً اضافه یا حذف شدند
+    تغییر می‌کند، پس لایک همزمان پردازه دیگر شمارنده را خراب نمی‌کند.
+    تغییرهای بازپخش‌شده از ژورنال (since دارند) فقط اگر like_unchanged_since
+    باشد اعمال می‌شوند.
+    
+    خروجی: {post_id: likes_count تازه}
+    """
+    now = datetime.utcnow()
+    deltas = {}
+    try:
+        for user_id, post_id, durable, liked, since in changes:
+            if since is not None and not like_unchanged_since(user_id, post_id, durable, since):
+                continue
+            if liked:
+                result = db.session.execute(
+                    sqlite_insert(Like)
+                    .values(user_id=user_id, post_id=post_id, created_at=now)
+                    .on_conflict_do_nothing(index_elements=['user_id', 'post_id'])
+                )
+            else:
+                result = db.session.execute(
+                    db.delete(Like).where(Like.user_id == user_id, Like.post_id == post_id)
+                )
+            deltas[post_id] = deltas.get(post_id, 0) + (result.rowcount if liked else -result.rowcount)
+        counts = {
+            post_id: change_post_counter(post_id, Post.likes_count, delta)
+            for post_id, delta in deltas.items()
+        }
+        for writer, seq in (checkpoints or {}).items():
+            db.session.execute(
+                sqlite_insert(LikeJournalCheckpoint)
+                .values(writer=writer, seq=seq)
+                .on_conflict_do_update(index_elements=['writer'], set_={'seq': seq})
+            )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return counts
+
+like_buffer = LikeBuffer(LikeJournal(app.config['LIKE_JOURNAL_DIR']) if app.config['LIKE_JOURNAL_DIR'] else None)
+
+def load_like_state(user_id, post_id):
+    """likes_count پست و لایک بودن آن توسط کاربر با یک کوئری؛ None اگر پست نباشد"""
+    liked = db.select(Like.id).where(Like.user_id == user_id, Like.post_id == post_id).exists()
+    row = db.session.execute(db.select(Post.likes_count, liked).where(Post.id == post_id)).first()
+    return (row[0], bool(row[1])) if row else None
+
+def toggle_like_now(user_id, post_id):
+    """لایک/آنلایک بدون بافر (LIKE_BUFFER=0)؛ تصمیم از روی دیتابیس
+    
+    خروجی: (is_liked, likes_count) یا None اگر پست وجود نداشته باشد
+    """
+    try:
+        removed = db.session.execute(
+            db.delete(Like).where(Like.user_id == user_id, Like.post_id == post_id)
+        ).rowcount
+        added = 0
+        if not removed:
+            added = db.session.execute(
+                sqlite_insert(Like)
+                .values(user_id=user_id, post_id=post_id, created_at=datetime.utcnow())
+                .on_conflict_do_nothing(index_elements=['user_id', 'post_id'])
+            ).rowcount
+        likes_count = change_post_counter(post_id, Post.likes_count, added - removed)
+        if likes_count is None:
+            db.session.rollback()
+            return None
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return not removed, likes_count
+
+def flush_like_buffer():
+    """ذخیره همزمان تغییرهای بافر لایک؛ خروجی: تعداد کلیدهای ذخیره‌شده"""
+    with app.app_context():
+        return like_buffer.flush(write_like_changes)
+
+atexit.register(flush_like_buffer)  # لایک‌های ذخیره‌نشده هنگام خروج
+
+def recover_like_journal():
+    """بازپخش ژورنال لایک پردازه‌هایی که پیش از ذخیره تغییرها متوقف شده‌اند
+    
+    checkpoint writer هایی که دیگر segment ندارند هم پاک می‌شود.
+    """
+    if like_buffer.journal is None:
+        return
+    checkpoints = dict(db.session.execute(
+        db.select(LikeJournalCheckpoint.writer, LikeJournalCheckpoint.seq)
+    ).all())
+    recovered = like_buffer.recover(write_like_changes, checkpoints)
+    active = like_buffer.journal.writers() | {like_buffer.journal.writer}
+    db.session.execute(db.delete(LikeJournalCheckpoint).where(LikeJournalCheckpoint.writer.notin_(active)))
+    db.session.commit()
+    if recovered:
+        response_cache.bump('posts')
+        print(f"♻️ {recovered} تغییر لایک از ژورنال بازیابی شد")
+
+def like_flush_loop():
+    """کار پس‌زمینه: ذخیره تغییرهای خالص بافر لایک هر LIKE_FLUSH_INTERVAL"""
+    while True:
+        socketio.sleep(app.config['LIKE_FLUSH_INTERVAL'])
+        try:
+            flush_like_buffer()
+        except Exception as e:
+            print(f"❌ خطا در ذخیره لایک‌ها: {e}")
+
+# ============ Live Feed ============
+FEED_ROOM = 'feed'
+engagement_coalescer = EngagementCoalescer(window=app.config['ENGAGEMENT_WINDOW'])
+
+def post_room(post_id):
+    """room پستی که روی صفحه کلاینت است (برای رویداد post_stats)"""
+    return f'post:{post_id}'
+
+def publish_post_created(post, author):
+    """ارسال پست تازه به کلاینت‌های room فید با همان قالب /api/posts"""
+    socketio.emit('post_created', {
+        'post': post_entry(post),
+        'users': {author.id: {
+            'username': author.username,
+            'display_name': author.display_name,
+            'profile_pic': author.profile_pic
+        }}
+    }, to=FEED_ROOM)
+
+def publish_post_stats(post_id, **counts):
+    """ارسال شمارنده تازه پست به room آن؛ تغییرهای پشت‌سرهم داخل
+    ENGAGEMENT_WINDOW ادغام و در engagement_sweeper_loop ارسال می‌شوند"""
+    if engagement_coalescer.touch(post_id):
+        socketio.emit('post_stats', dict(counts, post_id=post_id), to=post_room(post_id))
+
+def emit_pending_post_stats(post_ids):
+    """ارسال شمارنده‌های فعلی پست‌های ادغام‌شده با یک کوئری"""
+    if not post_ids:
+        return
+    rows = db.session.execute(
+        db.select(Post.id, Post.likes_count, Post.comments_count).where(Post.id.in_(post_ids))
+    )
+    for post_id, likes_count, comments_count in rows:
+        socketio.emit('post_stats', {
+            'post_id': post_id,
+            'likes_count': likes_count + like_buffer.pending_delta(post_id),
+            'comments_count': comments_count
+        }, to=post_room(post_id))
+
+def engagement_sweeper_loop():
+    """کار پس‌زمینه: ارسال آخرین شمارنده پست‌هایی که داخل window تغییر کرده‌اند"""
+    while True:
+        socketio.sleep(app.config['ENGAGEMENT_WINDOW'])
+        post_ids = engagement_coalescer.sweep()
+        if not post_ids:
+            continue
+        with app.app_context():
+            try:
+                emit_pending_post_stats(post_ids)
+            except Exception as e:
+                db.session.rollback()
+                print(f"❌ خطا در ارسال شمارنده پست‌ها: {e}")
+
 # ============ Routes ============
 @app.route('/')
 def home():
     """صفحه اصلی"""
     return render_template('index.html')
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """متریک‌های این پردازه در قالب متنی Prometheus"""
+    if not app.config['METRICS_ENABLED']:
+        abort(404)
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/media/<path:filename>')
+def serve_media(filename):
+    """سرو فایل‌های آپلودشده با ETag قوی، کش immutable و پشتیبانی Range
+    
+    نام فایل‌ها (هش محتوا یا uuid) هرگز دوباره استفاده نمی‌شوند، پس نام
+    فایل خودش ETag قوی است و مرورگر می‌تواند برای همیشه کش کند.
+    """
+    upload_root = os.path.abspath(app.config['UPLOAD_FOLDER'])
+    path = safe_join(upload_root, filename)
+    if not path or filename.startswith('blobs/tmp/') or not os.path.isfile(path):
+        abort(404)
+    
+    etag = os.path.splitext(os.path.basename(filename))[0]
+    accel_prefix = app.config['MEDIA_ACCEL_REDIRECT']
+    if accel_prefix:
+        # nginx خودش بدنه و Range را سرو می‌کند؛ پایتون فقط هدرها را می‌سازد
+        response = app.response_class(mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{filename}"
+        response.set_etag(etag)
+        response.make_conditional(request)
+    else:
+        response = send_from_directory(
+            upload_root, filename, etag=etag, max_age=app.config['MEDIA_MAX_AGE'], conditional=True
+        )
+    
+    response.cache_control.public = True
+    response.cache_control.max_age = app.config['MEDIA_MAX_AGE']
+    response.cache_control.immutable = True
+    return response
+
 # ============ API Routes ============
 @app.route('/api/init', methods=['POST'])
 def init_app():
@@ -141,27 +1601,34 @@ def init_app():
     })
 
 @app.route('/api/posts', methods=['GET'])
+@cached_response('posts', 'follows', viewer_arg='username')
 def get_posts():
     """دریافت پست‌ها"""
-    posts = Post.query.order_by(Post.created_at.desc()).limit(20).all()
+    viewer = request.args.get('username')
+    cursor = request.args.get('cursor')
+    limit = get_page_size(app.config['FEED_PAGE_SIZE'])
+    try:
+        if request.args.get('feed') == 'following':
+            if not viewer:
+                return jsonify({'success': False, 'error': 'نام کاربری الزامی است'})
+            posts, next_cursor = get_following_feed(viewer, cursor, limit)
+        else:
+            posts, next_cursor = paginate_posts(
+                Post.query.options(joinedload(Post.author)), cursor, limit
+            )
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)})
     
-    posts_data = []
-    for post in posts:
-        post_data = {
-            'id': post.id,
-            'username': post.author.username,
-            'display_name': post.author.display_name,
-            'profile_pic': post.author.profile_pic,
-            'image_url': post.image_url,
-            'caption': post.caption,
-            'created_at': post.created_at.isoformat(),
-            'likes_count': Like.query.filter_by(post_id=post.id).count(),
-            'comments_count': Comment.query.filter_by(post_id=post.id).count(),
-            'is_liked': False  # بعداً بر اساس کاربر جاری تنظیم می‌شود
-        }
-        posts_data.append(post_data)
+    liked_ids = get_liked_post_ids([post.id for post in posts], viewer)
+    
+    posts_data = [post_entry(post, liked_ids) for post in posts]
     
-    return jsonify({'success': True, 'posts': posts_data})
+    return jsonify({
+        'success': True,
+        'posts': requested_items(posts_data),
+        'users': user_table({post.author for post in posts}),
+        'next_cursor': next_cursor
+    })
 
 @app.route('/api/posts/create', methods=['POST'])
 def create_post():
@@ -181,19 +1648,25 @@ def create_post():
             user = get_or_create_user(username)
             
             # ذخیره فایل
-            filename = secure_filename(file.filename)
-            unique_filename = f"{uuid.uuid4().hex}_{filename}"
-            filepath = os.path.join('static/uploads/posts', unique_filename)
-            file.save(filepath)
+            blob, created = store_upload(file)
             
             # ایجاد پست
             post = Post(
                 user_id=user.id,
-                image_url=f'/static/uploads/posts/{unique_filename}',
-                caption=caption
+                image_url=media_url(blob),
+                caption=caption,
+                media_hash=blob.digest,
+                variants=blob.variants
             )
             db.session.add(post)
+            db.session.flush()
+            fan_out_post(post)
             db.session.commit()
+            response_cache.bump('posts')
+            publish_post_created(post, user)
+            
+            if created and can_process(file.filename):
+                process_image_variants(blob)
             
             return jsonify({
                 'success': True,
@@ -211,31 +1684,28 @@ def create_post():
 
 @app.route('/api/posts/<int:post_id>/like', methods=['POST'])
 def toggle_like(post_id):
-    """لایک/آنلایک پست"""
+    """لایک/آنلایک پست
+    
+    وضعیت در بافر لایک تغییر می‌کند و پاسخ فوراً از همان ساخته می‌شود؛
+    like_flush_loop تغییرهای خالص را در تراکنش‌های دسته‌ای ذخیره می‌کند.
+    با LIKE_BUFFER=0 (چند پردازه کارگر) هر کلیک همان لحظه ذخیره می‌شود.
+    """
     try:
         username = request.json.get('username')
         if not username:
             return jsonify({'success': False, 'error': 'نام کاربری الزامی است'})
         
         user = get_or_create_user(username)
-        post = Post.query.get_or_404(post_id)
-        
-        # بررسی لایک قبلی
-        existing_like = Like.query.filter_by(user_id=user.id, post_id=post_id).first()
-        
-        if existing_like:
-            # آنلایک
-            db.session.delete(existing_like)
-            is_liked = False
+        if app.config['LIKE_BUFFER']:
+            result = like_buffer.toggle(user.id, post_id, lambda: load_like_state(user.id, post_id))
         else:
-            # لایک
-            like = Like(user_id=user.id, post_id=post_id)
-            db.session.add(like)
-            is_liked = True
-        
-        db.session.commit()
-        
-        likes_count = Like.query.filter_by(post_id=post_id).count()
+            result = toggle_like_now(user.id, post_id)
+        if result is None:
+            abort(404)
+        is_liked, likes_count = result
+        post_stats.update(post_id, likes_count=likes_count)
+        response_cache.bump(viewer_scope(user.username))
+        publish_post_stats(post_id, likes_count=likes_count)
         
         return jsonify({
             'success': True,
@@ -249,20 +1719,23 @@ def toggle_like(post_id):
 @app.route('/api/posts/<int:post_id>/comments', methods=['GET'])
 def get_comments(post_id):
     """دریافت کامنت‌های پست"""
-    comments = Comment.query.filter_by(post_id=post_id).order_by(Comment.created_at.desc()).all()
+    comments = Comment.query.options(joinedload(Comment.author))\
+        .filter_by(post_id=post_id).order_by(Comment.created_at.desc()).all()
     
     comments_data = []
     for comment in comments:
         comments_data.append({
             'id': comment.id,
-            'username': comment.author.username,
-            'display_name': comment.author.display_name,
-            'profile_pic': comment.author.profile_pic,
+            'user_id': comment.user_id,
             'text': comment.text,
             'created_at': comment.created_at.isoformat()
         })
     
-    return jsonify({'success': True, 'comments': comments_data})
+    return jsonify({
+        'success': True,
+        'comments': requested_items(comments_data),
+        'users': user_table({comment.author for comment in comments})
+    })
 
 @app.route('/api/posts/<int:post_id>/comments', methods=['POST'])
 def add_comment(post_id):
@@ -283,7 +1756,11 @@ def add_comment(post_id):
             text=text
         )
         db.session.add(comment)
+        db.session.flush()
+        comments_count = change_post_counter(post.id, Post.comments_count, 1)
         db.session.commit()
+        post_stats.update(post_id, comments_count=comments_count)
+        publish_post_stats(post_id, comments_count=comments_count)
         
         return jsonify({
             'success': True,
@@ -294,43 +1771,21 @@ def add_comment(post_id):
                 'profile_pic': user.profile_pic,
                 'text': comment.text,
                 'created_at': comment.created_at.isoformat()
-            }
+            },
+            'comments_count': comments_count
         })
     
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
 @app.route('/api/stories', methods=['GET'])
+@cached_response('stories')
 def get_stories():
-    """دریافت استوری‌ها"""
-    # استوری‌های 24 ساعت اخیر
-    time_threshold = datetime.utcnow().timestamp() - 24 * 3600
-    
-    stories = Story.query.filter(Story.created_at > datetime.fromtimestamp(time_threshold))\
-        .order_by(Story.created_at.desc()).all()
-    
-    # گروه‌بندی بر اساس کاربر
-    stories_by_user = {}
-    for story in stories:
-        if story.user_id not in stories_by_user:
-            stories_by_user[story.user_id] = {
-                'user': {
-                    'id': story.author.id,
-                    'username': story.author.username,
-                    'display_name': story.author.display_name,
-                    'profile_pic': story.author.profile_pic
-                },
-                'stories': []
-            }
-        
-        stories_by_user[story.user_id]['stories'].append({
-            'id': story.id,
-            'media_url': story.media_url,
-            'media_type': story.media_type,
-            'created_at': story.created_at.isoformat()
-        })
+    """دریافت استوری‌ها (از ایندکس درون‌حافظه‌ای، بدون کوئری دیتابیس)"""
+    if not story_index.loaded:
+        load_story_index()
     
-    return jsonify({'success': True, 'stories': list(stories_by_user.values())})
+    return jsonify({'success': True, 'stories': story_index.snapshot(story_cutoff())})
 
 @app.route('/api/stories/create', methods=['POST'])
 def create_story():
@@ -349,23 +1804,27 @@ def create_story():
             user = get_or_create_user(username)
             
             # تشخیص نوع فایل
-            filename = secure_filename(file.filename)
-            ext = filename.rsplit('.', 1)[1].lower()
+            ext = file.filename.rsplit('.', 1)[1].lower()
             media_type = 'video' if ext in {'mp4', 'mov', 'avi'} else 'image'
             
             # ذخیره فایل
-            unique_filename = f"{uuid.uuid4().hex}_{filename}"
-            filepath = os.path.join('static/uploads/stories', unique_filename)
-            file.save(filepath)
+            blob, created = store_upload(file)
             
             # ایجاد استوری
             story = Story(
                 user_id=user.id,
-                media_url=f'/static/uploads/stories/{unique_filename}',
-                media_type=media_type
+                media_url=media_url(blob) if media_type == 'image' else media_store.url_for(blob.path),
+                media_type=media_type,
+                media_hash=blob.digest,
+                variants=blob.variants if media_type == 'image' else None
             )
             db.session.add(story)
             db.session.commit()
+            story_index.add(*story_entry(story, user))
+            response_cache.bump('stories')
+            
+            if created and media_type == 'image' and can_process(file.filename):
+                process_image_variants(blob)
             
             return jsonify({
                 'success': True,
@@ -381,21 +1840,58 @@ def create_story():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+def username_prefix_ids(prefix, limit):
+    """شناسه کاربرانی که نام کاربری‌شان با prefix شروع می‌شود (بازه‌ای روی ایندکس unique)"""
+    return db.session.scalars(
+        db.select(User.id)
+        .where(User.username >= prefix, User.username < prefix + '\U0010ffff')
+        .order_by(User.username)
+        .limit(limit)
+    ).all()
+
+def search_index_ids(fts_query, limit):
+    """شناسه کاربرانی که با عبارت MATCH ایندکس FTS5 تطابق دارند (حداکثر limit)"""
+    return db.session.execute(
+        db.text(f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH :query LIMIT :limit'),
+        {'query': fts_query, 'limit': limit}
+    ).scalars().all()
+
 @app.route('/api/users/search', methods=['GET'])
 def search_users():
-    """جستجوی کاربران"""
+    """جستجوی کاربران
+    
+    جستجوی پیشوندی روی ایندکس FTS5 (جدول user_search) با متن نرمال‌شده
+    فارسی. فقط SEARCH_CANDIDATES نامزد اول خوانده می‌شود (بدون ORDER BY
+    روی همه تطابق‌ها) تا زمان پاسخ برای پیشوندهای کوتاه با رشد جدول ثابت
+    بماند. برای اینکه رتبه‌های بالاتر بیرون از آن سقف نمانند، نام‌های کاربری
+    که با عبارت شروع می‌شوند از روی ایندکس unique نام کاربری و نام‌های
+    نمایشی که با آن شروع می‌شوند با پرس‌وجوی ^ همان ایندکس FTS جدا خوانده و
+    پیش از بقیه نامزدها اضافه می‌شوند. نامزدها به ترتیب نام کاربری دقیق،
+    پیشوند نام کاربری، پیشوند نام نمایشی و سپس طول نام کاربری مرتب می‌شوند.
+    """
     query = request.args.get('q', '')
     
-    if len(query) < 2:
+    if len(normalize_text(query).strip()) < 2:
         return jsonify({'success': True, 'users': []})
     
-    users = User.query.filter(
-        (User.username.ilike(f'%{query}%')) | 
-        (User.display_name.ilike(f'%{query}%'))
-    ).limit(10).all()
+    fts_query = match_query(query)
+    if not fts_query:
+        return jsonify({'success': True, 'users': []})
+    
+    limit = app.config['SEARCH_CANDIDATES']
+    candidate_ids = []
+    for prefix in dict.fromkeys([query.strip(), normalize_text(query).strip()]):
+        candidate_ids += username_prefix_ids(prefix, limit)
+    candidate_ids += search_index_ids(initial_match_query(query, 'display_name'), limit)
+    candidate_ids += search_index_ids(fts_query, limit)
+    candidate_ids = list(dict.fromkeys(candidate_ids))
+    
+    users = User.query.filter(User.id.in_(candidate_ids)).all() if candidate_ids else []
+    users.sort(key=lambda user: (match_rank(query, user.username, user.display_name),
+                                 len(user.username), user.username))
     
     users_data = []
-    for user in users:
+    for user in users[:app.config['SEARCH_RESULTS']]:
         users_data.append({
             'id': user.id,
             'username': user.username,
@@ -403,29 +1899,40 @@ def search_users():
             'profile_pic': user.profile_pic
         })
     
-    return jsonify({'success': True, 'users': users_data})
+    return jsonify({'success': True, 'users': requested_items(users_data)})
 
 @app.route('/api/users/<username>', methods=['GET'])
+@cached_response('posts', 'follows')
 def get_user_profile(username):
     """دریافت پروفایل کاربر"""
-    user = User.query.filter_by(username=username).first()
+    user = find_user(username)
     if not user:
         return jsonify({'success': False, 'error': 'کاربر یافت نشد'})
     
-    # آمار
+    # آمار؛ شمارش‌های فالو از گراف درون‌حافظه، رابطه با viewer از دیتابیس
     posts_count = Post.query.filter_by(user_id=user.id).count()
-    followers_count = Follow.query.filter_by(followed_id=user.id).count()
-    following_count = Follow.query.filter_by(follower_id=user.id).count()
+    viewer_name = request.args.get('viewer')
+    viewer = find_user(viewer_name) if viewer_name else None
+    following, followers = viewer_follow_flags(viewer, [user.id])
+    is_following, follows_you = user.id in following, user.id in followers
     
     # پست‌های کاربر
-    posts = Post.query.filter_by(user_id=user.id).order_by(Post.created_at.desc()).limit(12).all()
+    try:
+        posts, next_cursor = paginate_posts(
+            Post.query.filter_by(user_id=user.id),
+            request.args.get('cursor'),
+            get_page_size(app.config['PROFILE_PAGE_SIZE'])
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)})
     posts_data = []
     for post in posts:
         posts_data.append({
             'id': post.id,
             'image_url': post.image_url,
-            'likes_count': Like.query.filter_by(post_id=post.id).count(),
-            'comments_count': Comment.query.filter_by(post_id=post.id).count()
+            'likes_count': post.likes_count + like_buffer.pending_delta(post.id),
+            'comments_count': post.comments_count,
+            'variants': load_variants(post.variants)
         })
     
     return jsonify({
@@ -437,10 +1944,14 @@ def get_user_profile(username):
             'profile_pic': user.profile_pic,
             'bio': user.bio,
             'posts_count': posts_count,
-            'followers_count': followers_count,
-            'following_count': following_count
+            'followers_count': follow_graph.followers_count(user.id),
+            'following_count': follow_graph.following_count(user.id),
+            'is_following': is_following,
+            'follows_you': follows_you,
+            'is_mutual': is_following and follows_you
         },
-        'posts': posts_data
+        'posts': requested_items(posts_data),
+        'next_cursor': next_cursor
     })
 
 @app.route('/api/follow/<username>', methods=['POST'])
@@ -456,97 +1967,236 @@ def toggle_follow(username):
         
         if not target_user:
             return jsonify({'success': False, 'error': 'کاربر یافت نشد'})
+        if target_user.id == current_user.id:
+            return jsonify({'success': False, 'error': 'نمی‌توانید خودتان را دنبال کنید'})
         
-        # بررسی فالو قبلی
-        existing_follow = Follow.query.filter_by(
-            follower_id=current_user.id,
-            followed_id=target_user.id
-        ).first()
-        
-        if existing_follow:
-            # آنفالو
-            db.session.delete(existing_follow)
+        # تصمیم فالو/آنفالو از روی دیتابیس، نه گراف درون‌حافظه که ممکن است
+        # از تغییرهای پردازه‌های دیگر عقب باشد
+        unfollowed = db.session.execute(db.delete(Follow).where(
+            Follow.follower_id == current_user.id,
+            Follow.followed_id == target_user.id
+        )).rowcount
+        if unfollowed:
+            drop_author_from_timeline(current_user.id, target_user.id)
             is_following = False
         else:
-            # فالو
-            follow = Follow(
-                follower_id=current_user.id,
-                followed_id=target_user.id
+            # INSERT OR IGNORE در برابر درخواست تکراری همزمان
+            db.session.execute(
+                sqlite_insert(Follow).values(
+                    follower_id=current_user.id,
+                    followed_id=target_user.id,
+                    created_at=datetime.utcnow()
+                ).on_conflict_do_nothing()
             )
-            db.session.add(follow)
+            backfill_timeline(current_user.id, target_user)
             is_following = True
-        
         db.session.commit()
         
-        followers_count = Follow.query.filter_by(followed_id=target_user.id).count()
+        # شمارش‌ها همه‌جا (پروفایل، لیست‌ها و همین پاسخ) از گراف خوانده می‌شوند
+        if is_following:
+            follow_graph.add(current_user.id, target_user.id)
+        else:
+            follow_graph.remove(current_user.id, target_user.id)
+        response_cache.bump('follows')
         
         return jsonify({
             'success': True,
             'is_following': is_following,
-            'followers_count': followers_count
+            'followers_count': follow_graph.followers_count(target_user.id)
         })
     
     except Exception as e:
+        db.session.rollback()
         return jsonify({'success': False, 'error': str(e)})
 
+def follow_list(username, page):
+    """پاسخ مشترک لیست دنبال‌کنندگان/دنبال‌شده‌ها؛ cursor شناسه آخرین کاربر صفحه است"""
+    user = find_user(username)
+    if not user:
+        return jsonify({'success': False, 'error': 'کاربر یافت نشد'})
+    
+    cursor = request.args.get('cursor')
+    if cursor is not None and not cursor.isdigit():
+        return jsonify({'success': False, 'error': 'cursor نامعتبر است'}), 400
+    viewer_name = request.args.get('viewer')
+    viewer = find_user(viewer_name) if viewer_name else None
+    
+    user_ids, next_after = page(user.id, int(cursor) if cursor else None,
+                                get_page_size(app.config['FEED_PAGE_SIZE']))
+    flags = viewer_follow_flags(viewer, user_ids)
+    return jsonify({
+        'success': True,
+        'users': requested_items([follow_list_entry(entry, flags) for entry in users_by_ids(user_ids)]),
+        'next_cursor': str(next_after) if next_after is not None else None
+    })
+
+@app.route('/api/users/<username>/followers', methods=['GET'])
+def get_followers(username):
+    """دنبال‌کنندگان کاربر؛ پارامترها: cursor, limit, viewer"""
+    return follow_list(username, follow_graph.followers)
+
+@app.route('/api/users/<username>/following', methods=['GET'])
+def get_following(username):
+    """دنبال‌شده‌های کاربر؛ پارامترها: cursor, limit, viewer"""
+    return follow_list(username, follow_graph.following)
+
+@app.route('/api/users/suggestions', methods=['GET'])
+def get_suggestions():
+    """پیشنهاد کاربران برای دنبال کردن از دوستانِ دوستان"""
+    username = request.args.get('username')
+    if not username:
+        return jsonify({'success': False, 'error': 'نام کاربری الزامی است'})
+    
+    user = get_or_create_user(username)
+    limit = max(1, min(request.args.get('limit', app.config['SUGGESTIONS_LIMIT'], type=int),
+                       app.config['MAX_PAGE_SIZE']))
+    suggested = follow_graph.suggestions(user.id, limit)
+    mutual_counts = dict(suggested)
+    
+    # کاربران تازه یا گراف خالی: تکمیل با کاربران دیگر
+    users = users_by_ids([user_id for user_id, _ in suggested])
+    if len(users) < limit:
+        exclude = [entry.id for entry in users] + [user.id]
+        users += User.query.filter(User.id.notin_(exclude)).limit(limit * 2).all()
+    
+    # کسانی که کاربر (طبق دیتابیس) دنبال می‌کند پیشنهاد نمی‌شوند
+    flags = viewer_follow_flags(user, [candidate.id for candidate in users])
+    users = [candidate for candidate in users if candidate.id not in flags[0]][:limit]
+    
+    users_data = []
+    for candidate in users:
+        entry = follow_list_entry(candidate, flags)
+        entry['mutual_count'] = mutual_counts.get(candidate.id, 0)
+        users_data.append(entry)
+    
+    return jsonify({'success': True, 'users': requested_items(users_data)})
+
 # ============ Chat API ============
 @app.route('/api/chat/users', methods=['GET'])
 def get_chat_users():
-    """دریافت لیست کاربران برای چت"""
+    """صندوق پیام: گفتگوهای کاربر به ترتیب آخرین پیام
+    
+    هر ردیف شامل آخرین پیام و تعداد خوانده‌نشده است و از روی ایندکس
+    ix_conversation_user_recent با یک کوئری خوانده می‌شود. اگر صفحه اول
+    پر نشود، بقیه با کاربرانی که هنوز گفتگویی با آن‌ها نیست پر می‌شود تا
+    بتوان گفتگوی جدید شروع کرد.
+    پارامترها: username, cursor, limit
+    """
     username = request.args.get('username')
     if not username:
         return jsonify({'success': False, 'error': 'نام کاربری الزامی است'})
     
     current_user = get_or_create_user(username)
+    cursor = request.args.get('cursor')
+    limit = get_page_size(app.config['FEED_PAGE_SIZE'])
     
-    # کاربران غیر از خود کاربر
-    users = User.query.filter(User.id != current_user.id).limit(20).all()
+    query = db.session.query(
+        Conversation.last_message_at,
+        Conversation.peer_id,
+        Conversation.last_message,
+        Conversation.last_sender_id,
+        Conversation.unread_count,
+        User.username,
+        User.display_name,
+        User.profile_pic
+    ).join(User, User.id == Conversation.peer_id).filter(
+        Conversation.user_id == current_user.id,
+        Conversation.last_message_at.isnot(None)
+    )
+    try:
+        conversations, next_cursor = paginate_keyset(
+            query, cursor, limit, Conversation.last_message_at, Conversation.peer_id
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     
-    users_data = []
-    for user in users:
-        users_data.append({
-            'id': user.id,
-            'username': user.username,
-            'display_name': user.display_name,
-            'profile_pic': user.profile_pic
-        })
+    users_data = [
+        {
+            'id': row.peer_id,
+            'username': row.username,
+            'display_name': row.display_name,
+            'profile_pic': row.profile_pic,
+            'last_message': row.last_message,
+            'last_message_at': row.last_message_at.isoformat(),
+            'last_message_is_mine': row.last_sender_id == current_user.id,
+            'unread_count': row.unread_count
+        }
+        for row in conversations
+    ]
+    
+    if not cursor and len(users_data) < limit:
+        known_ids = [row['id'] for row in users_data] + [current_user.id]
+        for user in User.query.filter(User.id.notin_(known_ids)).limit(limit - len(users_data)):
+            users_data.append({
+                'id': user.id,
+                'username': user.username,
+                'display_name': user.display_name,
+                'profile_pic': user.profile_pic,
+                'last_message': None,
+                'last_message_at': None,
+                'last_message_is_mine': False,
+                'unread_count': 0
+            })
     
-    return jsonify({'success': True, 'users': users_data})
+    return jsonify({'success': True, 'users': requested_items(users_data), 'next_cursor': next_cursor})
 
 @app.route('/api/chat/messages', methods=['GET'])
 def get_messages():
-    """دریافت پیام‌های بین دو کاربر"""
+    """دریافت پیام‌های بین دو کاربر
+    
+    پارامترها:
+        before=<id>: صفحه پیام‌های قدیمی‌تر از این شناسه (بدون آن، آخرین صفحه)
+        since=<id>: پیام‌های جدیدتر از این شناسه (برای همگام‌سازی پس از اتصال دوباره)
+        limit: اندازه صفحه
+    پیام‌ها همیشه به ترتیب قدیمی به جدید برگردانده می‌شوند؛ has_more یعنی
+    در همان جهت پیام دیگری باقی مانده است.
+    """
     user1 = request.args.get('user1')
     user2 = request.args.get('user2')
     
     if not user1 or not user2:
         return jsonify({'success': False, 'error': 'هر دو کاربر الزامی هستند'})
     
+    before = request.args.get('before', type=int)
+    since = request.args.get('since', type=int)
+    limit = get_page_size(app.config['CHAT_PAGE_SIZE'])
+    
     user1_obj = get_or_create_user(user1)
     user2_obj = get_or_create_user(user2)
+    usernames = {user1_obj.id: user1_obj.username, user2_obj.id: user2_obj.username}
     
-    # دریافت پیام‌ها
-    messages = Message.query.filter(
-        ((Message.sender_id == user1_obj.id) & (Message.receiver_id == user2_obj.id)) |
-        ((Message.sender_id == user2_obj.id) & (Message.receiver_id == user1_obj.id))
-    ).order_by(Message.created_at.asc()).all()
+    # همان عبارت‌های ایندکس ix_message_ordered_pair
+    query = Message.query.filter(
+        func.min(Message.sender_id, Message.receiver_id) == min(user1_obj.id, user2_obj.id),
+        func.max(Message.sender_id, Message.receiver_id) == max(user1_obj.id, user2_obj.id)
+    )
+    if since is not None:
+        messages = query.filter(Message.id > since).order_by(Message.id.asc()).limit(limit + 1).all()
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+    else:
+        if before is not None:
+            query = query.filter(Message.id < before)
+        messages = query.order_by(Message.id.desc()).limit(limit + 1).all()
+        has_more = len(messages) > limit
+        messages = messages[:limit][::-1]
     
     messages_data = []
     for msg in messages:
         messages_data.append({
             'id': msg.id,
-            'sender': msg.sender.username,
-            'receiver': msg.receiver.username,
+            'sender': usernames[msg.sender_id],
+            'receiver': usernames[msg.receiver_id],
             'content': msg.content,
             'is_read': msg.is_read,
             'created_at': msg.created_at.isoformat()
         })
     
-    return jsonify({'success': True, 'messages': messages_data})
+    return jsonify({'success': True, 'messages': requested_items(messages_data), 'has_more': has_more})
 
 @app.route('/api/chat/send', methods=['POST'])
 def send_message():
-    """ارسال پیام"""
+    """ارسال پیام (برای کلاینت‌های بدون سوکت؛ مسیر اصلی رویداد send_chat_message است)"""
     try:
         sender = request.json.get('sender')
         receiver = request.json.get('receiver')
@@ -555,41 +2205,196 @@ def send_message():
         if not all([sender, receiver, content]):
             return jsonify({'success': False, 'error': 'تمام فیلدها الزامی هستند'})
         
-        sender_obj = get_or_create_user(sender)
-        receiver_obj = get_or_create_user(receiver)
+        # منتظر commit گروهی می‌مانیم، نه commit جداگانه برای همین پیام
+        result = socketio.server.eio.create_queue()
+        queue_chat_message(sender, receiver, content, lambda message, error: result.put((message, error)))
+        try:
+            message, error = result.get(timeout=app.config['CHAT_SEND_TIMEOUT'])
+        except socketio.server.eio.get_queue_empty_exception():
+            return jsonify({'success': False, 'error': 'ذخیره پیام بیش از حد طول کشید'})
+        if error is not None:
+            return jsonify({'success': False, 'error': str(error)})
+        
+        return jsonify({'success': True, 'message': message})
+    
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/api/chat/read', methods=['POST'])
+def mark_messages_read():
+    """علامت‌گذاری پیام‌های یک گفتگو به عنوان خوانده‌شده (همه یا تا up_to_id)"""
+    try:
+        username = request.json.get('username')
+        peer = request.json.get('peer')
+        up_to_id = request.json.get('up_to_id')
+        
+        if not username or not peer:
+            return jsonify({'success': False, 'error': 'نام کاربری و طرف گفتگو الزامی هستند'})
+        
+        reader = get_or_create_user(username)
+        peer_user = find_user(peer)
+        if not peer_user:
+            return jsonify({'success': False, 'error': 'کاربر یافت نشد'})
         
-        message = Message(
-            sender_id=sender_obj.id,
-            receiver_id=receiver_obj.id,
-            content=content
+        marked, last_read_id = mark_conversation_read(
+            reader, peer_user, int(up_to_id) if up_to_id is not None else None
         )
-        db.session.add(message)
-        db.session.commit()
+        push_read_state(reader, peer_user, marked, last_read_id)
+        total, _ = get_unread_counts(reader.id)
         
-        return jsonify({
-            'success': True,
-            'message': {
-                'id': message.id,
-                'sender': sender,
-                'receiver': receiver,
-                'content': content,
-                'created_at': message.created_at.isoformat()
-            }
-        })
+        return jsonify({'success': True, 'marked': marked, 'total_unread': total})
     
     except Exception as e:
+        db.session.rollback()
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/api/chat/unread', methods=['GET'])
+def get_unread():
+    """شمارنده‌های پیام خوانده‌نشده کاربر به تفکیک گفتگو"""
+    username = request.args.get('username')
+    if not username:
+        return jsonify({'success': False, 'error': 'نام کاربری الزامی است'})
+    
+    user = find_user(username)
+    if not user:
+        return jsonify({'success': True, 'total_unread': 0, 'conversations': {}})
+    
+    total, by_peer = get_unread_counts(user.id)
+    return jsonify({'success': True, 'total_unread': total, 'conversations': by_peer})
+
+# ============ Batch Requests ============
+BATCH_EXCLUDED = {'/api/batch', '/api/bootstrap'}
+
+def dispatch_subrequest(path):
+    """اجرای یک GET داخلی روی همان app context (بدون رفت‌وبرگشت شبکه)
+    
+    زیردرخواست با environ درخواست اصلی و مسیر جدید ساخته می‌شود و مستقیم
+    تابع view را صدا می‌زند؛ session دیتابیس، g و کش کاربران با درخواست
+    اصلی مشترک‌اند و hook های before/after_request (متریک، فشرده‌سازی)
+    فقط یک‌بار برای درخواست اصلی اجرا می‌شوند. کش پاسخ‌ها (cached_response)
+    چون بخشی از view است برای زیردرخواست‌ها هم کار می‌کند.
+    خروجی: (status, body)
+    """
+    url = urlsplit(path or '')
+    if not url.path.startswith('/api/') or url.path in BATCH_EXCLUDED:
+        return 400, {'success': False, 'error': 'مسیر نامعتبر است'}
+    
+    environ = dict(request.environ, PATH_INFO=url.path, QUERY_STRING=url.query,
+                   REQUEST_METHOD='GET', CONTENT_LENGTH='0')
+    environ['wsgi.input'] = io.BytesIO()
+    with app.request_context(environ):
+        if request.routing_exception is not None:
+            code = getattr(request.routing_exception, 'code', 404)
+            error = 'فقط درخواست GET مجاز است' if code == 405 else 'مسیر یافت نشد'
+            return code, {'success': False, 'error': error}
+        try:
+            response = app.make_response(
+                app.view_functions[request.url_rule.endpoint](**request.view_args)
+            )
+        except HTTPException as e:
+            return e.code, {'success': False, 'error': e.description}
+        return response.status_code, response.get_json(silent=True)
+
+@app.route('/api/batch', methods=['POST'])
+def batch_requests():
+    """اجرای چند درخواست GET در یک رفت‌وبرگشت
+    
+    بدنه: {"requests": [{"id": "posts", "path": "/api/posts?username=..."}, ...]}
+    خروجی: {"responses": [{"id", "status", "body"}, ...]} به همان ترتیب
+    """
+    subrequests = (request.get_json(silent=True) or {}).get('requests')
+    if not isinstance(subrequests, list) or not subrequests:
+        return jsonify({'success': False, 'error': 'لیست درخواست‌ها الزامی است'}), 400
+    if len(subrequests) > app.config['BATCH_MAX_REQUESTS']:
+        return jsonify({'success': False,
+                        'error': f"حداکثر {app.config['BATCH_MAX_REQUESTS']} درخواست مجاز است"}), 400
+    
+    responses = []
+    for index, subrequest in enumerate(subrequests):
+        subrequest = subrequest if isinstance(subrequest, dict) else {}
+        status, body = dispatch_subrequest(subrequest.get('path'))
+        responses.append({'id': subrequest.get('id', index), 'status': status, 'body': body})
+    
+    return jsonify({'success': True, 'responses': responses})
+
+@app.route('/api/bootstrap', methods=['GET'])
+def bootstrap():
+    """همه داده صفحه اول در یک درخواست: کاربر، فید، استوری‌ها، پیشنهادها و پیام‌های خوانده‌نشده
+    
+    کاربر یک‌بار ساخته/خوانده می‌شود و بقیه بخش‌ها او را از user_cache
+    می‌خوانند. هر بخش همان بدنه endpoint مستقل خودش است.
+    """
+    username = request.args.get('username')
+    if not username:
+        return jsonify({'success': False, 'error': 'نام کاربری الزامی است'})
+    
+    user = get_or_create_user(username)
+    query = urlencode({'username': user.username})
+    sections = {
+        'feed': f'/api/posts?{query}',
+        'stories': '/api/stories',
+        'suggestions': f"/api/users/suggestions?{query}&limit={request.args.get('suggestions', 5, type=int)}",
+        'unread': f'/api/chat/unread?{query}',
+    }
+    
+    payload = {
+        'success': True,
+        'user': {
+            'id': user.id,
+            'username': user.username,
+            'display_name': user.display_name,
+            'profile_pic': user.profile_pic
+        }
+    }
+    for name, path in sections.items():
+        payload[name] = dispatch_subrequest(path)[1]
+    return jsonify(payload)
+
 # ============ Socket.IO Events ============
 @socketio.on('connect')
 def handle_connect():
-    print('Client connected')
+    socket_clients.inc()
 
 @socketio.on('disconnect')
 def handle_disconnect():
-    print('Client disconnected')
+    socket_clients.dec()
+    emit_typing_events(typing_coalescer.drop_sid(request.sid))
+
+@socket_event('join_user')
+def handle_join_user(data):
+    """عضویت در room شخصی کاربر و دریافت شمارنده فعلی پیام‌های خوانده‌نشده"""
+    username = data.get('username')
+    if not username:
+        return
+    
+    join_room(user_room(username))
+    user = find_user(username)
+    total, by_peer = get_unread_counts(user.id) if user else (0, {})
+    emit('unread_update', {'total_unread': total, 'conversations': by_peer})
+
+@socket_event('mark_read')
+def handle_mark_read(data):
+    """خواندن گفتگو از طریق سوکت؛ همان mark_conversation_read"""
+    username = data.get('username')
+    peer = data.get('peer')
+    up_to_id = data.get('up_to_id')
+    
+    reader = find_user(username) if username else None
+    peer_user = find_user(peer) if peer else None
+    if not reader or not peer_user:
+        return
+    
+    try:
+        marked, last_read_id = mark_conversation_read(
+            reader, peer_user, int(up_to_id) if up_to_id is not None else None
+        )
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ خطا در علامت‌گذاری پیام‌ها: {e}")
+        return
+    push_read_state(reader, peer_user, marked, last_read_id)
 
-@socketio.on('join_chat')
+@socket_event('join_chat')
 def handle_join_chat(data):
     username = data.get('username')
     room = data.get('room')
@@ -598,36 +2403,136 @@ def handle_join_chat(data):
         join_room(room)
         emit('user_joined', {'username': username, 'room': room}, room=room)
 
-@socketio.on('send_chat_message')
+@socket_event('send_chat_message')
 def handle_chat_message(data):
-    room = data.get('room')
+    """ارسال پیام از طریق سوکت
+    
+    پیام در صف نوشتن گروهی قرار می‌گیرد؛ پس از ذخیره شدن دسته، پیام به
+    room فرستاده می‌شود و رویداد chat_message_ack با شناسه پیام (و
+    client_id ارسالی کلاینت) به فرستنده برمی‌گردد.
+    """
     message = data.get('message')
     sender = data.get('sender')
+    receiver = data.get('receiver') or chat_peer_from_room(data.get('room'), sender or '')
+    client_id = data.get('client_id')
+    sid = request.sid
+    
+    if not (message and sender and receiver):
+        emit('chat_message_ack', {'success': False, 'client_id': client_id,
+                                  'error': 'تمام فیلدها الزامی هستند'})
+        return
+    
+    # ارسال پیام یعنی پایان تایپ
+    stopped = typing_coalescer.update(chat_room(sender, receiver), sender, False, sid)
+    if stopped:
+        emit_typing_events([stopped])
+    
+    def ack(saved, error):
+        if error is not None:
+            payload = {'success': False, 'client_id': client_id, 'error': str(error)}
+        else:
+            payload = {'success': True, 'client_id': client_id, 'message': saved}
+        socketio.emit('chat_message_ack', payload, to=sid)
+    
+    queue_chat_message(sender, receiver, message, ack)
+
+@socket_event('watch_posts')
+def handle_watch_posts(data):
+    """عضویت در room فید و room پست‌های روی صفحه کلاینت
+    
+    رویداد post_created به room فید و post_stats به room هر پست فرستاده
+    می‌شود. با replace=True (بارگذاری دوباره فید) room پست‌هایی که دیگر در
+    لیست نیستند ترک می‌شوند.
+    """
+    post_ids = set()
+    for post_id in data.get('post_ids') or []:
+        try:
+            post_ids.add(int(post_id))
+        except (TypeError, ValueError):
+            continue
     
-    if room and message and sender:
-        emit('new_message', {
-            'sender': sender,
-            'message': message,
-            'timestamp': datetime.utcnow().isoformat()
-        }, room=room)
+    join_room(FEED_ROOM)
+    watched = {room for room in rooms() if room.startswith('post:')}
+    wanted = {post_room(post_id) for post_id in post_ids}
+    if data.get('replace'):
+        for room in watched - wanted:
+            leave_room(room)
+        watched &= wanted
+    for room in sorted(wanted - watched)[:max(0, app.config['WATCH_POSTS_LIMIT'] - len(watched))]:
+        join_room(room)
 
-@socketio.on('typing')
+@socket_event('typing')
 def handle_typing(data):
+    """رویداد تایپ کلاینت؛ فقط تغییر وضعیت و حداکثر یک‌بار در هر TYPING_WINDOW پخش می‌شود"""
     room = data.get('room')
     username = data.get('username')
-    is_typing = data.get('is_typing')
+    is_typing = bool(data.get('is_typing'))
     
     if room and username:
-        emit('user_typing', {
-            'username': username,
-            'is_typing': is_typing
-        }, room=room, include_self=False)
+        event = typing_coalescer.update(room, username, is_typing, request.sid)
+        if event:
+            emit_typing_events([event])
+
+# ============ CLI ============
+@app.cli.command('migrate')
+def migrate_command():
+    """ساخت جدول‌ها و اجرای مهاجرت‌های اجرانشده روی دیتابیس"""
+    db.create_all()
+    if not run_migrations(db.engine):
+        print("✅ اسکیما به‌روز است")
+
+@app.cli.command('dedupe-uploads')
+def dedupe_uploads_command():
+    """انتقال آپلودهای قدیمی به مخزن محتوامحور و حذف فایل‌های تکراری"""
+    migrated, reclaimed = dedupe_legacy_uploads()
+    print(f"✅ {migrated} فایل منتقل شد؛ {reclaimed / 1024 / 1024:.1f} مگابایت آزاد شد")
+
+@app.cli.command('reap-stories')
+def reap_stories_command():
+    """حذف یک‌باره استوری‌های منقضی و فایل‌هایشان"""
+    print(f"🧹 {reap_expired_stories()} استوری منقضی حذف شد")
+
+@app.cli.command('reconcile-counters')
+def reconcile_counters_command():
+    """همگام‌سازی شمارنده‌های لایک و کامنت پست‌ها با جدول‌های اصلی"""
+    recover_like_journal()
+    repaired = reconcile_post_counters()
+    print(f"✅ شمارنده‌های {repaired} پست اصلاح شد")
 
 # ============ Main ============
-@app.before_first_request
+_tables_ready = False
+_tables_lock = threading.Lock()
+
+@app.before_request
 def create_tables():
-    """ایجاد جداول دیتابیس"""
+    """ایجاد جداول دیتابیس (یک‌بار، پیش از اولین درخواست)"""
+    global _tables_ready
+    if _tables_ready:
+        return
+    with _tables_lock:
+        if _tables_ready:
+            return
+        g.schema_setup = True  # کوئری‌های راه‌اندازی جزو بودجه این درخواست نیستند
+        setup_schema()
+        recover_like_journal()
+        load_story_index()
+        load_follow_graph()
+        if app.config['FOLLOW_GRAPH_RELOAD_INTERVAL']:
+            socketio.start_background_task(follow_graph_loop)
+        if app.config['STORY_REAPER_INTERVAL']:
+            socketio.start_background_task(story_reaper_loop)
+        if app.config['TIMELINE_TRIM_INTERVAL']:
+            socketio.start_background_task(timeline_trim_loop)
+        socketio.start_background_task(typing_sweeper_loop)
+        socketio.start_background_task(engagement_sweeper_loop)
+        if app.config['LIKE_BUFFER']:
+            socketio.start_background_task(like_flush_loop)
+        _tables_ready = True
+
+def setup_schema():
+    """ایجاد جداول، اجرای مهاجرت‌ها و کاربران نمونه"""
     db.create_all()
+    run_migrations(db.engine)
     
     # ایجاد کاربران نمونه
     sample_users = ['user1', 'user2', 'user3', 'user4', 'user5']
@@ -0,0 +1,160 @@
+"""
+backplane پیام Socket.IO بین چند پردازه
+
+در محیط تولید از message_queue استاندارد Flask-SocketIO (مثلاً redis://)
+استفاده می‌شود. برای اجرا و تست روی یک ماشین بدون Redis، این ماژول یک
+broker محلی و سبک و یک client manager سازگار با python-socketio دارد:
+
+    SOCKETIO_MESSAGE_QUEUE=local://127.0.0.1:5599
+
+هر پردازه دو اتصال TCP به broker باز می‌کند: یکی برای انتشار و یکی برای
+دریافت. broker هر فریم دریافتی را برای همه مشترک‌ها می‌فرستد. فریم‌ها JSON
+با پیشوند طول ۴ بایتی هستند. broker فقط روی localhost گوش می‌دهد و
+احراز هویت ندارد.
+"""
+import json
+import socket
+import socketserver
+import struct
+import threading
+import time
+from urllib.parse import urlparse
+
+import socketio
+
+DEFAULT_URL = 'local://127.0.0.1:5599'
+HEADER = struct.Struct('!I')
+
+
+def parse_url(url):
+    """(host, port) از آدرس local://host:port"""
+    parsed = urlparse(url)
+    if parsed.scheme != 'local':
+        raise ValueError(f'unexpected backplane url: {url}')
+    return parsed.hostname or '127.0.0.1', parsed.port or 5599
+
+
+def send_frame(sock, payload):
+    data = json.dumps(payload).encode()
+    sock.sendall(HEADER.pack(len(data)) + data)
+
+
+def recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise ConnectionError('backplane connection closed')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def recv_frame(sock):
+    (size,) = HEADER.unpack(recv_exact(sock, HEADER.size))
+    return json.loads(recv_exact(sock, size))
+
+
+# ============ Broker ============
+class BrokerServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, BrokerHandler)
+        self.subscribers = set()
+        self.subscribers_lock = threading.Lock()
+
+    def broadcast(self, payload):
+        data = json.dumps(payload).encode()
+        frame = HEADER.pack(len(data)) + data
+        with self.subscribers_lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                with subscriber.write_lock:
+                    subscriber.request.sendall(frame)
+            except OSError:
+                self.drop(subscriber)
+
+    def drop(self, subscriber):
+        with self.subscribers_lock:
+            self.subscribers.discard(subscriber)
+
+
+class BrokerHandler(socketserver.BaseRequestHandler):
+    """اولین فریم نقش اتصال را مشخص می‌کند: {'role': 'pub'} یا {'role': 'sub'}"""
+
+    def handle(self):
+        self.write_lock = threading.Lock()
+        try:
+            role = recv_frame(self.request).get('role')
+            if role == 'sub':
+                with self.server.subscribers_lock:
+                    self.server.subscribers.add(self)
+                # مشترک فقط می‌خواند؛ منتظر بسته شدن اتصال می‌مانیم
+                while self.request.recv(1024):
+                    pass
+            else:
+                while True:
+                    self.server.broadcast(recv_frame(self.request))
+        except (ConnectionError, OSError, ValueError):
+            pass
+        finally:
+            self.server.drop(self)
+
+
+def run_broker(url=DEFAULT_URL):
+    """اجرای broker محلی تا زمان توقف پردازه"""
+    server = BrokerServer(parse_url(url))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+# ============ Client Manager ============
+class LocalQueueManager(socketio.PubSubManager):
+    """client manager مبتنی بر broker محلی، جایگزین RedisManager روی یک ماشین"""
+    name = 'local'
+
+    def __init__(self, url=DEFAULT_URL, channel='flask-socketio', write_only=False, logger=None):
+        self.address = parse_url(url)
+        self._publisher = None
+        self._publish_lock = threading.Lock()
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+
+    def _connect(self, role):
+        sock = socket.create_connection(self.address)
+        send_frame(sock, {'role': role})
+        return sock
+
+    def _publish(self, data):
+        payload = {'channel': self.channel, 'data': data}
+        with self._publish_lock:
+            for attempt in range(2):
+                try:
+                    if self._publisher is None:
+                        self._publisher = self._connect('pub')
+                    send_frame(self._publisher, payload)
+                    return
+                except OSError:
+                    self._publisher = None
+                    if attempt:
+                        raise
+
+    def _listen(self):
+        retry_delay = 1
+        while True:
+            try:
+                subscriber = self._connect('sub')
+                retry_delay = 1
+                while True:
+                    message = recv_frame(subscriber)
+                    if message.get('channel') == self.channel:
+                        yield message['data']
+            except (ConnectionError, OSError):
+                self._get_logger().error(
+                    'Cannot receive from backplane, retrying in %s secs', retry_delay)
+                time.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, 60)
@@ -0,0 +1,477 @@
+#!/usr/bin/env python3
+"""
+بنچمارک و تست بار همه endpoint ها و رویدادهای Socket.IO
+
+نمونه اجرا:
+    python bench.py                                   # داده پیش‌فرض، مقایسه با baseline ذخیره‌شده
+    python bench.py --users 100000 --likes 1000000 --messages 10000000 --iterations 500
+    python bench.py --save-baseline                   # ذخیره نتیجه به عنوان baseline جدید
+    python bench.py --compare-tuning                  # قبل/بعد ایندکس‌ها و PRAGMA ها
+
+یک دیتابیس موقت با داده مصنوعی (bulk insert) ساخته می‌شود و همه مسیرهای
+app.py با test client Flask و رویدادهای سوکت با test client Socket.IO
+اجرا می‌شوند. برای هر مورد throughput و p50/p95/p99 گزارش می‌شود. اگر
+فایل baseline با همان اندازه داده وجود داشته باشد، p95 ها مقایسه می‌شوند
+و افت بیشتر از --tolerance به عنوان regression گزارش می‌شود (کد خروج 1).
+هر اجرا در یک پردازه جدا انجام می‌شود چون تنظیمات اتصال هنگام import
+اپلیکیشن خوانده می‌شوند.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from datetime import datetime, timedelta
+
+from migrations import (INDEXES, TIMELINE_MAX_ENTRIES, FANOUT_FOLLOWER_LIMIT,
+                        MARK_FANOUT_ON_READ_SQL, BACKFILL_TIMELINES_SQL)
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+FIRST_USER_ID = 1000
+SIZE_KEYS = ('users', 'posts', 'likes', 'comments', 'follows', 'messages', 'stories', 'chat_users')
+DEFAULT_BASELINE = 'bench_baseline.json'
+MEDIA_URL_PREFIX = '/media'  # پیش‌فرض app.config['MEDIA_URL_PREFIX']
+
+
+def create_schema(db_path):
+    """ساخت اسکیمای خالی با خود اپلیکیشن"""
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    from app import app, setup_schema
+    with app.app_context():
+        setup_schema()
+
+
+def seed_database(db_path, sizes, seed=42, fanout_limit=FANOUT_FOLLOWER_LIMIT,
+                  timeline_limit=TIMELINE_MAX_ENTRIES, media_prefix=MEDIA_URL_PREFIX):
+    """پر کردن دیتابیس با داده مصنوعی به صورت bulk insert
+
+    ردیف‌ها با generator ساخته و مستقیم به executemany داده می‌شوند تا
+    میلیون‌ها ردیف در حافظه جمع نشوند. جدول‌های مشتق (تایم‌لاین، گفتگوها،
+    شمارنده‌ها) در پایان با SQL از روی داده اصلی ساخته می‌شوند. پیام‌ها
+    بین chat_users کاربر اول پخش می‌شوند تا گفتگوها تاریخچه بلند داشته
+    باشند. آدرس پست‌ها و استوری‌ها زیر media_prefix ساخته می‌شوند.
+    """
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+
+    def timestamp(max_age_hours):
+        return (now - timedelta(seconds=rng.randint(0, max_age_hours * 3600))).strftime(DATE_FORMAT)
+
+    def step(label, started):
+        print(f"   {label}: {time.perf_counter() - started:.1f}s", file=sys.stderr)
+        return time.perf_counter()
+
+    connection = sqlite3.connect(db_path)
+    connection.execute('PRAGMA synchronous=OFF')
+    connection.execute('PRAGMA journal_mode=MEMORY')
+    user_ids = range(FIRST_USER_ID, FIRST_USER_ID + sizes['users'])
+    post_ids = range(1, sizes['posts'] + 1)
+    chat_ids = user_ids[:max(2, min(sizes['chat_users'], sizes['users']))]
+    started = time.perf_counter()
+
+    connection.executemany(
+        'INSERT INTO user (id, username, display_name, bio, profile_pic, created_at, fanout_on_read) '
+        'VALUES (?, ?, ?, ?, ?, ?, 0)',
+        ((i, f'bench{i}', f'کاربر {i}', '', 'default_profile.jpg', timestamp(24 * 365)) for i in user_ids)
+    )
+    started = step('users', started)
+    connection.executemany(
+        'INSERT INTO post (id, user_id, image_url, caption, created_at, likes_count, comments_count) '
+        'VALUES (?, ?, ?, ?, ?, 0, 0)',
+        ((i, rng.choice(user_ids), f'{media_prefix}/posts/{i}.jpg', f'پست {i}', timestamp(24 * 90))
+         for i in post_ids)
+    )
+    started = step('posts', started)
+    # تکراری‌ها را محدودیت unique حذف می‌کند؛ نیازی به set در حافظه نیست
+    connection.executemany(
+        'INSERT OR IGNORE INTO "like" (user_id, post_id, created_at) VALUES (?, ?, ?)',
+        ((rng.choice(user_ids), rng.choice(post_ids), timestamp(24 * 90)) for _ in range(sizes['likes']))
+    )
+    started = step('likes', started)
+    connection.executemany(
+        'INSERT INTO comment (user_id, post_id, text, created_at) VALUES (?, ?, ?, ?)',
+        ((rng.choice(user_ids), rng.choice(post_ids), 'نظر', timestamp(24 * 90))
+         for _ in range(sizes['comments']))
+    )
+    started = step('comments', started)
+    pairs = ((rng.choice(user_ids), rng.choice(user_ids)) for _ in range(sizes['follows']))
+    connection.executemany(
+        'INSERT OR IGNORE INTO follow (follower_id, followed_id, created_at) VALUES (?, ?, ?)',
+        ((a, b, timestamp(24 * 365)) for a, b in pairs if a != b)
+    )
+    started = step('follows', started)
+
+    def message_rows():
+        for _ in range(sizes['messages']):
+            index = rng.randrange(len(chat_ids))
+            peer = (index + rng.randrange(1, len(chat_ids))) % len(chat_ids)
+            yield chat_ids[index], chat_ids[peer], 'سلام', rng.random() < 0.9, timestamp(24 * 30)
+
+    connection.executemany(
+        'INSERT INTO message (sender_id, receiver_id, content, is_read, created_at) VALUES (?, ?, ?, ?, ?)',
+        message_rows()
+    )
+    started = step('messages', started)
+    connection.executemany(
+        'INSERT INTO story (user_id, media_url, media_type, created_at) VALUES (?, ?, ?, ?)',
+        ((rng.choice(user_ids), f'{media_prefix}/stories/{i}.jpg', 'image', timestamp(24))
+         for i in range(sizes['stories']))
+    )
+    started = step('stories', started)
+
+    connection.execute(
+        'UPDATE post SET '
+        'likes_count = (SELECT COUNT(*) FROM "like" WHERE "like".post_id = post.id), '
+        'comments_count = (SELECT COUNT(*) FROM comment WHERE comment.post_id = post.id)'
+    )
+    connection.execute(MARK_FANOUT_ON_READ_SQL, {'fanout_limit': fanout_limit})
+    connection.execute(BACKFILL_TIMELINES_SQL, {'limit': timeline_limit})
+    started = step('timelines', started)
+    connection.execute(
+        'INSERT INTO conversation (user_id, peer_id, unread_count, last_message_id) '
+        'SELECT user_id, peer_id, SUM(unread), MAX(id) FROM ('
+        '  SELECT receiver_id AS user_id, sender_id AS peer_id, NOT is_read AS unread, id FROM message '
+        '  UNION ALL '
+        '  SELECT sender_id, receiver_id, 0, id FROM message'
+        ') GROUP BY user_id, peer_id'
+    )
+    connection.execute(
+        'UPDATE conversation SET last_sender_id = message.sender_id, '
+        'last_message = SUBSTR(message.content, 1, 100), last_message_at = message.created_at '
+        'FROM message WHERE message.id = conversation.last_message_id'
+    )
+    step('conversations', started)
+    connection.commit()
+    connection.close()
+
+
+def strip_tuning(db_path):
+    """حذف ایندکس‌های مهاجرت و برگرداندن journal به حالت پیش‌فرض"""
+    connection = sqlite3.connect(db_path)
+    for name, _, _ in INDEXES:
+        connection.execute(f'DROP INDEX IF EXISTS {name}')
+    connection.execute('DROP TABLE IF EXISTS sqlite_stat1')
+    connection.execute('PRAGMA journal_mode=DELETE')
+    connection.commit()
+    connection.close()
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def summarize(samples, elapsed):
+    """آمار نمونه‌ها به میلی‌ثانیه و throughput به درخواست در ثانیه"""
+    return {
+        'requests': len(samples),
+        'throughput': len(samples) / elapsed if elapsed else 0.0,
+        'mean': sum(samples) / len(samples),
+        'p50': percentile(samples, 0.50),
+        'p95': percentile(samples, 0.95),
+        'p99': percentile(samples, 0.99),
+    }
+
+
+def png_image(index):
+    """تصویر PNG تک‌رنگ ۸×۸ با رنگ متفاوت برای هر index (بدون وابستگی به Pillow)"""
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    color = struct.pack('>I', index & 0xFFFFFF)[1:]
+    rows = b''.join(b'\x00' + color * 8 for _ in range(8))
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', 8, 8, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(rows)) + chunk(b'IEND', b''))
+
+
+def upload(field, index, username):
+    """بدنه multipart آپلود تصویر؛ هر بار یک فایل تازه"""
+    return {'data': {'username': username, field: (io.BytesIO(png_image(index)), f'bench{index}.png')}}
+
+
+def endpoint_cases(sizes, media_path, feed_cursor):
+    """درخواست‌های HTTP مورد سنجش: (نام، متد، مسیر، آرگومان‌های client.open)
+
+    مسیر و آرگومان‌ها می‌توانند تابعی از شماره تکرار باشند تا درخواست‌های
+    نوشتنی هر بار داده تازه بسازند.
+    """
+    users = sizes['users']
+    viewer, peer, other = (f'bench{FIRST_USER_ID + i}' for i in range(3))
+
+    def any_user(i, skip=0):
+        return f'bench{FIRST_USER_ID + skip + i % (users - skip)}'
+
+    return [
+        ('home', 'GET', '/', {}),
+        ('media', 'GET', media_path, {}),
+        ('init', 'POST', '/api/init', lambda i: {'json': {'username': any_user(i)}}),
+        ('feed', 'GET', f'/api/posts?username={viewer}', {}),
+        ('feed_page2', 'GET', f'/api/posts?username={viewer}&cursor={feed_cursor}', {}),
+        ('following_feed', 'GET', f'/api/posts?feed=following&username={viewer}', {}),
+        ('create_post', 'POST', '/api/posts/create', lambda i: upload('image', i, viewer)),
+        ('like_toggle', 'POST', '/api/posts/1/like', {'json': {'username': other}}),
+        ('comments', 'GET', '/api/posts/1/comments', {}),
+        ('add_comment', 'POST', '/api/posts/2/comments', {'json': {'username': other, 'text': 'نظر'}}),
+        ('stories', 'GET', '/api/stories', {}),
+        ('create_story', 'POST', '/api/stories/create', lambda i: upload('media', i, other)),
+        ('search', 'GET', lambda i: f'/api/users/search?q=bench{1000 + i % 100}', {}),
+        ('profile', 'GET', f'/api/users/{peer}?viewer={viewer}', {}),
+        ('follow_toggle', 'POST', lambda i: f'/api/follow/{any_user(i, skip=3)}', {'json': {'current_user': other}}),
+        ('followers', 'GET', f'/api/users/{peer}/followers?viewer={viewer}', {}),
+        ('following', 'GET', f'/api/users/{peer}/following?viewer={viewer}', {}),
+        ('suggestions', 'GET', f'/api/users/suggestions?username={viewer}', {}),
+        ('chat_users', 'GET', f'/api/chat/users?username={viewer}', {}),
+        ('chat_messages', 'GET', f'/api/chat/messages?user1={viewer}&user2={peer}', {}),
+        ('chat_send', 'POST', '/api/chat/send',
+         {'json': {'sender': peer, 'receiver': viewer, 'content': 'سلام'}}),
+        ('chat_read', 'POST', '/api/chat/read', {'json': {'username': viewer, 'peer': peer}}),
+        ('chat_unread', 'GET', f'/api/chat/unread?username={viewer}', {}),
+        ('bootstrap', 'GET', f'/api/bootstrap?username={viewer}', {}),
+        ('batch', 'POST', '/api/batch', {'json': {'requests': [
+            {'id': 'profile', 'path': f'/api/users/{peer}?viewer={viewer}'},
+            {'id': 'messages', 'path': f'/api/chat/messages?user1={viewer}&user2={peer}'},
+        ]}}),
+        # آخر از همه تا همه سری‌های متریک درخواست‌های بالا رندر شوند
+        ('metrics', 'GET', '/metrics', {}),
+    ]
+
+
+def socket_cases(sizes):
+    """رویدادهای Socket.IO مورد سنجش: (نام، رویداد، داده)"""
+    viewer, peer = f'bench{FIRST_USER_ID}', f'bench{FIRST_USER_ID + 1}'
+    room = f'chat_{viewer}_{peer}'
+    return [
+        ('sio_join_user', 'join_user', {'username': viewer}),
+        ('sio_join_chat', 'join_chat', {'username': viewer, 'room': room}),
+        ('sio_watch_posts', 'watch_posts', lambda i: {'post_ids': list(range(1 + i % 5, 21 + i % 5)), 'replace': True}),
+        ('sio_typing', 'typing', lambda i: {'room': room, 'username': viewer, 'is_typing': i % 2 == 0}),
+        ('sio_send_message', 'send_chat_message',
+         lambda i: {'room': room, 'sender': viewer, 'receiver': peer, 'message': 'سلام', 'client_id': i}),
+        ('sio_mark_read', 'mark_read', {'username': peer, 'peer': viewer}),
+    ]
+
+
+def resolve(value, index):
+    return value(index) if callable(value) else value
+
+
+def run_phase(db_path, sizes, iterations, response_cache=True):
+    """اجرای همه درخواست‌ها و رویدادها روی یک دیتابیس و برگرداندن آمار
+
+    پوشه کاری پردازه به کنار دیتابیس منتقل می‌شود تا فایل‌های آپلودی
+    بنچمارک در UPLOAD_FOLDER موقت نوشته شوند.
+    """
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ['LIKE_JOURNAL_DIR'] = os.path.join(os.path.dirname(db_path), 'like-journal')
+    os.chdir(os.path.dirname(db_path))
+    from app import app, socketio, chat_writer, flush_like_buffer
+    if not response_cache:
+        app.config['RESPONSE_CACHE_MAX_AGE'] = 0
+    client = app.test_client()
+    viewer = f'bench{FIRST_USER_ID}'
+    feed_cursor = client.get(f'/api/posts?username={viewer}').get_json()['next_cursor'] or ''
+    media_path = client.post('/api/posts/create', **upload('image', 0, viewer)).get_json()['post']['image_url']
+
+    results = {}
+    for name, method, path, options in endpoint_cases(sizes, media_path, feed_cursor):
+        samples = []
+        started = time.perf_counter()
+        for i in range(iterations):
+            start = time.perf_counter()
+            response = client.open(resolve(path, i), method=method, **resolve(options, i))
+            samples.append((time.perf_counter() - start) * 1000)
+            payload = response.get_json(silent=True) or {}
+            assert response.status_code == 200 and payload.get('success', True), \
+                (name, response.status_code, payload.get('error'))
+        results[name] = summarize(samples, time.perf_counter() - started)
+
+    # لایک‌ها در بافر می‌مانند؛ زمان ذخیره تغییرهای خالص جدا گزارش می‌شود
+    start = time.perf_counter()
+    flush_like_buffer()
+    elapsed = time.perf_counter() - start
+    results['like_flush'] = summarize([elapsed * 1000 / iterations] * iterations, elapsed)
+
+    # اتصال: ساخت و بستن یک کلاینت کامل Socket.IO
+    samples = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        socketio.test_client(app, flask_test_client=client).disconnect()
+        samples.append((time.perf_counter() - start) * 1000)
+    results['sio_connect'] = summarize(samples, time.perf_counter() - started)
+
+    sio = socketio.test_client(app, flask_test_client=client)
+    for name, event, data in socket_cases(sizes):
+        samples = []
+        started = time.perf_counter()
+        for i in range(iterations):
+            start = time.perf_counter()
+            sio.emit(event, resolve(data, i))
+            samples.append((time.perf_counter() - start) * 1000)
+        results[name] = summarize(samples, time.perf_counter() - started)
+        sio.get_received()
+
+    # پیام‌های سوکت در صف نوشتن گروهی‌اند؛ زمان ذخیره همه آن‌ها جدا و به
+    # صورت سرشکن برای هر پیام گزارش می‌شود
+    start = time.perf_counter()
+    chat_writer.drain()
+    elapsed = time.perf_counter() - start
+    results['sio_send_flush'] = summarize([elapsed * 1000 / iterations] * iterations, elapsed)
+    sio.disconnect()
+    return results
+
+
+def spawn_phase(db_path, args, tuning=True):
+    env = dict(os.environ, SQLITE_TUNING='1' if tuning else '0')
+    command = [sys.executable, os.path.abspath(__file__), '--phase', db_path,
+               '--iterations', str(args.iterations), '--users', str(args.users)]
+    if args.no_response_cache:
+        command.append('--no-response-cache')
+    output = subprocess.run(command, env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def build_database(workdir, sizes):
+    """ساخت اسکیما در پردازه جدا و پر کردن آن؛ خروجی: مسیر دیتابیس"""
+    base = os.path.join(workdir, 'base.db')
+    subprocess.run(
+        [sys.executable, '-c', f'import bench; bench.create_schema({base!r})'],
+        check=True, capture_output=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    print(f"📦 ساخت داده مصنوعی: {sizes}")
+    started = time.perf_counter()
+    seed_database(base, sizes)
+    connection = sqlite3.connect(base)
+    connection.execute('ANALYZE')
+    connection.close()
+    print(f"✅ داده در {time.perf_counter() - started:.1f} ثانیه ساخته شد")
+    return base
+
+
+def print_results(results, baseline=None, tolerance=0.2, min_delta=0.5):
+    """چاپ جدول نتایج؛ خروجی: نام مواردی که p95 آن‌ها از baseline بدتر شده
+
+    تغییرهای کوچک‌تر از min_delta میلی‌ثانیه نویز اندازه‌گیری حساب می‌شوند.
+    """
+    regressions = []
+    header = f"{'case':<20}{'req/s':>10}{'p50':>9}{'p95':>9}{'p99':>9}"
+    print(header + (f"{'base p95':>10}{'change':>9}" if baseline else ''))
+    for name, stats in results.items():
+        line = (f"{name:<20}{stats['throughput']:>10.0f}{stats['p50']:>9.2f}"
+                f"{stats['p95']:>9.2f}{stats['p99']:>9.2f}")
+        previous = (baseline or {}).get(name)
+        if previous:
+            change = stats['p95'] / previous['p95'] - 1 if previous['p95'] else 0.0
+            line += f"{previous['p95']:>10.2f}{change:>+8.0%}"
+            if change > tolerance and stats['p95'] - previous['p95'] > min_delta:
+                regressions.append(name)
+                line += '  ⚠️'
+        print(line)
+    return regressions
+
+
+def load_baseline(path, settings):
+    """نتایج baseline ذخیره‌شده اگر با همان تنظیمات (اندازه داده، تکرار، کش) گرفته شده باشد"""
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        stored = json.load(f)
+    if stored.get('settings') != settings:
+        print(f"ℹ️ baseline در {path} با تنظیمات دیگری گرفته شده؛ مقایسه انجام نمی‌شود")
+        return None
+    return stored['results']
+
+
+def save_baseline(path, settings, results):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'created_at': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'settings': settings,
+            'results': results,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"💾 baseline در {path} ذخیره شد")
+
+
+def compare_tuning(workdir, base, args):
+    """اجرای قبل/بعد: بدون ایندکس‌های مهاجرت و PRAGMA ها در برابر اسکیمای کامل"""
+    before, after = os.path.join(workdir, 'before', 'db.sqlite'), os.path.join(workdir, 'after', 'db.sqlite')
+    for path in (before, after):
+        os.makedirs(os.path.dirname(path))
+        shutil.copy(base, path)
+    strip_tuning(before)
+
+    results_before = spawn_phase(before, args, tuning=False)
+    results_after = spawn_phase(after, args, tuning=True)
+
+    print(f"{'case':<20}{'before p50':>12}{'after p50':>12}{'before p95':>12}{'after p95':>12}{'speedup':>10}")
+    for name in results_before:
+        b, a = results_before[name], results_after[name]
+        print(f"{name:<20}{b['p50']:>12.2f}{a['p50']:>12.2f}{b['p95']:>12.2f}{a['p95']:>12.2f}"
+              f"{b['mean'] / a['mean']:>9.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='بنچمارک endpoint ها و رویدادهای Socket.IO')
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--posts', type=int, default=20000)
+    parser.add_argument('--likes', type=int, default=100000)
+    parser.add_argument('--comments', type=int, default=50000)
+    parser.add_argument('--follows', type=int, default=40000)
+    parser.add_argument('--messages', type=int, default=50000)
+    parser.add_argument('--stories', type=int, default=5000)
+    parser.add_argument('--chat-users', type=int, default=50,
+                        help='تعداد کاربرانی که پیام‌ها بین آن‌ها پخش می‌شود')
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--no-response-cache', action='store_true',
+                        help='سنجش بدون کش پاسخ‌های GET')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='فایل JSON نتایج مرجع')
+    parser.add_argument('--save-baseline', action='store_true', help='ذخیره نتیجه این اجرا به عنوان baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='افزایش مجاز p95 نسبت به baseline (0.2 یعنی ۲۰٪)')
+    parser.add_argument('--min-delta', type=float, default=0.5,
+                        help='کمترین افزایش p95 (میلی‌ثانیه) که regression حساب می‌شود')
+    parser.add_argument('--compare-tuning', action='store_true',
+                        help='مقایسه قبل/بعد ایندکس‌ها و PRAGMA ها')
+    parser.add_argument('--phase', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.phase:
+        sizes = {'users': args.users}
+        print(json.dumps(run_phase(args.phase, sizes, args.iterations, not args.no_response_cache)))
+        return
+
+    sizes = {key: getattr(args, key) for key in SIZE_KEYS}
+    workdir = tempfile.mkdtemp(prefix='instaclone-bench-')
+    try:
+        base = build_database(workdir, sizes)
+        if args.compare_tuning:
+            compare_tuning(workdir, base, args)
+            return
+
+        settings = {'sizes': sizes, 'iterations': args.iterations,
+                    'response_cache': not args.no_response_cache}
+        results = spawn_phase(base, args)
+        regressions = print_results(results, load_baseline(args.baseline, settings),
+                                    args.tolerance, args.min_delta)
+        if args.save_baseline:
+            save_baseline(args.baseline, settings, results)
+        elif regressions:
+            print(f"❌ regression در: {', '.join(regressions)}")
+            sys.exit(1)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
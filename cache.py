@@ -0,0 +1,308 @@
+"""
+کش‌های درون‌پردازه‌ای
+"""
+import heapq
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """کش LRU محدود و thread-safe
+
+    با پر شدن ظرفیت، کم‌استفاده‌ترین کلید حذف می‌شود.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+class ActiveStoryIndex:
+    """استوری‌های فعال (۲۴ ساعت اخیر) گروه‌بندی‌شده بر اساس کاربر
+
+    هر استوری یک دیکشنری با کلیدهای id, media_url, media_type, created_at
+    (datetime), variants و media_hash است.
+    """
+
+    def __init__(self):
+        self._by_user = {}  # user_id -> {'user': dict, 'stories': [جدیدترین اول]}
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def replace(self, entries):
+        """بازسازی کامل از لیست (user, story)"""
+        by_user = {}
+        for user, story in entries:
+            group = by_user.setdefault(user['id'], {'user': user, 'stories': []})
+            group['stories'].append(story)
+        for group in by_user.values():
+            group['stories'].sort(key=lambda story: (story['created_at'], story['id']), reverse=True)
+        with self._lock:
+            self._by_user = by_user
+            self.loaded = True
+
+    def add(self, user, story):
+        with self._lock:
+            group = self._by_user.setdefault(user['id'], {'user': user, 'stories': []})
+            group['user'] = user
+            group['stories'].insert(0, story)
+
+    def remove(self, story_ids):
+        story_ids = set(story_ids)
+        with self._lock:
+            for user_id in list(self._by_user):
+                group = self._by_user[user_id]
+                group['stories'] = [s for s in group['stories'] if s['id'] not in story_ids]
+                if not group['stories']:
+                    del self._by_user[user_id]
+
+    def update_media(self, media_hash, media_url, variants):
+        """به‌روزرسانی آدرس استوری‌های یک blob پس از ساخت نسخه‌های تصویر"""
+        with self._lock:
+            for group in self._by_user.values():
+                for story in group['stories']:
+                    if story['media_hash'] == media_hash and story['media_type'] == 'image':
+                        story['media_url'] = media_url
+                        story['variants'] = variants
+
+    def snapshot(self, cutoff):
+        """گروه‌های استوری فعال، کاربر با جدیدترین استوری اول"""
+        with self._lock:
+            groups = [
+                (group['user'], [s for s in group['stories'] if s['created_at'] > cutoff])
+                for group in self._by_user.values()
+            ]
+        groups = [(user, stories) for user, stories in groups if stories]
+        groups.sort(key=lambda group: (group[1][0]['created_at'], group[1][0]['id']), reverse=True)
+        return [
+            {
+                'user': user,
+                'stories': [
+                    {
+                        'id': story['id'],
+                        'media_url': story['media_url'],
+                        'media_type': story['media_type'],
+                        'created_at': story['created_at'].isoformat(),
+                        'variants': story['variants']
+                    }
+                    for story in stories
+                ]
+            }
+            for user, stories in groups
+        ]
+
+
+class FollowGraph:
+    """گراف دنبال‌کردن در حافظه: دو نقشه مجاورت user_id -> set
+
+    شمارش دنبال‌کنندگان و دنبال‌شده‌ها O(1) است. لیست‌ها بر اساس شناسه
+    کاربر صفحه‌بندی می‌شوند و پیشنهادها از دوستانِ دوستان (کاربرانی که
+    دنبال‌شده‌های کاربر دنبال می‌کنند) ساخته می‌شوند. پرچم‌های رابطه
+    viewer با هر کاربر از دیتابیس خوانده می‌شوند (viewer_follow_flags).
+    """
+
+    def __init__(self):
+        self._following = {}  # follower_id -> {followed_id}
+        self._followers = {}  # followed_id -> {follower_id}
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def replace(self, pairs):
+        """بازسازی کامل از لیست (follower_id, followed_id)"""
+        following, followers = {}, {}
+        for follower_id, followed_id in pairs:
+            following.setdefault(follower_id, set()).add(followed_id)
+            followers.setdefault(followed_id, set()).add(follower_id)
+        with self._lock:
+            self._following, self._followers = following, followers
+            self.loaded = True
+
+    def add(self, follower_id, followed_id):
+        with self._lock:
+            self._following.setdefault(follower_id, set()).add(followed_id)
+            self._followers.setdefault(followed_id, set()).add(follower_id)
+
+    def remove(self, follower_id, followed_id):
+        with self._lock:
+            for index, source, target in ((self._following, follower_id, followed_id),
+                                          (self._followers, followed_id, follower_id)):
+                neighbours = index.get(source)
+                if neighbours is not None:
+                    neighbours.discard(target)
+                    if not neighbours:
+                        del index[source]
+
+    def followers_count(self, user_id):
+        return len(self._followers.get(user_id, ()))
+
+    def following_count(self, user_id):
+        return len(self._following.get(user_id, ()))
+
+    def _page(self, index, user_id, after, limit):
+        """صفحه‌ای از شناسه‌ها به ترتیب صعودی بعد از after؛ خروجی: (ids, next_after)"""
+        with self._lock:
+            neighbours = list(index.get(user_id, ()))
+        if after is not None:
+            neighbours = [neighbour for neighbour in neighbours if neighbour > after]
+        page = heapq.nsmallest(limit + 1, neighbours)
+        if len(page) > limit:
+            return page[:limit], page[limit - 1]
+        return page, None
+
+    def followers(self, user_id, after=None, limit=20):
+        return self._page(self._followers, user_id, after, limit)
+
+    def following(self, user_id, after=None, limit=20):
+        return self._page(self._following, user_id, after, limit)
+
+    def suggestions(self, user_id, limit=10, fan_limit=200):
+        """پیشنهاد کاربر از دوستانِ دوستان
+
+        هر نامزد بر اساس تعداد دنبال‌شده‌های کاربر که او را دنبال می‌کنند
+        (دوستان مشترک) و سپس تعداد دنبال‌کنندگانش رتبه می‌گیرد. برای محدود
+        کردن هزینه حساب‌های پرمخاطب، از هر دنبال‌شده حداکثر fan_limit
+        همسایه خوانده می‌شود. اگر کاربر کسی را دنبال نمی‌کند، پرمخاطب‌ترین
+        کاربران پیشنهاد می‌شوند.
+        خروجی: لیست (user_id, mutual_count)
+        """
+        with self._lock:
+            following = self._following.get(user_id, set())
+            scores = {}
+            for followed_id in following:
+                for index, candidate in enumerate(self._following.get(followed_id, ())):
+                    if index >= fan_limit:
+                        break
+                    scores[candidate] = scores.get(candidate, 0) + 1
+            if not scores:
+                scores = {candidate: 0 for candidate in heapq.nlargest(
+                    limit + len(following) + 1, self._followers,
+                    key=lambda candidate: len(self._followers[candidate])
+                )}
+            candidates = [
+                (candidate, mutual, len(self._followers.get(candidate, ())))
+                for candidate, mutual in scores.items()
+                if candidate != user_id and candidate not in following
+            ]
+        best = heapq.nlargest(limit, candidates, key=lambda item: (item[1], item[2], -item[0]))
+        return [(candidate, mutual) for candidate, mutual, _ in best]
+
+
+class ResponseCache:
+    """کش پاسخ‌های GET با مهر نسخه
+
+    هر پاسخ به چند دامنه (مثلاً 'posts'، 'follows') وابسته است. مسیرهای
+    نوشتن با bump نسخه دامنه را بالا می‌برند و همه پاسخ‌های وابسته بی‌اعتبار
+    می‌شوند، بدون اینکه لازم باشد کلیدها را پیدا و حذف کنیم. max_age سقف
+    عمر هر پاسخ است تا نوشتن‌های پردازه‌های دیگر (که نسخه این پردازه را
+    بالا نمی‌برند) حداکثر همین‌قدر دیده نشوند.
+    """
+
+    def __init__(self, maxsize=2048, max_age=30):
+        self.max_age = max_age
+        self._entries = LRUCache(maxsize)
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def versions(self, scopes):
+        """مهر نسخه فعلی دامنه‌ها؛ پیش از ساخت پاسخ گرفته شود"""
+        with self._lock:
+            return tuple(self._versions.get(scope, 0) for scope in scopes)
+
+    def bump(self, *scopes):
+        with self._lock:
+            for scope in scopes:
+                self._versions[scope] = self._versions.get(scope, 0) + 1
+
+    def get(self, key, scopes, now):
+        """پاسخ ذخیره‌شده (body, etag, meta) اگر هنوز معتبر باشد؛ وگرنه None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stamp, created_at, body, etag, meta = entry
+        if stamp != self.versions(scopes) or now - created_at > self.max_age:
+            self._entries.pop(key)
+            return None
+        return body, etag, meta
+
+    def set(self, key, stamp, now, body, etag, meta=None):
+        """meta داده دلخواه همراه پاسخ است (مثلاً شناسه پست‌های داخل آن)"""
+        self._entries.set(key, (stamp, now, body, etag, meta))
+
+    def refresh(self, key, body, etag, meta):
+        """جایگزینی بدنه پاسخی که هنوز معتبر است، بدون تغییر مهر نسخه و زمان ساخت"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.set(key, entry[:2] + (body, etag, meta))
+
+    def clear(self):
+        self._entries.clear()
+
+
+class PostStats:
+    """آخرین شمارنده‌های پست‌هایی که در این پردازه تغییر کرده‌اند
+
+    لایک و کامنت کش پاسخ‌ها را بی‌اعتبار نمی‌کنند؛ مسیرهای نوشتن مقدار
+    تازه را اینجا ثبت می‌کنند و پاسخ کش‌شده هنگام سرو شدن با آن به‌روز
+    می‌شود. هر ثبت یک شماره ترتیبی می‌گیرد تا پاسخی که پس از ساخته شدنش
+    تغییری در پست‌هایش نبوده بدون parse دوباره سرو شود.
+    """
+
+    def __init__(self, maxsize=10000):
+        self._stats = LRUCache(maxsize)  # post_id -> (seq, {field: value})
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def seq(self):
+        """شماره آخرین ثبت؛ پیش از ساخت پاسخ گرفته شود"""
+        return self._seq
+
+    def update(self, post_id, **counts):
+        with self._lock:
+            self._seq += 1
+            previous = self._stats.get(post_id)
+            merged = dict(previous[1], **counts) if previous else counts
+            self._stats.set(post_id, (self._seq, merged))
+
+    def changed_since(self, post_ids, seq):
+        """شمارنده‌های پست‌هایی که بعد از seq ثبت شده‌اند: {post_id: {field: value}}"""
+        changed = {}
+        for post_id in post_ids:
+            entry = self._stats.get(post_id)
+            if entry is not None and entry[0] > seq:
+                changed[post_id] = entry[1]
+        return changed
+
+    def clear(self):
+        self._stats.clear()
@@ -0,0 +1,143 @@
+"""
+خط تولید نسخه‌های تصویر آپلودشده
+
+هر تصویر فقط یک‌بار decode می‌شود، بر اساس EXIF چرخانده می‌شود و سپس
+نسخه‌های با عرض ثابت (thumb, feed, full) در دو فرمت WebP و JPEG و بدون
+متادیتای EXIF ذخیره می‌شوند. کار روی ProcessPoolExecutor و خارج از
+thread درخواست انجام می‌شود. فایل اصلی هم پیش از ذخیره با strip_metadata
+بدون EXIF بازنویسی می‌شود، چون تا ساخته شدن نسخه‌ها همان سرو می‌شود.
+"""
+import io
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageOps
+
+# نام نسخه -> حداکثر عرض به پیکسل
+VARIANT_WIDTHS = {
+    'thumb': 320,
+    'feed': 1080,
+    'full': 2048,
+}
+
+# پسوند -> (فرمت Pillow، تنظیمات ذخیره)
+VARIANT_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+# GIF متحرک و ویدیوها بدون تغییر سرو می‌شوند
+PROCESSABLE_EXTENSIONS = {'png', 'jpg', 'jpeg'}
+
+EXIF_ORIENTATION = 0x0112
+
+
+def can_process(filename):
+    """آیا این فایل وارد خط تولید نسخه‌ها می‌شود"""
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in PROCESSABLE_EXTENSIONS
+
+
+def strip_metadata(stream):
+    """بازنویسی تصویر آپلودشده بدون EXIF (موقعیت GPS، مشخصات دوربین و ...)
+
+    چرخش EXIF روی پیکسل‌ها اعمال می‌شود و فقط پروفایل رنگ نگه داشته
+    می‌شود. JPEG بدون چرخش با همان جدول‌های کوانتیزه دوباره ذخیره می‌شود
+    تا کیفیتش افت نکند. خروجی: جریان بایت تصویر تمیز
+    """
+    output = io.BytesIO()
+    with Image.open(stream) as original:
+        pillow_format = original.format
+        icc_profile = original.info.get('icc_profile')
+        options = {'icc_profile': icc_profile} if icc_profile else {}
+        if original.getexif().get(EXIF_ORIENTATION, 1) == 1:
+            image = original
+            if pillow_format == 'JPEG':
+                options.update(quality='keep', subsampling='keep')
+        else:
+            image = ImageOps.exif_transpose(original)
+            if pillow_format == 'JPEG':
+                options.update(quality=95)
+        image.save(output, pillow_format, **options)
+    output.seek(0)
+    return output
+
+
+def render_variants(source_path, output_dir, stem, url_prefix):
+    """ساخت همه نسخه‌ها از یک فایل مبدا
+
+    خروجی: نقشه نسخه‌ها به شکل
+        {'thumb': {'width': 320, 'height': 320, 'webp': url, 'jpeg': url}, ...}
+    """
+    with Image.open(source_path) as original:
+        original.draft('RGB', (max(VARIANT_WIDTHS.values()),) * 2)
+        image = ImageOps.exif_transpose(original)
+        icc_profile = original.info.get('icc_profile')
+
+    if image.mode != 'RGB':
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background.paste(image, mask=image.getchannel('A'))
+        else:
+            background.paste(image.convert('RGB'))
+        image = background
+
+    variants = {}
+    # از بزرگ به کوچک تا هر نسخه از نسخه قبلی کوچک شود
+    for name, width in sorted(VARIANT_WIDTHS.items(), key=lambda item: -item[1]):
+        if image.width > width:
+            image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+
+        variant = {'width': image.width, 'height': image.height}
+        for extension, (pillow_format, options) in VARIANT_FORMATS.items():
+            filename = f'{stem}_{name}.{extension}'
+            image.save(os.path.join(output_dir, filename), pillow_format,
+                       icc_profile=icc_profile, **options)
+            variant[extension] = f'{url_prefix}/{filename}'
+        variants[name] = variant
+
+    return variants
+
+
+class ImagePipeline:
+    """صف پردازش تصویر روی ProcessPoolExecutor
+
+    با workers=0 کار به صورت همزمان در همان thread انجام می‌شود
+    (برای تست و اسکریپت‌ها).
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers or None)
+            return self._executor
+
+    def submit(self, source_path, output_dir, stem, url_prefix, on_done):
+        """ارسال یک تصویر برای پردازش؛ on_done(variants) پس از پایان صدا زده می‌شود
+
+        در صورت خطا on_done با None صدا زده می‌شود.
+        """
+        if self.workers == 0:
+            try:
+                variants = render_variants(source_path, output_dir, stem, url_prefix)
+            except Exception:
+                variants = None
+            on_done(variants)
+            return
+
+        future = self._get_executor().submit(render_variants, source_path, output_dir, stem, url_prefix)
+        future.add_done_callback(
+            lambda done: on_done(None if done.exception() else done.result())
+        )
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
@@ -1,42 +1,71 @@
 """
 فایل راه‌اندازی پایگاه داده
+
+    python init_db.py                       # جدول‌ها، مهاجرت‌ها و کاربران نمونه
+    python init_db.py --reset               # حذف فایل دیتابیس و ساخت دوباره
+    python init_db.py --users 100000 --posts 1000000 --likes 1000000 --messages 10000000
+
+با هر یک از پارامترهای اندازه، داده مصنوعی با همان تولیدکننده bench.py
+(bulk insert) به دیتابیس اضافه می‌شود. داده مصنوعی فقط روی دیتابیس خالی
+ساخته می‌شود چون شناسه‌های کاربران از پیش تعیین شده‌اند.
 """
 import os
-from app import app, db
-from models import User, Post, Story, Comment, Like, Message, ChatRoom
+import shutil
+import argparse
+
+from app import app, db, setup_schema, User, Post
+from bench import SIZE_KEYS, FIRST_USER_ID, seed_database
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='راه‌اندازی پایگاه داده InstaClone')
+    parser.add_argument('--reset', action='store_true', help='حذف فایل دیتابیس پیش از ساخت')
+    for key in SIZE_KEYS:
+        parser.add_argument(f"--{key.replace('_', '-')}", type=int, default=0)
+    return parser.parse_args()
+
 
-print("ایجاد پایگاه داده و جدول‌ها...")
+def main():
+    args = parse_args()
+    sizes = {key: getattr(args, key) for key in SIZE_KEYS}
 
-with app.app_context():
-    # حذف فایل پایگاه داده قدیمی (اگر وجود دارد)
-    if os.path.exists('social_media.db'):
-        print("حذف پایگاه داده قدیمی...")
-        os.remove('social_media.db')
-    
     # ایجاد پوشه‌های لازم
     os.makedirs('static/uploads/posts', exist_ok=True)
     os.makedirs('static/uploads/stories', exist_ok=True)
     os.makedirs('static/uploads/profiles', exist_ok=True)
-    
-    # ایجاد جدول‌ها
-    print("ایجاد جدول‌ها...")
-    db.create_all()
-    
-    # ایجاد چند کاربر نمونه
-    print("ایجاد کاربران نمونه...")
-    users = [
-        User(username='user1', display_name='کاربر یک'),
-        User(username='user2', display_name='کاربر دو'),
-        User(username='user3', display_name='کاربر سه'),
-        User(username='test', display_name='کاربر تست'),
-        User(username='admin', display_name='مدیر سیستم')
-    ]
-    
-    for user in users:
-        db.session.add(user)
-    
-    db.session.commit()
-    
-    print("پایگاه داده با موفقیت ایجاد شد!")
-    print(f"تعداد کاربران: {len(users)}")
-    print("نام‌کاربری‌های نمونه: user1, user2, user3, test, admin")
+
+    with app.app_context():
+        if args.reset:
+            # حذف فایل (نه فقط جدول‌ها) تا نسخه مهاجرت‌ها و جدول FTS هم از نو ساخته شوند
+            db.engine.dispose()
+            for path in (db.engine.url.database + suffix for suffix in ('', '-wal', '-shm')):
+                if os.path.exists(path):
+                    print(f"حذف {path}...")
+                    os.remove(path)
+            # ژورنال لایک به دیتابیس قبلی تعلق دارد و نباید روی دیتابیس تازه بازپخش شود
+            if app.config['LIKE_JOURNAL_DIR']:
+                shutil.rmtree(app.config['LIKE_JOURNAL_DIR'], ignore_errors=True)
+
+        print("ایجاد جدول‌ها و اجرای مهاجرت‌ها...")
+        setup_schema()
+
+        if any(sizes.values()):
+            if db.session.get(User, FIRST_USER_ID) or Post.query.first():
+                print("❌ داده مصنوعی فقط روی دیتابیس خالی ساخته می‌شود (از --reset استفاده کنید)")
+                return
+            sizes['users'] = max(sizes['users'], 2)
+            sizes['chat_users'] = sizes['chat_users'] or 50
+            print(f"📦 ساخت داده مصنوعی: {sizes}")
+            db.session.remove()
+            db.engine.dispose()  # آزاد کردن اتصال‌های WAL تا تولیدکننده قفل بگیرد
+            seed_database(db.engine.url.database, sizes, media_prefix=app.config['MEDIA_URL_PREFIX'])
+            with db.engine.begin() as connection:
+                connection.exec_driver_sql('ANALYZE')
+
+        print("پایگاه داده با موفقیت ایجاد شد!")
+        print(f"تعداد کاربران: {User.query.count()}")
+        print(f"تعداد پست‌ها: {Post.query.count()}")
+
+
+if __name__ == '__main__':
+    main()
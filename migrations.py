@@ -0,0 +1,226 @@
+"""
+اجراکننده سبک مهاجرت‌های پایگاه داده
+
+نسخه اسکیما در PRAGMA user_version نگه داشته می‌شود و هر مهاجرت فقط یک‌بار
+و به ترتیب، هرکدام در تراکنش خودش، روی دیتابیس‌های موجود اجرا می‌شود.
+دیتابیس‌های جدید با db.create_all() ساخته می‌شوند؛ مهاجرت‌ها طوری نوشته
+شده‌اند که روی اسکیمای تازه هم بی‌اثر و بی‌خطر باشند.
+"""
+from sqlalchemy import inspect, text
+
+from search import search_index_statements
+
+TIMELINE_MAX_ENTRIES = 500  # سقف تایم‌لاین هر کاربر
+FANOUT_FOLLOWER_LIMIT = 1000  # بیشتر از این دنبال‌کننده، fan-out هنگام خواندن
+
+# حساب‌های پرمخاطب که پست‌هایشان هنگام خواندن فید ادغام می‌شوند
+MARK_FANOUT_ON_READ_SQL = (
+    'UPDATE user SET fanout_on_read = 1 WHERE id IN ('
+    '  SELECT followed_id FROM follow GROUP BY followed_id HAVING COUNT(*) > :fanout_limit)'
+)
+
+# پر کردن تایم‌لاین هر کاربر با پست‌های خودش و حساب‌هایی که دنبال می‌کند
+# (همان چیزی که fan_out_post هنگام ساخت پست می‌نویسد)، حداکثر :limit ورودی
+BACKFILL_TIMELINES_SQL = (
+    'INSERT OR IGNORE INTO timeline_entry (user_id, post_id, author_id, created_at) '
+    'SELECT user_id, post_id, author_id, created_at FROM ('
+    '  SELECT user_id, post_id, author_id, created_at, ROW_NUMBER() OVER ('
+    '    PARTITION BY user_id ORDER BY created_at DESC, post_id DESC'
+    '  ) AS position FROM ('
+    '    SELECT follow.follower_id AS user_id, post.id AS post_id, post.user_id AS author_id, '
+    '           post.created_at AS created_at '
+    '    FROM follow JOIN post ON post.user_id = follow.followed_id '
+    '    JOIN user ON user.id = follow.followed_id WHERE user.fanout_on_read = 0 '
+    '    UNION ALL '
+    '    SELECT post.user_id, post.id, post.user_id, post.created_at FROM post'
+    '  )'
+    ') WHERE position <= :limit'
+)
+
+
+def add_missing_columns(connection, columns):
+    """افزودن ستون‌هایی که در جدول‌های قدیمی وجود ندارند
+
+    columns: لیست (table, column, ddl)
+    خروجی: مجموعه (table, column) هایی که اضافه شدند
+    """
+    inspector = inspect(connection)
+    tables = set(inspector.get_table_names())
+    added = set()
+    for table, name, ddl in columns:
+        if table not in tables:
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table)}
+        if name not in existing:
+            connection.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {name} {ddl}'))
+            added.add((table, name))
+    return added
+
+
+def migration_001_counters(connection):
+    """ستون‌های شمارنده پست و پرچم fanout_on_read کاربر"""
+    added = add_missing_columns(connection, [
+        ('post', 'likes_count', 'INTEGER NOT NULL DEFAULT 0'),
+        ('post', 'comments_count', 'INTEGER NOT NULL DEFAULT 0'),
+        ('user', 'fanout_on_read', 'BOOLEAN NOT NULL DEFAULT 0'),
+    ])
+    if ('post', 'likes_count') in added or ('post', 'comments_count') in added:
+        connection.execute(text(
+            'UPDATE post SET '
+            'likes_count = (SELECT COUNT(*) FROM "like" WHERE "like".post_id = post.id), '
+            'comments_count = (SELECT COUNT(*) FROM comment WHERE comment.post_id = post.id)'
+        ))
+
+
+INDEXES = [
+    ('ix_post_created', 'post', 'created_at, id'),
+    ('ix_post_user_created', 'post', 'user_id, created_at, id'),
+    ('ix_comment_post_created', 'comment', 'post_id, created_at'),
+    ('ix_like_post_user', '"like"', 'post_id, user_id'),
+    ('ix_story_created', 'story', 'created_at'),
+    ('ix_story_user_created', 'story', 'user_id, created_at'),
+    ('ix_message_pair_created', 'message', 'sender_id, receiver_id, created_at'),
+    ('ix_follow_followed', 'follow', 'followed_id, follower_id'),
+]
+
+
+def migration_002_indexes(connection):
+    """ایندکس‌های ترکیبی برای مسیرهای پرتکرار"""
+    for name, table, columns in INDEXES:
+        connection.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})'))
+    connection.execute(text('ANALYZE'))
+
+
+def migration_003_variants(connection):
+    """ستون نقشه نسخه‌های تصویر برای پست و استوری"""
+    add_missing_columns(connection, [
+        ('post', 'variants', 'TEXT'),
+        ('story', 'variants', 'TEXT'),
+    ])
+
+
+def migration_004_media_hash(connection):
+    """ارجاع پست و استوری به blob محتوامحور"""
+    add_missing_columns(connection, [
+        ('post', 'media_hash', 'VARCHAR(64)'),
+        ('story', 'media_hash', 'VARCHAR(64)'),
+    ])
+    connection.execute(text('CREATE INDEX IF NOT EXISTS ix_post_media_hash ON post (media_hash)'))
+    connection.execute(text('CREATE INDEX IF NOT EXISTS ix_story_media_hash ON story (media_hash)'))
+
+
+def migration_005_media_urls(connection):
+    """انتقال آدرس فایل‌های آپلودشده از /static/uploads به مسیر /media"""
+    for table, columns in (('post', ('image_url', 'variants')), ('story', ('media_url', 'variants')),
+                           ('media_blob', ('variants',))):
+        for column in columns:
+            connection.execute(text(
+                f"UPDATE {table} SET {column} = REPLACE({column}, '/static/uploads/', '/media/') "
+                f"WHERE {column} LIKE '%/static/uploads/%'"
+            ))
+
+
+def migration_006_conversations(connection):
+    """پر کردن جدول گفتگوها و شمارنده‌های خوانده‌نشده از پیام‌های موجود"""
+    if 'conversation' not in inspect(connection).get_table_names():
+        return
+    connection.execute(text(
+        'INSERT OR IGNORE INTO conversation (user_id, peer_id, unread_count) '
+        'SELECT user_id, peer_id, SUM(unread) FROM ('
+        '  SELECT receiver_id AS user_id, sender_id AS peer_id, '
+        '         CASE WHEN is_read THEN 0 ELSE 1 END AS unread FROM message '
+        '  UNION ALL '
+        '  SELECT sender_id, receiver_id, 0 FROM message'
+        ') GROUP BY user_id, peer_id'
+    ))
+
+
+def migration_007_inbox(connection):
+    """آخرین پیام هر گفتگو برای صندوق پیام"""
+    add_missing_columns(connection, [
+        ('conversation', 'last_message_id', 'INTEGER'),
+        ('conversation', 'last_sender_id', 'INTEGER'),
+        ('conversation', 'last_message', 'VARCHAR(200)'),
+        ('conversation', 'last_message_at', 'DATETIME'),
+    ])
+    if 'conversation' not in inspect(connection).get_table_names():
+        return
+    connection.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_conversation_user_recent '
+        'ON conversation (user_id, last_message_at, peer_id)'
+    ))
+    connection.execute(text(
+        'UPDATE conversation SET last_message_id = ('
+        '  SELECT MAX(id) FROM message WHERE '
+        '  (sender_id = conversation.user_id AND receiver_id = conversation.peer_id) OR '
+        '  (sender_id = conversation.peer_id AND receiver_id = conversation.user_id)'
+        ') WHERE last_message_id IS NULL'
+    ))
+    connection.execute(text(
+        'UPDATE conversation SET '
+        'last_sender_id = (SELECT sender_id FROM message WHERE id = conversation.last_message_id), '
+        'last_message = (SELECT SUBSTR(content, 1, 100) FROM message WHERE id = conversation.last_message_id), '
+        'last_message_at = (SELECT created_at FROM message WHERE id = conversation.last_message_id) '
+        'WHERE last_message_id IS NOT NULL AND last_message_at IS NULL'
+    ))
+
+
+def migration_008_message_pair_index(connection):
+    """ایندکس جفت مرتب کاربران برای صفحه‌بندی تاریخچه چت"""
+    connection.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_message_ordered_pair ON message '
+        '(min(sender_id, receiver_id), max(sender_id, receiver_id), id)'
+    ))
+
+
+def migration_009_user_search(connection):
+    """ایندکس FTS5 جستجوی کاربران با متن نرمال‌شده"""
+    for statement in search_index_statements():
+        connection.execute(text(statement))
+
+
+def migration_010_timelines(connection):
+    """ساخت تایم‌لاین فید دنبال‌شده‌ها از فالوها و پست‌های موجود"""
+    if 'timeline_entry' not in inspect(connection).get_table_names():
+        return
+    connection.execute(text(MARK_FANOUT_ON_READ_SQL), {'fanout_limit': FANOUT_FOLLOWER_LIMIT})
+    connection.execute(text(BACKFILL_TIMELINES_SQL), {'limit': TIMELINE_MAX_ENTRIES})
+
+
+MIGRATIONS = [
+    (1, 'شمارنده‌های پست و fanout_on_read', migration_001_counters),
+    (2, 'ایندکس‌های ترکیبی', migration_002_indexes),
+    (3, 'نسخه‌های تصویر', migration_003_variants),
+    (4, 'ذخیره‌سازی محتوامحور', migration_004_media_hash),
+    (5, 'آدرس‌های /media', migration_005_media_urls),
+    (6, 'گفتگوها و شمارنده خوانده‌نشده', migration_006_conversations),
+    (7, 'صندوق پیام', migration_007_inbox),
+    (8, 'ایندکس تاریخچه چت', migration_008_message_pair_index),
+    (9, 'ایندکس جستجوی کاربران', migration_009_user_search),
+    (10, 'تایم‌لاین فالوهای موجود', migration_010_timelines),
+]
+
+
+def get_schema_version(connection):
+    """نسخه فعلی اسکیما از PRAGMA user_version"""
+    return connection.execute(text('PRAGMA user_version')).scalar()
+
+
+def run_migrations(engine, log=print):
+    """اجرای مهاجرت‌های اجرانشده به ترتیب نسخه
+
+    خروجی: لیست نسخه‌هایی که اجرا شدند
+    """
+    with engine.connect() as connection:
+        current = get_schema_version(connection)
+
+    applied = []
+    for version, description, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        with engine.begin() as connection:
+            migrate(connection)
+            connection.execute(text(f'PRAGMA user_version = {version}'))
+        log(f"✅ مهاجرت {version} اجرا شد: {description}")
+        applied.append(version)
+    return applied
@@ -0,0 +1,130 @@
+"""
+ادغام رویدادهای پرتکرار بلادرنگ پیش از ارسال به room ها
+"""
+import threading
+import time
+
+
+class TypingCoalescer:
+    """وضعیت «در حال تایپ» هر کاربر در هر room
+
+    کلاینت با هر کلید یک رویداد typing می‌فرستد؛ این کلاس فقط تغییر وضعیت
+    (شروع/پایان تایپ) را برمی‌گرداند و برای هر (room, username) در هر
+    window ثانیه حداکثر یک رویداد می‌دهد. تغییری که داخل window رخ دهد
+    pending می‌ماند و sweep آن را پس از پایان window برمی‌گرداند. اگر
+    idle_timeout ثانیه رویداد تایپی نرسد، وضعیت خودبه‌خود به پایان تایپ
+    برمی‌گردد.
+
+    رویدادهای خروجی به شکل (room, username, is_typing, sid) هستند؛ sid
+    اتصالی است که نباید رویداد خودش را دریافت کند.
+    """
+
+    def __init__(self, window=0.5, idle_timeout=5):
+        self.window = window
+        self.idle_timeout = idle_timeout
+        self._states = {}  # (room, username) -> dict
+        self._lock = threading.Lock()
+
+    def update(self, room, username, is_typing, sid=None, now=None):
+        """ثبت رویداد کلاینت؛ خروجی رویدادی که همین حالا باید ارسال شود یا None"""
+        now = time.monotonic() if now is None else now
+        key = (room, username)
+        with self._lock:
+            state = self._states.get(key)
+            if state is None:
+                if not is_typing:
+                    return None
+                state = self._states[key] = {
+                    'typing': False, 'pending': None, 'last_emit': float('-inf'),
+                    'last_seen': now, 'sid': sid
+                }
+            state['sid'] = sid
+            if is_typing:
+                state['last_seen'] = now
+            if state['typing'] == is_typing:
+                state['pending'] = None
+                return None
+            if now - state['last_emit'] < self.window:
+                state['pending'] = is_typing
+                return None
+            return self._emit(key, state, is_typing, now)
+
+    def _emit(self, key, state, is_typing, now):
+        state['typing'] = is_typing
+        state['pending'] = None
+        state['last_emit'] = now
+        return (key[0], key[1], is_typing, state['sid'])
+
+    def sweep(self, now=None):
+        """رویدادهای pending که window آن‌ها گذشته و تایپ‌های منقضی‌شده"""
+        now = time.monotonic() if now is None else now
+        events = []
+        with self._lock:
+            for key, state in list(self._states.items()):
+                if state['typing'] and now - state['last_seen'] >= self.idle_timeout:
+                    events.append(self._emit(key, state, False, now))
+                elif state['pending'] is not None and now - state['last_emit'] >= self.window:
+                    if state['pending'] == state['typing']:
+                        state['pending'] = None
+                    else:
+                        events.append(self._emit(key, state, state['pending'], now))
+                elif not state['typing'] and state['pending'] is None \
+                        and now - state['last_emit'] >= self.window:
+                    del self._states[key]
+        return events
+
+    def drop_sid(self, sid, now=None):
+        """پایان تایپ همه room های یک اتصال قطع‌شده"""
+        now = time.monotonic() if now is None else now
+        events = []
+        with self._lock:
+            for key, state in list(self._states.items()):
+                if state['sid'] != sid:
+                    continue
+                if state['typing']:
+                    events.append(self._emit(key, state, False, now))
+                del self._states[key]
+        return events
+
+
+class EngagementCoalescer:
+    """ادغام به‌روزرسانی شمارنده‌های لایک/کامنت هر پست
+
+    اولین تغییر هر پست فوراً ارسال می‌شود (touch خروجی True دارد). تغییرهای
+    بعدی داخل window فقط پست را «کثیف» علامت می‌زنند و sweep پس از پایان
+    window شناسه آن را یک‌بار برمی‌گرداند تا شمارنده تازه از دیتابیس خوانده
+    و ارسال شود؛ پس هجوم لایک روی یک پست در هر window حداکثر دو رویداد
+    می‌سازد و آخرین رویداد همیشه مقدار نهایی را دارد.
+    """
+
+    def __init__(self, window=1.0):
+        self.window = window
+        self._states = {}  # post_id -> {'last_emit': float, 'dirty': bool}
+        self._lock = threading.Lock()
+
+    def touch(self, post_id, now=None):
+        """ثبت تغییر شمارنده؛ True یعنی همین حالا ارسال شود"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            state = self._states.get(post_id)
+            if state is None or now - state['last_emit'] >= self.window:
+                self._states[post_id] = {'last_emit': now, 'dirty': False}
+                return True
+            state['dirty'] = True
+            return False
+
+    def sweep(self, now=None):
+        """شناسه پست‌هایی که window آن‌ها گذشته و تغییر ارسال‌نشده دارند"""
+        now = time.monotonic() if now is None else now
+        due = []
+        with self._lock:
+            for post_id, state in list(self._states.items()):
+                if now - state['last_emit'] < self.window:
+                    continue
+                if state['dirty']:
+                    state['dirty'] = False
+                    state['last_emit'] = now
+                    due.append(post_id)
+                else:
+                    del self._states[post_id]
+        return due
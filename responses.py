@@ -0,0 +1,115 @@
+"""
+سریال‌سازی JSON، فشرده‌سازی و projection پاسخ‌های API
+
+orjson و brotli وابستگی اختیاری‌اند؛ اگر نصب نباشند provider پیش‌فرض
+Flask و فشرده‌سازی gzip استفاده می‌شوند.
+"""
+import gzip
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = {'application/json', 'text/html', 'text/css', 'application/javascript'}
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """provider JSON با orjson در صورت نصب بودن
+
+    رفتار همان DefaultJSONProvider است (sort_keys، ensure_ascii=False،
+    تبدیل datetime با تابع default) ولی سریال‌سازی در orjson انجام
+    می‌شود. فراخوانی با آرگومان‌های اضافه json.dumps به provider پیش‌فرض
+    سپرده می‌شود.
+    """
+
+    ensure_ascii = False
+
+    def _options(self):
+        options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        return options
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None or self._pretty():
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=self._options())
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+    def _pretty(self):
+        return self.compact is False or (self.compact is None and self._app.debug)
+
+
+def choose_encoding(accept_encoding):
+    """بهترین الگوریتم فشرده‌سازی پشتیبانی‌شده توسط کلاینت یا None"""
+    if brotli is not None and accept_encoding['br']:
+        return 'br'
+    if accept_encoding['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress_response(response, request, min_size, level=6):
+    """فشرده‌سازی بدنه پاسخ بزرگ‌تر از min_size بایت بر اساس Accept-Encoding
+
+    ETag پاسخ فشرده weak می‌شود چون بایت‌های بدنه دیگر همان محتوای
+    اصلی نیستند؛ If-None-Match با مقایسه weak همچنان 304 می‌دهد.
+    """
+    if response.mimetype not in COMPRESSIBLE_TYPES:
+        return response  # بدون Vary تا کش‌های میانی برای تصاویر و ... نسخه جدا نسازند
+    response.vary.add('Accept-Encoding')
+    if (response.status_code != 200 or response.direct_passthrough
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+    body = response.get_data()
+    if len(body) < min_size:
+        return response
+
+    if encoding == 'br':
+        response.set_data(brotli.compress(body, quality=min(level, 11)))
+    else:
+        response.set_data(gzip.compress(body, compresslevel=level, mtime=0))
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def parse_fields(value):
+    """مجموعه فیلدهای درخواست‌شده در ?fields=a,b یا None (همه فیلدها)
+
+    id همیشه نگه داشته می‌شود تا کلاینت بتواند آیتم‌ها را شناسایی کند.
+    """
+    fields = {name.strip() for name in (value or '').split(',') if name.strip()}
+    return fields | {'id'} if fields else None
+
+
+def project(items, fields):
+    """حذف فیلدهای درخواست‌نشده از هر آیتم لیست"""
+    if fields is None:
+        return items
+    return [{key: value for key, value in item.items() if key in fields} for item in items]
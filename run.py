@@ -2,12 +2,36 @@
 """
 InstaClone - Instagram Clone
 راه‌اندازی سرور شبکه اجتماعی
+
+حالت توسعه (یک پردازه با reloader):
+    python run.py
+
+حالت تولید (N پردازه eventlet پشت پراکسی sticky و backplane پیام):
+    python run.py --workers 4 [--message-queue redis://localhost:6379/0]
+
+بدون --message-queue یک broker محلی (backplane.py) راه‌اندازی می‌شود.
+پراکسی داخلی هر IP کلاینت را همیشه به یک پردازه می‌فرستد (مثل ip_hash در
+nginx) تا long-polling و وب‌سوکت Socket.IO به همان پردازه برسند. پشت nginx
+می‌توان پراکسی را کنار گذاشت و upstream را با ip_hash روی پورت‌های
+کارگرها (port+1 تا port+N) تنظیم کرد.
 """
 
 import os
 import sys
+import zlib
+import argparse
+import subprocess
+import multiprocessing
+
+# پردازه‌های کارگر باید پیش از import اپلیکیشن eventlet را patch کنند
+if '--worker-port' in sys.argv:
+    import eventlet
+    eventlet.monkey_patch()
+
 from app import app, socketio, db
 from app import User, Post, Story, Like, Comment, Follow, Message
+from migrations import run_migrations
+from backplane import DEFAULT_URL, run_broker
 
 def setup_database():
     """راه‌اندازی پایگاه داده"""
@@ -22,6 +46,7 @@ def setup_database():
     with app.app_context():
         db.create_all()
         print("✅ جداول دیتابیس ایجاد شدند")
+        run_migrations(db.engine)
         
         # ایجاد کاربران نمونه اگر وجود ندارند
         sample_users = ['user1', 'user2', 'user3', 'user4', 'user5']
@@ -66,8 +91,92 @@ def setup_database():
             db.session.commit()
             print("✅ پست‌های نمونه ایجاد شدند")
 
+def run_sticky_proxy(host, port, backends):
+    """پراکسی TCP که هر IP کلاینت را همیشه به یک کارگر می‌فرستد"""
+    import eventlet
+    
+    def pipe(source, target):
+        try:
+            while True:
+                data = source.recv(65536)
+                if not data:
+                    break
+                target.sendall(data)
+        except (OSError, EOFError):
+            pass
+        finally:
+            for sock in (source, target):
+                try:
+                    sock.shutdown(2)
+                except OSError:
+                    pass
+    
+    def handle(client, address):
+        backend = backends[zlib.crc32(address[0].encode()) % len(backends)]
+        try:
+            upstream = eventlet.connect(backend)
+        except OSError:
+            client.close()
+            return
+        eventlet.spawn_n(pipe, client, upstream)
+        pipe(upstream, client)
+    
+    eventlet.serve(eventlet.listen((host, port)), handle)
+
+def run_workers(args):
+    """اجرای چند پردازه کارگر با backplane پیام و پراکسی sticky"""
+    message_queue = args.message_queue
+    broker = None
+    if not message_queue:
+        message_queue = DEFAULT_URL
+        broker = multiprocessing.Process(target=run_broker, args=(message_queue,), daemon=True)
+        broker.start()
+        print(f"📡 broker محلی پیام روی {message_queue}")
+    
+    env = dict(os.environ, SOCKETIO_MESSAGE_QUEUE=message_queue)
+    # بافر لایک هر پردازه وضعیت خودش را دارد و پراکسی فقط بر اساس IP
+    # (نه کاربر) پخش می‌کند؛ پیش‌فرض در حالت چندپردازه‌ای ذخیره فوری است
+    env.setdefault('LIKE_BUFFER', '0')
+    ports = [args.port + i + 1 for i in range(args.workers)]
+    workers = [
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), '--worker-port', str(port)], env=env)
+        for port in ports
+    ]
+    print(f"👷 {len(workers)} کارگر روی پورت‌های {ports[0]} تا {ports[-1]}")
+    print(f"🔗 آدرس: http://localhost:{args.port}")
+    
+    try:
+        run_sticky_proxy(args.host, args.port, [('127.0.0.1', port) for port in ports])
+    except KeyboardInterrupt:
+        print("\n\n👋 سرور متوقف شد")
+    finally:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.wait()
+        if broker:
+            broker.terminate()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='InstaClone server')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=0,
+                        help='تعداد پردازه‌های کارگر؛ 0 یعنی حالت توسعه تک‌پردازه')
+    parser.add_argument('--message-queue', default=os.environ.get('SOCKETIO_MESSAGE_QUEUE'),
+                        help='redis://... یا local://host:port؛ پیش‌فرض broker محلی')
+    parser.add_argument('--worker-port', type=int, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
 def main():
     """تابع اصلی اجرا"""
+    args = parse_args()
+    
+    if args.worker_port:
+        socketio.run(app, host='127.0.0.1', port=args.worker_port,
+                     debug=False, use_reloader=False, log_output=False)
+        return
+    
     print("=" * 50)
     print("🚀 InstaClone - شبکه اجتماعی اینستاگرام‌مانند")
     print("=" * 50)
@@ -93,15 +202,20 @@ def main():
         print(f"📸 تعداد پست‌ها: {post_count}")
     
     print("\n🌐 سرور در حال راه‌اندازی...")
-    print("🔗 آدرس: http://localhost:5000")
+    
+    if args.workers:
+        run_workers(args)
+        return
+    
+    print(f"🔗 آدرس: http://localhost:{args.port}")
     print("🛑 برای توقف سرور، Ctrl+C را فشار دهید")
     print("=" * 50)
     
     # اجرای سرور
     try:
         socketio.run(app, 
-                    host='0.0.0.0', 
-                    port=5000, 
+                    host=args.host, 
+                    port=args.port, 
                     debug=True,
                     use_reloader=True,
                     log_output=True)
@@ -0,0 +1,99 @@
+"""
+نرمال‌سازی متن فارسی/عربی برای جستجو
+
+نویسه‌های معادل (ی/ي، ک/ك، ارقام فارسی و عربی) یکسان می‌شوند و نیم‌فاصله
+و کشیده حذف می‌شوند. همین نگاشت هم در پایتون (برای عبارت جستجو) و هم در
+SQL (در triggerهای ایندکس FTS5) اعمال می‌شود تا هر دو طرف یکسان باشند.
+"""
+import re
+
+SEARCH_TABLE = 'user_search'
+
+CHARACTER_MAP = {
+    '\u064a': '\u06cc',  # ي یای عربی -> ی
+    '\u0649': '\u06cc',  # ى الف مقصوره -> ی
+    '\u0643': '\u06a9',  # ك کاف عربی -> ک
+    '\u0629': '\u0647',  # ة -> ه
+    '\u200c': '',  # نیم‌فاصله (ZWNJ)
+    '\u0640': '',  # کشیده
+}
+for digit in range(10):
+    CHARACTER_MAP[chr(0x06F0 + digit)] = str(digit)  # ارقام فارسی
+    CHARACTER_MAP[chr(0x0660 + digit)] = str(digit)  # ارقام عربی
+
+_TRANSLATION = str.maketrans(CHARACTER_MAP)
+_TOKEN = re.compile(r'[^\W_]+')
+
+
+def normalize_text(value):
+    """نرمال‌سازی برای مقایسه: نگاشت نویسه‌ها و حروف کوچک"""
+    return (value or '').translate(_TRANSLATION).casefold()
+
+
+def tokenize(value):
+    """کلمات متن نرمال‌شده؛ مطابق جداکننده‌های tokenizer پیش‌فرض FTS5"""
+    return _TOKEN.findall(normalize_text(value))
+
+
+def match_query(value):
+    """عبارت MATCH برای FTS5: هر کلمه به صورت پیشوندی؛ None اگر کلمه‌ای نباشد"""
+    tokens = tokenize(value)
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def initial_match_query(value, column):
+    """عبارت MATCH برای مقدارهایی از column که با متن value شروع می‌شوند
+
+    کلمه‌ها پشت‌سرهم از ابتدای ستون (^) و کلمه آخر به صورت پیشوندی؛
+    None اگر کلمه‌ای نباشد.
+    """
+    tokens = tokenize(value)
+    if not tokens:
+        return None
+    phrase = ' + '.join(f'"{token}"' for token in tokens)
+    return f'{column} : ^ {phrase}*'
+
+
+def sql_normalize(expression):
+    """عبارت SQL معادل نگاشت نویسه‌ها (بدون تغییر حروف؛ tokenizer آن را انجام می‌دهد)"""
+    for source, target in CHARACTER_MAP.items():
+        expression = f"REPLACE({expression}, '{source}', '{target}')"
+    return expression
+
+
+def match_rank(query, username, display_name):
+    """رتبه تطابق: ۰ نام کاربری دقیق، ۱ پیشوند نام کاربری، ۲ پیشوند نام نمایشی، ۳ بقیه"""
+    query = normalize_text(query).strip()
+    username = normalize_text(username)
+    if username == query:
+        return 0
+    if username.startswith(query):
+        return 1
+    if normalize_text(display_name).startswith(query):
+        return 2
+    return 3
+
+
+def search_index_statements():
+    """دستورهای SQL ساخت جدول FTS5، triggerهای همگام‌سازی با جدول user و پر کردن اولیه"""
+    username = sql_normalize('new.username')
+    display_name = sql_normalize('new.display_name')
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+        f"username, display_name, tokenize='unicode61 remove_diacritics 2', prefix='1 2 3')",
+        f'CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_insert AFTER INSERT ON "user" BEGIN '
+        f'INSERT INTO {SEARCH_TABLE} (rowid, username, display_name) '
+        f'VALUES (new.id, {username}, {display_name}); END',
+        f'CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_update AFTER UPDATE OF username, display_name '
+        f'ON "user" BEGIN '
+        f'DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id; '
+        f'INSERT INTO {SEARCH_TABLE} (rowid, username, display_name) '
+        f'VALUES (new.id, {username}, {display_name}); END',
+        f'CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_delete AFTER DELETE ON "user" BEGIN '
+        f'DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id; END',
+        f'DELETE FROM {SEARCH_TABLE}',
+        f'INSERT INTO {SEARCH_TABLE} (rowid, username, display_name) '
+        f'SELECT id, {sql_normalize("username")}, {sql_normalize("display_name")} FROM "user"',
+    ]
@@ -0,0 +1,94 @@
+"""
+ذخیره‌سازی محتوامحور فایل‌های آپلودشده
+
+هر فایل هنگام نوشتن روی دیسک از SHA-256 عبور داده می‌شود و با نام همان
+هش در پوشه‌های دوسطحی (ab/cd/<hash>.<ext>) ذخیره می‌شود، بنابراین فایل‌های
+تکراری فقط یک‌بار روی دیسک نوشته می‌شوند. شمارش ارجاع‌ها در دیتابیس
+(جدول media_blob) نگه داشته می‌شود.
+"""
+import hashlib
+import os
+import tempfile
+from collections import namedtuple
+
+CHUNK_SIZE = 64 * 1024
+
+# فایل نوشته‌شده در پوشه موقت که هنوز جایگاه نهایی ندارد
+PendingBlob = namedtuple('PendingBlob', ['temp_path', 'digest', 'size'])
+
+
+class ContentStore:
+    """مخزن فایل‌ها بر اساس هش محتوا زیر یک پوشه ریشه"""
+
+    def __init__(self, root, url_prefix):
+        self.root = root
+        self.url_prefix = url_prefix
+        self.temp_dir = os.path.join(root, 'tmp')
+        os.makedirs(self.temp_dir, exist_ok=True)
+
+    @staticmethod
+    def relative_path(digest, extension):
+        """مسیر نسبی شاردشده بر اساس پیشوند هش"""
+        return os.path.join(digest[:2], digest[2:4], f'{digest}.{extension}')
+
+    def absolute_path(self, relative_path):
+        return os.path.join(self.root, relative_path)
+
+    def url_for(self, relative_path):
+        return f"{self.url_prefix}/{relative_path.replace(os.sep, '/')}"
+
+    def path_from_url(self, url):
+        """مسیر نسبی فایلی که این آدرس به آن اشاره می‌کند؛ None اگر خارج از مخزن باشد"""
+        prefix = self.url_prefix + '/'
+        if not url or not url.startswith(prefix):
+            return None
+        return url[len(prefix):].replace('/', os.sep)
+
+    def ingest(self, stream):
+        """نوشتن جریان ورودی در فایل موقت و محاسبه همزمان هش"""
+        hasher = hashlib.sha256()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=self.temp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                    hasher.update(chunk)
+                    temp_file.write(chunk)
+                    size += len(chunk)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        return PendingBlob(temp_path, hasher.hexdigest(), size)
+
+    def commit(self, pending, relative_path):
+        """انتقال فایل موقت به جایگاه نهایی؛ اگر از قبل وجود دارد فایل موقت حذف می‌شود
+
+        خروجی: True اگر فایل جدید نوشته شد
+        """
+        target = self.absolute_path(relative_path)
+        if os.path.exists(target):
+            self.discard(pending)
+            return False
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(pending.temp_path, target)
+        return True
+
+    def discard(self, pending):
+        """حذف فایل موقت (وقتی blob با همین هش از قبل ذخیره شده)"""
+        try:
+            os.remove(pending.temp_path)
+        except FileNotFoundError:
+            pass
+
+    def delete(self, relative_path):
+        """حذف فایل blob و پوشه‌های شارد خالی"""
+        target = self.absolute_path(relative_path)
+        try:
+            os.remove(target)
+        except FileNotFoundError:
+            return
+        for directory in (os.path.dirname(target), os.path.dirname(os.path.dirname(target))):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                break
@@ -0,0 +1,119 @@
+"""
+fixture های مشترک تست‌ها
+
+اپلیکیشن یک‌بار روی دیتابیس SQLite موقت import می‌شود؛ پوشه کاری هم به
+همان پوشه موقت منتقل می‌شود تا آپلودها و ژورنال لایک داخل مخزن نوشته نشوند.
+"""
+import io
+import itertools
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+from PIL import Image
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKDIR = tempfile.mkdtemp(prefix='instaclone-tests-')
+
+sys.path.insert(0, ROOT)
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORKDIR, 'test.db')}"
+os.environ['LIKE_JOURNAL_DIR'] = os.path.join(WORKDIR, 'like-journal')
+os.environ['IMAGE_PIPELINE_WORKERS'] = '0'
+os.chdir(WORKDIR)
+
+_unique = itertools.count(1)  # پسوند یکتای نام کاربران در کل اجرای تست‌ها
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import app as flask_app
+    flask_app.config['TESTING'] = True
+    flask_app.config['RESPONSE_CACHE_MAX_AGE'] = 0  # هر درخواست واقعاً اجرا شود
+    flask_app.test_client().get('/')  # create_tables
+    return flask_app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def db(app):
+    from app import db as database
+    with app.app_context():
+        yield database
+        database.session.remove()
+
+
+@pytest.fixture
+def factory(db):
+    """ساخت کاربر، پست، لایک و فالو با نام‌های یکتا برای هر تست"""
+    from app import User, Post, Like, Comment, Follow, load_follow_graph, fan_out_post
+
+    class Factory:
+        def user(self, prefix='u'):
+            user = User(username=f'{prefix}{next(_unique)}', display_name=prefix)
+            db.session.add(user)
+            db.session.commit()
+            return user
+
+        def post(self, author, created_at=None, likes=(), comments=0):
+            post = Post(user_id=author.id, image_url='/media/posts/x.jpg', caption='',
+                        created_at=created_at or datetime.utcnow(),
+                        likes_count=len(likes), comments_count=comments)
+            db.session.add(post)
+            db.session.flush()
+            db.session.add_all(Like(user_id=user.id, post_id=post.id) for user in likes)
+            db.session.add_all(Comment(user_id=author.id, post_id=post.id, text='c') for _ in range(comments))
+            fan_out_post(post)
+            db.session.commit()
+            return post
+
+        def posts(self, author, count, start=None, **kwargs):
+            """count پست با فاصله یک دقیقه، قدیمی به جدید"""
+            start = start or datetime.utcnow() - timedelta(days=1)
+            return [self.post(author, start + timedelta(minutes=i), **kwargs) for i in range(count)]
+
+        def follow(self, follower, followed):
+            db.session.add(Follow(follower_id=follower.id, followed_id=followed.id))
+            db.session.commit()
+            load_follow_graph()
+
+    return Factory()
+
+
+@pytest.fixture
+def upload(client):
+    """ساخت پست از طریق /api/posts/create؛ خروجی: پاسخ JSON"""
+    def create(author, image=None, filename='image.png'):
+        if image is None:
+            image = io.BytesIO()
+            Image.new('RGB', (4, 4)).save(image, 'PNG')
+            image.seek(0)
+        return client.post('/api/posts/create', data={'username': author.username, 'image': (image, filename)},
+                           content_type='multipart/form-data').get_json()
+    return create
+
+
+@pytest.fixture
+def count_queries():
+    """شمارش دستورهای SQL اجراشده داخل بلوک with"""
+    @contextmanager
+    def counter():
+        statements = []
+
+        def record(connection, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(Engine, 'before_cursor_execute', record)
+        try:
+            yield statements
+        finally:
+            event.remove(Engine, 'before_cursor_execute', record)
+    return counter
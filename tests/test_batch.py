@@ -0,0 +1,72 @@
+"""
+تست /api/batch و /api/bootstrap
+"""
+
+
+def batch(client, *requests):
+    return client.post('/api/batch', json={'requests': list(requests)})
+
+
+def test_batch_runs_gets_in_order(client, factory):
+    me, ali = factory.user('me'), factory.user('ali')
+    post = factory.post(ali)
+    response = batch(client,
+                     {'id': 'feed', 'path': f'/api/posts?username={me.username}&limit=1'},
+                     {'id': 'profile', 'path': f'/api/users/{ali.username}'},
+                     {'path': '/api/users/nobody-here-404'})
+    assert response.status_code == 200
+    responses = response.get_json()['responses']
+    assert [(item['id'], item['status']) for item in responses] == [('feed', 200), ('profile', 200), (2, 200)]
+    assert responses[0]['body']['posts'][0]['id'] == post.id
+    assert responses[1]['body']['user']['username'] == ali.username
+    assert responses[2]['body'] == {'success': False, 'error': 'کاربر یافت نشد'}
+    # همان بدنه endpoint مستقل
+    assert responses[1]['body'] == client.get(f'/api/users/{ali.username}').get_json()
+
+
+def test_batch_rejects_non_get_routes(client, factory):
+    me = factory.user('me')
+    item = batch(client, {'path': '/api/chat/send'}).get_json()['responses'][0]
+    assert item['status'] == 405
+    assert item['body']['success'] is False
+    follow = batch(client, {'path': f'/api/follow/{me.username}'}).get_json()['responses'][0]
+    assert follow['status'] == 405
+
+
+def test_batch_rejects_nested_batches_and_foreign_paths(client):
+    responses = batch(client,
+                      {'path': '/api/batch'},
+                      {'path': '/api/bootstrap?username=x'},
+                      {'path': '/media/x.jpg'},
+                      {'path': '/api/does-not-exist'},
+                      'not-an-object').get_json()['responses']
+    assert [item['status'] for item in responses] == [400, 400, 400, 404, 400]
+
+
+def test_batch_validates_the_request_list(app, client):
+    assert client.post('/api/batch', json={}).status_code == 400
+    assert client.post('/api/batch', json={'requests': []}).status_code == 400
+    too_many = [{'path': '/api/stories'}] * (app.config['BATCH_MAX_REQUESTS'] + 1)
+    assert client.post('/api/batch', json={'requests': too_many}).status_code == 400
+
+
+def test_bootstrap_sections_match_their_endpoints(client, factory):
+    me, ali = factory.user('me'), factory.user('ali')
+    factory.follow(me, ali)
+    factory.post(ali)
+    client.post('/api/chat/send', json={'sender': ali.username, 'receiver': me.username, 'content': 'سلام'})
+
+    payload = client.get(f'/api/bootstrap?username={me.username}&suggestions=3').get_json()
+    assert payload['success'] and payload['user']['username'] == me.username
+    assert payload['feed'] == client.get(f'/api/posts?username={me.username}').get_json()
+    assert payload['stories'] == client.get('/api/stories').get_json()
+    assert payload['suggestions'] == client.get(
+        f'/api/users/suggestions?username={me.username}&limit=3').get_json()
+    assert payload['unread'] == {'success': True, 'total_unread': 1, 'conversations': {ali.username: 1}}
+
+
+def test_bootstrap_creates_a_new_user(client):
+    payload = client.get('/api/bootstrap?username=bootstrap-newcomer').get_json()
+    assert payload['user']['username'] == 'bootstrap-newcomer'
+    assert payload['unread']['total_unread'] == 0
+    assert client.get('/api/bootstrap').get_json()['success'] is False
@@ -0,0 +1,108 @@
+"""
+تست پیام‌ها: شمارنده‌های خوانده‌نشده، رسید خواندن و صفحه‌بندی تاریخچه
+"""
+import pytest
+
+
+@pytest.fixture
+def emitted(monkeypatch):
+    """رویدادهای سوکت ارسال‌شده به شکل (event, data, to)"""
+    from app import socketio
+    events = []
+    monkeypatch.setattr(socketio, 'emit', lambda event, data, to=None, **kwargs: events.append((event, data, to)))
+    return events
+
+
+def send(client, sender, receiver, content='پیام'):
+    payload = client.post('/api/chat/send', json={
+        'sender': sender.username, 'receiver': receiver.username, 'content': content
+    }).get_json()
+    assert payload['success'], payload
+    return payload['message']['id']
+
+
+def unread(client, user):
+    payload = client.get(f'/api/chat/unread?username={user.username}').get_json()
+    return payload['total_unread'], payload['conversations']
+
+
+def read(client, reader, peer, **extra):
+    return client.post('/api/chat/read', json=dict(extra, username=reader.username, peer=peer.username)).get_json()
+
+
+# ============ خوانده‌نشده‌ها و رسید خواندن ============
+def test_unread_counters_follow_sends_and_reads(client, factory):
+    me, ali, sara = factory.user('me'), factory.user('ali'), factory.user('sara')
+    send(client, ali, me)
+    send(client, ali, me)
+    send(client, sara, me)
+    send(client, me, ali)  # پیام‌های خود کاربر شمرده نمی‌شوند
+    assert unread(client, me) == (3, {ali.username: 2, sara.username: 1})
+    assert unread(client, ali) == (1, {me.username: 1})
+
+    assert read(client, me, ali) == {'success': True, 'marked': 2, 'total_unread': 1}
+    assert unread(client, me) == (1, {sara.username: 1})
+    assert read(client, me, ali)['marked'] == 0
+
+
+def test_read_up_to_id_marks_only_older_messages(client, db, factory):
+    from app import Message
+    me, ali = factory.user('me'), factory.user('ali')
+    first, second, third = (send(client, ali, me, str(i)) for i in range(3))
+    assert read(client, me, ali, up_to_id=second)['marked'] == 2
+    assert unread(client, me) == (1, {ali.username: 1})
+    assert [db.session.get(Message, i).is_read for i in (first, second, third)] == [True, True, False]
+
+
+def test_read_receipt_goes_to_sender_and_counts_to_reader(client, factory, emitted):
+    me, ali = factory.user('me'), factory.user('ali')
+    last = send(client, ali, me)
+    emitted.clear()
+    read(client, me, ali)
+    assert ('messages_read', {'reader': me.username, 'peer': ali.username, 'up_to_id': last},
+            f'user:{ali.username}') in emitted
+    assert ('unread_update', {'peer': ali.username, 'unread_count': 0, 'total_unread': 0},
+            f'user:{me.username}') in emitted
+
+
+def test_nothing_to_read_sends_no_receipt(client, factory, emitted):
+    me, ali = factory.user('me'), factory.user('ali')
+    read(client, me, ali)
+    assert [event for event, _, _ in emitted] == ['unread_update']
+
+
+def test_inbox_shows_last_message_and_unread(client, factory):
+    me, ali = factory.user('me'), factory.user('ali')
+    send(client, me, ali, 'سلام')
+    send(client, ali, me, 'علیک')
+    entry = client.get(f'/api/chat/users?username={me.username}').get_json()['users'][0]
+    assert (entry['username'], entry['last_message'], entry['last_message_is_mine'], entry['unread_count']) == \
+        (ali.username, 'علیک', False, 1)
+
+
+# ============ صفحه‌بندی تاریخچه ============
+def history(client, me, peer, **params):
+    query = '&'.join(f'{key}={value}' for key, value in params.items())
+    payload = client.get(f'/api/chat/messages?user1={me.username}&user2={peer.username}&{query}').get_json()
+    assert payload['success'], payload
+    return [message['id'] for message in payload['messages']], payload['has_more']
+
+
+def test_history_pages_backwards_with_before(client, factory):
+    me, ali = factory.user('me'), factory.user('ali')
+    ids = [send(client, *((me, ali) if i % 2 else (ali, me)), str(i)) for i in range(7)]
+    send(client, me, factory.user('other'))  # گفتگوی دیگر در تاریخچه نمی‌آید
+
+    assert history(client, me, ali, limit=3) == (ids[4:], True)
+    assert history(client, me, ali, limit=3, before=ids[4]) == (ids[1:4], True)
+    assert history(client, me, ali, limit=3, before=ids[1]) == (ids[:1], False)
+    # ترتیب نام کاربران مهم نیست
+    assert history(client, ali, me, limit=3) == (ids[4:], True)
+
+
+def test_history_catches_up_with_since(client, factory):
+    me, ali = factory.user('me'), factory.user('ali')
+    ids = [send(client, ali, me, str(i)) for i in range(5)]
+    assert history(client, me, ali, since=ids[0], limit=3) == (ids[1:4], True)
+    assert history(client, me, ali, since=ids[3], limit=3) == (ids[4:], False)
+    assert history(client, me, ali, since=ids[4]) == ([], False)
@@ -0,0 +1,48 @@
+"""
+تست فالو/آنفالو و شمارش‌های گراف فالو
+"""
+
+
+def toggle(client, follower, target):
+    return client.post(f'/api/follow/{target.username}',
+                       json={'current_user': follower.username}).get_json()
+
+
+def profile(client, user, viewer):
+    return client.get(f'/api/users/{user.username}?viewer={viewer.username}').get_json()['user']
+
+
+def test_toggle_count_matches_profile_and_lists(client, factory):
+    star, fan, other = factory.user('star'), factory.user('fan'), factory.user('other')
+    factory.follow(other, star)
+
+    followed = toggle(client, fan, star)
+    assert followed == {'success': True, 'is_following': True, 'followers_count': 2}
+    user = profile(client, star, fan)
+    assert user['followers_count'] == 2 and user['is_following'] is True
+    followers = client.get(f'/api/users/{star.username}/followers').get_json()['users']
+    assert {entry['id'] for entry in followers} == {fan.id, other.id}
+
+    assert toggle(client, fan, star) == {'success': True, 'is_following': False, 'followers_count': 1}
+    assert profile(client, star, fan)['followers_count'] == 1
+
+
+def test_toggle_follows_database_when_graph_is_stale(client, db, factory):
+    from app import Follow, follow_graph
+    star, fan = factory.user('star'), factory.user('fan')
+    # پردازه دیگری فالو را ثبت کرده و گراف این پردازه هنوز خبر ندارد
+    db.session.add(Follow(follower_id=fan.id, followed_id=star.id))
+    db.session.commit()
+    assert follow_graph.followers_count(star.id) == 0
+
+    assert toggle(client, fan, star) == {'success': True, 'is_following': False, 'followers_count': 0}
+    assert db.session.scalar(db.select(Follow.id).where(Follow.follower_id == fan.id)) is None
+
+
+def test_mutual_flags(client, factory):
+    alice, bob = factory.user('alice'), factory.user('bob')
+    factory.follow(bob, alice)
+    assert profile(client, bob, alice)['follows_you'] is True
+    assert profile(client, bob, alice)['is_mutual'] is False
+    toggle(client, alice, bob)
+    assert profile(client, bob, alice)['is_mutual'] is True
@@ -0,0 +1,147 @@
+"""
+تست نوشتن گروهی پیام‌ها (GroupCommitWriter)
+"""
+import queue
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from writebehind import GroupCommitWriter
+
+
+class FakeSocketIO:
+    """جایگزین Socket.IO با صف و thread استاندارد پایتون
+
+    با run=False کار پس‌زمینه اجرا نمی‌شود تا صف فقط با drain خالی شود.
+    """
+
+    def __init__(self, run=True):
+        self.run = run
+        self.server = SimpleNamespace(eio=SimpleNamespace(
+            create_queue=queue.Queue, get_queue_empty_exception=lambda: queue.Empty
+        ))
+
+    def start_background_task(self, target):
+        if self.run:
+            threading.Thread(target=target, daemon=True).start()
+
+
+class Acks:
+    """جمع‌آوری on_durable ها و انتظار برای رسیدن همه"""
+
+    def __init__(self, expected):
+        self.results = []
+        self._done = threading.Event()
+        self._expected = expected
+        self._lock = threading.Lock()
+
+    def __call__(self, item):
+        def on_durable(result, error):
+            with self._lock:
+                self.results.append((item, result, error))
+                if len(self.results) == self._expected:
+                    self._done.set()
+        return on_durable
+
+    def wait(self):
+        assert self._done.wait(5), self.results
+        return self.results
+
+
+def test_items_queued_during_a_commit_share_the_next_batch():
+    batches, started, release = [], threading.Event(), threading.Event()
+
+    def flush(items):
+        batches.append(list(items))
+        if len(batches) == 1:
+            started.set()
+            release.wait(5)  # commit اول کند است
+        return [item * 10 for item in items]
+
+    writer = GroupCommitWriter(FakeSocketIO(), flush, max_batch=100, max_delay=0.01)
+    acks = Acks(6)
+    writer.submit(0, acks(0))
+    assert started.wait(5)
+    for item in range(1, 6):
+        writer.submit(item, acks(item))
+    release.set()
+    results = acks.wait()
+    assert batches == [[0], [1, 2, 3, 4, 5]]
+    assert sorted(results) == [(item, item * 10, None) for item in range(6)]
+
+
+def test_ack_comes_after_flush_returns():
+    events = []
+    done = threading.Event()
+
+    def flush(items):
+        events.append('flush')
+        return items
+
+    def on_durable(result, error):
+        events.append(('ack', result, error))
+        done.set()
+
+    GroupCommitWriter(FakeSocketIO(), flush).submit('m', on_durable)
+    assert done.wait(5)
+    assert events == ['flush', ('ack', 'm', None)]
+
+
+def test_failed_flush_acks_every_item_with_the_error():
+    failure = RuntimeError('database is locked')
+    calls = []
+
+    def flush(items):
+        calls.append(list(items))
+        if len(calls) == 1:
+            raise failure
+        return items
+
+    writer = GroupCommitWriter(FakeSocketIO(run=False), flush, max_batch=10)
+    acks = Acks(2)
+    writer.submit('a', acks('a'))
+    writer.submit('b', acks('b'))
+    writer.drain()
+    assert acks.wait() == [('a', None, failure), ('b', None, failure)]
+
+    # خطای یک دسته نوشتن بعدی را متوقف نمی‌کند
+    later = Acks(1)
+    writer.submit('c', later('c'))
+    writer.drain()
+    assert later.wait() == [('c', 'c', None)]
+
+
+def test_drain_respects_max_batch_and_survives_callback_errors():
+    batches = []
+
+    def flush(items):
+        batches.append(list(items))
+        return items
+
+    def broken(result, error):
+        raise ValueError('callback bug')
+
+    writer = GroupCommitWriter(FakeSocketIO(run=False), flush, max_batch=2)
+    acks = Acks(4)
+    writer.submit(0, broken)
+    for item in range(1, 5):
+        writer.submit(item, acks(item))
+    writer.drain()
+    assert batches == [[0, 1], [2, 3], [4]]
+    assert [result for _, result, _ in acks.wait()] == [1, 2, 3, 4]
+
+
+def test_drain_before_start_is_a_no_op():
+    GroupCommitWriter(FakeSocketIO(), lambda items: pytest.fail('flush')).drain()
+
+
+def test_chat_send_returns_after_the_message_is_stored(client, db, factory):
+    from app import Message
+    sender, receiver = factory.user('sender'), factory.user('receiver')
+    payload = client.post('/api/chat/send', json={
+        'sender': sender.username, 'receiver': receiver.username, 'content': 'سلام'
+    }).get_json()
+    assert payload['success'], payload
+    stored = db.session.get(Message, payload['message']['id'])
+    assert (stored.sender_id, stored.receiver_id, stored.content) == (sender.id, receiver.id, 'سلام')
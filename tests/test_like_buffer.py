@@ -0,0 +1,202 @@
+"""
+تست بافر لایک، ژورنال و بازیابی آن پس از crash
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from writebehind import LikeBuffer, LikeJournal
+
+
+class FakeStore:
+    """write ساختگی: وضعیت لایک‌ها و checkpoint ها در حافظه"""
+
+    def __init__(self, liked=(), counts=None):
+        self.liked = set(liked)
+        self.counts = dict(counts or {})
+        self.checkpoints = {}
+        self.calls = []
+
+    def load(self, user_id, post_id):
+        return lambda: (self.counts.get(post_id, 0), (user_id, post_id) in self.liked)
+
+    def write(self, changes, checkpoints):
+        self.calls.append(changes)
+        for user_id, post_id, _, liked, _ in changes:
+            (self.liked.add if liked else self.liked.discard)((user_id, post_id))
+            self.counts[post_id] = self.counts.get(post_id, 0) + (1 if liked else -1)
+        self.checkpoints.update(checkpoints)
+        return {post_id: self.counts[post_id] for _, post_id, _, _, _ in changes}
+
+
+def dead_writer(directory, *states):
+    """ژورنال پردازه‌ای که تغییرها را نوشته و بدون flush مرده است (قفلش آزاد شده)"""
+    journal = LikeJournal(directory)
+    for user_id, post_id, durable, liked in states:
+        journal.append(user_id, post_id, durable, liked)
+    journal._file.close()
+    return journal
+
+
+# ============ LikeBuffer ============
+def test_toggle_answers_from_memory_and_flushes_net_changes(tmp_path):
+    store = FakeStore(counts={10: 4})
+    buffer = LikeBuffer(LikeJournal(str(tmp_path)))
+    assert buffer.toggle(1, 10, store.load(1, 10)) == (True, 5)
+    assert buffer.toggle(2, 10, store.load(2, 10)) == (True, 6)
+    assert buffer.toggle(2, 10, store.load(2, 10)) == (False, 5)
+    assert store.calls == []
+
+    assert buffer.flush(store.write) == 1
+    assert store.calls == [[(1, 10, False, True, None)]]
+    assert store.liked == {(1, 10)} and store.counts[10] == 5
+    assert buffer.pending_delta(10) == 0
+    assert list(tmp_path.iterdir()) == []  # segment های commit‌شده حذف می‌شوند
+
+
+def test_missing_post_is_not_buffered():
+    buffer = LikeBuffer()
+    assert buffer.toggle(1, 99, lambda: None) is None
+    assert buffer.flush(FakeStore().write) == 0
+
+
+def test_failed_flush_keeps_changes_for_retry(tmp_path):
+    store = FakeStore()
+    buffer = LikeBuffer(LikeJournal(str(tmp_path)))
+    buffer.toggle(1, 10, store.load(1, 10))
+
+    def broken(changes, checkpoints):
+        raise RuntimeError('disk full')
+
+    with pytest.raises(RuntimeError):
+        buffer.flush(broken)
+    assert buffer.pending_delta(10) == 1
+    assert buffer.flush(store.write) == 1
+    assert store.liked == {(1, 10)}
+
+
+def test_overlay_liked_applies_unflushed_state():
+    store = FakeStore(liked={(1, 11)}, counts={11: 1})
+    buffer = LikeBuffer()
+    buffer.toggle(1, 10, store.load(1, 10))
+    buffer.toggle(1, 11, store.load(1, 11))
+    assert buffer.overlay_liked(1, [10, 11, 12], {11}) == {10}
+
+
+# ============ LikeJournal ============
+def test_recover_replays_uncommitted_segments_of_dead_writers(tmp_path):
+    dead = dead_writer(str(tmp_path), (1, 10, False, True), (2, 10, False, True), (2, 10, False, False))
+    store = FakeStore()
+    assert LikeBuffer(LikeJournal(str(tmp_path))).recover(store.write, {}) == 1
+    assert store.liked == {(1, 10)}
+    assert [(u, p, d, l) for u, p, d, l, _ in store.calls[0]] == [(1, 10, False, True)]
+    assert store.checkpoints == {dead.writer: 1}
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_recover_skips_segments_covered_by_checkpoint(tmp_path):
+    dead = dead_writer(str(tmp_path), (1, 10, False, True))
+    store = FakeStore()
+    assert LikeBuffer(LikeJournal(str(tmp_path))).recover(store.write, {dead.writer: 1}) == 0
+    assert store.calls == [] and list(tmp_path.iterdir()) == []
+
+
+def test_recover_leaves_live_writers_alone(tmp_path):
+    live = LikeJournal(str(tmp_path))
+    live.append(1, 10, False, True)
+    store = FakeStore()
+    assert LikeBuffer(LikeJournal(str(tmp_path))).recover(store.write, {}) == 0
+    assert live.writers() == {live.writer}
+
+
+def test_replay_ignores_torn_last_line(tmp_path):
+    dead = dead_writer(str(tmp_path), (1, 10, False, True))
+    with open(tmp_path / f'{dead.writer}-000001.log', 'a', encoding='ascii') as segment:
+        segment.write('2 10 0 1')
+    segments = LikeJournal(str(tmp_path)).orphaned()
+    assert list(LikeJournal.replay(segments)) == [(1, 10)]
+    LikeJournal.discard(segments)
+
+
+# ============ ادغام با اپلیکیشن ============
+@pytest.fixture
+def like_app(app, db):
+    from app import flush_like_buffer
+    assert app.config['LIKE_BUFFER']
+    yield app
+    flush_like_buffer()  # بافر سراسری برای تست بعدی خالی بماند
+
+
+def like(client, post, user):
+    return client.post(f'/api/posts/{post.id}/like', json={'username': user.username}).get_json()
+
+
+def stored_likes(db, post):
+    from app import Like, Post
+    db.session.expire_all()
+    users = set(db.session.scalars(db.select(Like.user_id).where(Like.post_id == post.id)))
+    return users, db.session.get(Post, post.id).likes_count
+
+
+def test_like_is_answered_before_it_is_flushed(like_app, client, db, factory):
+    from app import flush_like_buffer
+    author, fan = factory.user('author'), factory.user('fan')
+    post = factory.post(author)
+    assert like(client, post, fan) == {'success': True, 'is_liked': True, 'likes_count': 1}
+    assert stored_likes(db, post) == (set(), 0)
+    flush_like_buffer()
+    assert stored_likes(db, post) == ({fan.id}, 1)
+    assert like(client, post, fan) == {'success': True, 'is_liked': False, 'likes_count': 0}
+    flush_like_buffer()
+    assert stored_likes(db, post) == (set(), 0)
+
+
+def test_like_unknown_post_fails(like_app, client, factory):
+    response = client.post('/api/posts/999999999/like', json={'username': factory.user('ghost').username})
+    assert response.get_json()['success'] is False
+
+
+def test_startup_recovery_replays_dead_worker_journal(like_app, db, factory):
+    from app import LikeJournalCheckpoint, recover_like_journal
+    author, fan = factory.user('author'), factory.user('fan')
+    post = factory.post(author)
+    dead = dead_writer(like_app.config['LIKE_JOURNAL_DIR'], (fan.id, post.id, False, True))
+    recover_like_journal()
+    assert stored_likes(db, post) == ({fan.id}, 1)
+    # writer دیگر segment ندارد، پس checkpoint آن هم پاک شده است
+    assert db.session.get(LikeJournalCheckpoint, dead.writer) is None
+
+
+def test_startup_recovery_skips_committed_segment(like_app, db, factory):
+    from app import LikeJournalCheckpoint, recover_like_journal
+    author, fan = factory.user('author'), factory.user('fan')
+    post = factory.post(author)
+    dead = dead_writer(like_app.config['LIKE_JOURNAL_DIR'], (fan.id, post.id, False, True))
+    db.session.add(LikeJournalCheckpoint(writer=dead.writer, seq=1))
+    db.session.commit()
+    recover_like_journal()
+    assert stored_likes(db, post) == (set(), 0)
+    assert dead.writer not in dead.writers()
+
+
+def test_replay_does_not_undo_a_newer_like(like_app, db, factory):
+    from app import Like, recover_like_journal
+    author, fan = factory.user('author'), factory.user('fan')
+    post = factory.post(author)
+    # ژورنال مرده می‌گوید fan آنلایک کرده، اما بعد از آن پردازه دیگری لایک تازه ثبت کرده
+    dead_writer(like_app.config['LIKE_JOURNAL_DIR'], (fan.id, post.id, True, False))
+    db.session.add(Like(user_id=fan.id, post_id=post.id, created_at=datetime.utcnow() + timedelta(seconds=5)))
+    post.likes_count = 1
+    db.session.commit()
+    recover_like_journal()
+    assert stored_likes(db, post) == ({fan.id}, 1)
+
+
+def test_write_through_without_buffer(like_app, client, db, factory, monkeypatch):
+    monkeypatch.setitem(like_app.config, 'LIKE_BUFFER', False)
+    author, fan = factory.user('author'), factory.user('fan')
+    post = factory.post(author)
+    assert like(client, post, fan) == {'success': True, 'is_liked': True, 'likes_count': 1}
+    assert stored_likes(db, post) == ({fan.id}, 1)
+    assert like(client, post, fan) == {'success': True, 'is_liked': False, 'likes_count': 0}
+    assert stored_likes(db, post) == (set(), 0)
@@ -0,0 +1,62 @@
+"""
+تست حذف متادیتای EXIF از تصویرهای آپلودشده
+"""
+import io
+
+from PIL import Image
+
+from imaging import EXIF_ORIENTATION, strip_metadata
+
+GPS_INFO = 0x8825
+CAMERA_MAKE = 0x010F
+
+
+def jpeg_with_exif(orientation=6, size=(40, 20)):
+    """JPEG با موقعیت GPS، نام دوربین و چرخش EXIF"""
+    exif = Image.Exif()
+    exif[CAMERA_MAKE] = 'TestCam'
+    exif[EXIF_ORIENTATION] = orientation
+    exif[GPS_INFO] = {1: 'N', 2: (35.0, 41.0, 0.0)}
+    stream = io.BytesIO()
+    Image.new('RGB', size, (200, 30, 30)).save(stream, 'JPEG', exif=exif)
+    stream.seek(0)
+    return stream
+
+
+def assert_clean(data):
+    with Image.open(io.BytesIO(data)) as image:
+        assert 'exif' not in image.info
+        assert dict(image.getexif()) == {}
+        return image.size
+
+
+def test_strip_metadata_applies_orientation():
+    cleaned = strip_metadata(jpeg_with_exif(orientation=6)).read()
+    assert assert_clean(cleaned) == (20, 40)
+
+
+def test_strip_metadata_keeps_upright_jpeg_size():
+    cleaned = strip_metadata(jpeg_with_exif(orientation=1)).read()
+    assert assert_clean(cleaned) == (40, 20)
+
+
+def test_strip_metadata_png():
+    stream = io.BytesIO()
+    exif = Image.Exif()
+    exif[CAMERA_MAKE] = 'TestCam'
+    Image.new('RGBA', (8, 8)).save(stream, 'PNG', exif=exif)
+    stream.seek(0)
+    assert assert_clean(strip_metadata(stream).read()) == (8, 8)
+
+
+def test_uploaded_original_is_served_without_exif(client, db, factory, upload):
+    from app import MediaBlob, Post, media_store
+    response = upload(factory.user('camera'), jpeg_with_exif(), 'photo.jpg')
+    assert response['success'], response
+
+    post = db.session.get(Post, response['post']['id'])
+    blob = db.session.get(MediaBlob, post.media_hash)
+    original = client.get(media_store.url_for(blob.path))
+    assert original.status_code == 200
+    assert assert_clean(original.data) == (20, 40)
+    assert assert_clean(client.get(post.image_url).data) == (20, 40)
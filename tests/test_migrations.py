@@ -0,0 +1,116 @@
+"""
+تست مهاجرت‌ها روی دیتابیسی با اسکیمای نسخه اولیه
+"""
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from migrations import MIGRATIONS, run_migrations
+
+BASELINE_SCHEMA = '''
+CREATE TABLE user (
+    id INTEGER PRIMARY KEY, username VARCHAR(80) NOT NULL UNIQUE, display_name VARCHAR(120) NOT NULL,
+    bio TEXT, profile_pic VARCHAR(200), created_at DATETIME);
+CREATE TABLE post (
+    id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES user (id),
+    image_url VARCHAR(200) NOT NULL, caption TEXT, created_at DATETIME);
+CREATE TABLE story (
+    id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES user (id),
+    media_url VARCHAR(200) NOT NULL, media_type VARCHAR(10), created_at DATETIME);
+CREATE TABLE follow (
+    id INTEGER PRIMARY KEY, follower_id INTEGER NOT NULL REFERENCES user (id),
+    followed_id INTEGER NOT NULL REFERENCES user (id), created_at DATETIME,
+    CONSTRAINT unique_follow UNIQUE (follower_id, followed_id));
+CREATE TABLE message (
+    id INTEGER PRIMARY KEY, sender_id INTEGER NOT NULL REFERENCES user (id),
+    receiver_id INTEGER NOT NULL REFERENCES user (id), content TEXT NOT NULL, is_read BOOLEAN,
+    created_at DATETIME);
+CREATE TABLE "like" (
+    id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES user (id),
+    post_id INTEGER NOT NULL REFERENCES post (id), created_at DATETIME,
+    CONSTRAINT unique_like UNIQUE (user_id, post_id));
+CREATE TABLE comment (
+    id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES user (id),
+    post_id INTEGER NOT NULL REFERENCES post (id), text TEXT NOT NULL, created_at DATETIME);
+
+INSERT INTO user (id, username, display_name) VALUES
+    (1, 'ali', 'علي رضايي'), (2, 'sara', 'سارا'), (3, 'reza', 'رضا');
+INSERT INTO follow (follower_id, followed_id, created_at) VALUES
+    (2, 1, '2024-01-01 00:00:00'), (3, 1, '2024-01-01 00:00:00');
+INSERT INTO post (id, user_id, image_url, caption, created_at) VALUES
+    (1, 1, '/static/uploads/old.jpg', 'اول', '2024-01-02 00:00:00'),
+    (2, 1, '/static/uploads/new.jpg', 'دوم', '2024-01-03 00:00:00'),
+    (3, 2, '/static/uploads/sara.jpg', NULL, '2024-01-04 00:00:00');
+INSERT INTO story (user_id, media_url, media_type, created_at) VALUES
+    (1, '/static/uploads/story.jpg', 'image', '2024-01-03 00:00:00');
+INSERT INTO "like" (user_id, post_id, created_at) VALUES
+    (2, 1, '2024-01-05 00:00:00'), (3, 1, '2024-01-05 00:00:00'), (2, 2, '2024-01-05 00:00:00');
+INSERT INTO comment (user_id, post_id, text, created_at) VALUES (3, 2, 'عالی', '2024-01-05 00:00:00');
+INSERT INTO message (id, sender_id, receiver_id, content, is_read, created_at) VALUES
+    (1, 2, 1, 'سلام', 1, '2024-01-06 00:00:00'),
+    (2, 1, 2, 'سلام سارا', 0, '2024-01-06 00:01:00'),
+    (3, 2, 1, 'خوبی؟', 0, '2024-01-06 00:02:00');
+'''
+
+
+@pytest.fixture
+def upgraded(app, tmp_path):
+    """دیتابیس اولیه که با create_all و run_migrations به‌روز شده"""
+    from app import db
+    path = tmp_path / 'baseline.db'
+    with sqlite3.connect(path) as connection:
+        connection.executescript(BASELINE_SCHEMA)
+    engine = create_engine(f'sqlite:///{path}')
+    db.metadata.create_all(engine)
+    applied = run_migrations(engine, log=lambda message: None)
+    yield engine, applied
+    engine.dispose()
+
+
+def rows(engine, sql):
+    with engine.connect() as connection:
+        return [tuple(row) for row in connection.execute(text(sql))]
+
+
+def test_every_migration_runs_once(upgraded):
+    engine, applied = upgraded
+    assert applied == [version for version, _, _ in MIGRATIONS]
+    assert rows(engine, 'PRAGMA user_version') == [(len(MIGRATIONS),)]
+    assert run_migrations(engine, log=lambda message: None) == []
+
+
+def test_post_counters_are_filled(upgraded):
+    engine, _ = upgraded
+    assert rows(engine, 'SELECT id, likes_count, comments_count FROM post ORDER BY id') == [
+        (1, 2, 0), (2, 1, 1), (3, 0, 0)
+    ]
+
+
+def test_upload_urls_move_to_media(upgraded):
+    engine, _ = upgraded
+    assert rows(engine, 'SELECT image_url FROM post ORDER BY id') == [
+        ('/media/old.jpg',), ('/media/new.jpg',), ('/media/sara.jpg',)
+    ]
+    assert rows(engine, 'SELECT media_url FROM story') == [('/media/story.jpg',)]
+
+
+def test_conversations_summarize_existing_messages(upgraded):
+    engine, _ = upgraded
+    assert rows(engine, (
+        'SELECT user_id, peer_id, unread_count, last_message_id, last_sender_id, last_message '
+        'FROM conversation ORDER BY user_id'
+    )) == [(1, 2, 1, 3, 2, 'خوبی؟'), (2, 1, 1, 3, 2, 'خوبی؟')]
+
+
+def test_timelines_are_backfilled_from_follows(upgraded):
+    engine, _ = upgraded
+    timelines = rows(engine, 'SELECT user_id, post_id FROM timeline_entry ORDER BY user_id, post_id')
+    assert timelines == [(1, 1), (1, 2), (2, 1), (2, 2), (2, 3), (3, 1), (3, 2)]
+
+
+def test_search_index_covers_existing_users(upgraded):
+    engine, _ = upgraded
+    # نام نمایشی با ی عربی ذخیره شده و باید با ی فارسی پیدا شود
+    assert rows(engine, "SELECT rowid FROM user_search WHERE user_search MATCH '\"رضایی\"*'") == [(1,)]
+    assert rows(engine, "SELECT rowid FROM user_search WHERE user_search MATCH 'username:\"sa\"*'") == [(2,)]
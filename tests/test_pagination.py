@@ -0,0 +1,70 @@
+"""
+تست صفحه‌بندی keyset فید، پروفایل و صندوق پیام
+"""
+from datetime import datetime, timedelta
+
+
+def walk(client, url, key='posts'):
+    """پیمایش همه صفحه‌ها با next_cursor؛ خروجی: لیست شناسه‌ها به ترتیب"""
+    ids, cursor, pages = [], '', 0
+    while True:
+        payload = client.get(f'{url}&cursor={cursor}').get_json()
+        assert payload['success'], payload
+        ids += [item['id'] for item in payload[key]]
+        pages += 1
+        cursor = payload['next_cursor']
+        if not cursor:
+            return ids, pages
+
+
+def test_profile_pages_cover_every_post_once_newest_first(client, factory):
+    author = factory.user('grid')
+    posts = factory.posts(author, 7)
+    ids, pages = walk(client, f'/api/users/{author.username}?limit=3')
+    assert ids == [post.id for post in reversed(posts)]
+    assert pages == 3
+
+
+def test_equal_timestamps_are_ordered_by_id(client, factory):
+    author = factory.user('tie')
+    moment = datetime.utcnow() - timedelta(hours=1)
+    posts = [factory.post(author, moment) for _ in range(5)]
+    ids, _ = walk(client, f'/api/users/{author.username}?limit=2')
+    assert ids == sorted((post.id for post in posts), reverse=True)
+
+
+def test_new_posts_do_not_shift_later_pages(client, factory):
+    author = factory.user('shift')
+    posts = factory.posts(author, 4)
+    first = client.get(f'/api/users/{author.username}?limit=2').get_json()
+    factory.post(author)  # پست جدید بعد از گرفتن صفحه اول
+    second = client.get(f'/api/users/{author.username}?limit=2&cursor={first["next_cursor"]}').get_json()
+    assert [post['id'] for post in second['posts']] == [posts[1].id, posts[0].id]
+
+
+def test_following_feed_pages(client, factory):
+    viewer, author = factory.user('reader'), factory.user('writer')
+    factory.follow(viewer, author)
+    posts = factory.posts(author, 5)
+    ids, _ = walk(client, f'/api/posts?feed=following&username={viewer.username}&limit=2')
+    assert ids == [post.id for post in reversed(posts)]
+
+
+def test_invalid_cursor_is_rejected(client, factory):
+    author = factory.user('bad')
+    payload = client.get(f'/api/users/{author.username}?cursor=not-a-cursor').get_json()
+    assert payload['success'] is False
+    assert client.get('/api/posts?cursor=%%%').get_json()['success'] is False
+
+
+def test_chat_inbox_pages_by_last_message(client, factory):
+    owner = factory.user('inbox')
+    peers = [factory.user('peer') for _ in range(3)]
+    for peer in peers:
+        response = client.post('/api/chat/send', json={
+            'sender': owner.username, 'receiver': peer.username, 'content': f'hi {peer.username}'
+        })
+        assert response.get_json()['success']
+    ids, pages = walk(client, f'/api/chat/users?username={owner.username}&limit=1', key='users')
+    assert ids == [peer.id for peer in reversed(peers)]
+    assert pages == 3
@@ -0,0 +1,62 @@
+"""
+تست رگرسیون تعداد کوئری مسیرهای پرتکرار
+
+سقف‌ها عمداً ثابت‌اند: اگر تغییری N+1 برگرداند (یک کوئری به ازای هر پست)
+یا کوئری اضافه‌ای به این مسیرها اضافه کند، تست شکست می‌خورد.
+"""
+import pytest
+
+FEED_QUERY_LIMIT = 2  # صفحه پست‌ها با نویسنده‌ها، لایک‌های viewer
+FOLLOWING_FEED_QUERY_LIMIT = 3  # به اضافه حساب‌های پرمخاطب دنبال‌شده
+INIT_QUERY_LIMIT = 1  # حداکثر خواندن کاربر وقتی در کش نیست
+
+
+@pytest.fixture
+def seeded(factory):
+    viewer = factory.user('viewer')
+    authors = [factory.user('author') for _ in range(4)]
+    for index, author in enumerate(authors):
+        factory.follow(viewer, author)
+        if index % 2:
+            factory.posts(author, 6, likes=[viewer], comments=2)
+        else:
+            factory.posts(author, 6)
+    return viewer
+
+
+def measure(client, count_queries, method, url, **kwargs):
+    client.open(url, method=method, **kwargs)  # گرم کردن کش کاربران
+    with count_queries() as statements:
+        response = client.open(url, method=method, **kwargs)
+    assert response.status_code == 200
+    assert response.get_json()['success']
+    return len(statements), response.get_json()
+
+
+@pytest.mark.parametrize('limit', [5, 20])
+def test_feed_query_count_is_constant(client, count_queries, seeded, limit):
+    count, payload = measure(client, count_queries, 'GET', f'/api/posts?username={seeded.username}&limit={limit}')
+    assert len(payload['posts']) == limit
+    assert count <= FEED_QUERY_LIMIT
+
+
+def test_feed_fills_like_state_and_counts(client, seeded):
+    payload = client.get(f'/api/posts?username={seeded.username}&limit=50').get_json()
+    liked = [post for post in payload['posts'] if post['is_liked']]
+    assert liked
+    assert all(post['likes_count'] >= 1 and post['comments_count'] == 2 for post in liked)
+    assert {str(post['user_id']) for post in payload['posts']} <= set(payload['users'])
+
+
+@pytest.mark.parametrize('limit', [5, 20])
+def test_following_feed_query_count_is_constant(client, count_queries, seeded, limit):
+    count, payload = measure(client, count_queries, 'GET',
+                             f'/api/posts?feed=following&username={seeded.username}&limit={limit}')
+    assert len(payload['posts']) == limit
+    assert count <= FOLLOWING_FEED_QUERY_LIMIT
+
+
+def test_init_query_count(client, count_queries, seeded):
+    count, payload = measure(client, count_queries, 'POST', '/api/init', json={'username': seeded.username})
+    assert payload['user']['username'] == seeded.username
+    assert count <= INIT_QUERY_LIMIT
@@ -0,0 +1,112 @@
+"""
+تست ادغام رویدادهای بلادرنگ با ساعت ساختگی (پارامتر now)
+"""
+from realtime import EngagementCoalescer, TypingCoalescer
+
+ROOM = 'chat:a:b'
+
+
+# ============ TypingCoalescer ============
+def test_first_keystroke_emits_and_repeats_are_dropped():
+    typing = TypingCoalescer(window=0.5, idle_timeout=5)
+    assert typing.update(ROOM, 'a', True, sid='s1', now=0) == (ROOM, 'a', True, 's1')
+    for now in (0.1, 0.2, 1.0, 3.0):
+        assert typing.update(ROOM, 'a', True, sid='s1', now=now) is None
+    assert typing.sweep(now=3.5) == []
+
+
+def test_change_inside_window_waits_for_sweep():
+    typing = TypingCoalescer(window=0.5, idle_timeout=5)
+    typing.update(ROOM, 'a', True, sid='s1', now=0)
+    assert typing.update(ROOM, 'a', False, sid='s1', now=0.1) is None
+    assert typing.sweep(now=0.3) == []
+    assert typing.sweep(now=0.5) == [(ROOM, 'a', False, 's1')]
+    assert typing.sweep(now=1.0) == []
+
+
+def test_flapping_inside_window_emits_nothing():
+    typing = TypingCoalescer(window=0.5, idle_timeout=5)
+    typing.update(ROOM, 'a', True, now=0)
+    typing.update(ROOM, 'a', False, now=0.1)
+    typing.update(ROOM, 'a', True, now=0.2)
+    assert typing.sweep(now=0.6) == []
+
+
+def test_idle_typing_expires():
+    typing = TypingCoalescer(window=0.5, idle_timeout=5)
+    typing.update(ROOM, 'a', True, sid='s1', now=0)
+    typing.update(ROOM, 'a', True, sid='s1', now=2)
+    assert typing.sweep(now=6.9) == []
+    assert typing.sweep(now=7) == [(ROOM, 'a', False, 's1')]
+
+
+def test_stop_without_start_is_ignored():
+    assert TypingCoalescer().update(ROOM, 'a', False, now=0) is None
+
+
+def test_users_and_rooms_are_independent():
+    typing = TypingCoalescer(window=0.5)
+    assert typing.update(ROOM, 'a', True, now=0) is not None
+    assert typing.update(ROOM, 'b', True, now=0.1) is not None
+    assert typing.update('chat:a:c', 'a', True, now=0.1) is not None
+
+
+def test_disconnect_ends_typing_of_that_connection_only():
+    typing = TypingCoalescer(window=0.5)
+    typing.update(ROOM, 'a', True, sid='s1', now=0)
+    typing.update('chat:a:c', 'a', True, sid='s1', now=0)
+    typing.update(ROOM, 'b', True, sid='s2', now=0)
+    assert sorted(typing.drop_sid('s1', now=1)) == [
+        (ROOM, 'a', False, 's1'), ('chat:a:c', 'a', False, 's1')
+    ]
+    assert typing.sweep(now=10) == [(ROOM, 'b', False, 's2')]
+
+
+# ============ EngagementCoalescer ============
+def test_first_change_is_sent_and_burst_is_collapsed():
+    engagement = EngagementCoalescer(window=1.0)
+    assert engagement.touch(7, now=0) is True
+    assert [engagement.touch(7, now=t) for t in (0.1, 0.5, 0.9)] == [False, False, False]
+    assert engagement.sweep(now=0.9) == []
+    assert engagement.sweep(now=1.0) == [7]
+    assert engagement.sweep(now=2.0) == []  # تغییری باقی نمانده
+
+
+def test_quiet_post_is_sent_immediately_after_window():
+    engagement = EngagementCoalescer(window=1.0)
+    engagement.touch(7, now=0)
+    assert engagement.sweep(now=1.5) == []
+    assert engagement.touch(7, now=1.6) is True
+
+
+def test_posts_are_coalesced_independently():
+    engagement = EngagementCoalescer(window=1.0)
+    assert engagement.touch(1, now=0) is True
+    assert engagement.touch(2, now=0.5) is True
+    engagement.touch(1, now=0.6)
+    engagement.touch(2, now=0.7)
+    assert engagement.sweep(now=1.2) == [1]
+    assert engagement.sweep(now=1.5) == [2]
+
+
+def test_like_and_new_post_are_pushed_to_rooms(client, factory, upload, monkeypatch):
+    from app import emit_pending_post_stats, flush_like_buffer, socketio
+    events = []
+    monkeypatch.setattr(socketio, 'emit', lambda event, data, to=None, **kwargs: events.append((event, data, to)))
+    author, fan = factory.user('author'), factory.user('fan')
+    post = factory.post(author)
+
+    client.post(f'/api/posts/{post.id}/like', json={'username': fan.username})
+    client.post(f'/api/posts/{post.id}/like', json={'username': author.username})
+    flush_like_buffer()
+    stats = [(data, to) for event, data, to in events if event == 'post_stats']
+    assert stats == [({'post_id': post.id, 'likes_count': 1}, f'post:{post.id}')]
+    # دومین لایک داخل window ادغام شده و sweeper مقدار نهایی را می‌فرستد
+    emit_pending_post_stats([post.id])
+    assert events[-1] == ('post_stats', {'post_id': post.id, 'likes_count': 2, 'comments_count': 0},
+                          f'post:{post.id}')
+
+    created = upload(author)
+    pushed = [(data, to) for event, data, to in events if event == 'post_created']
+    assert [(data['post']['id'], to) for data, to in pushed] == [(created['post']['id'], 'feed')]
+    assert pushed[0][0]['users'][author.id]['username'] == author.username
@@ -0,0 +1,82 @@
+"""
+تست کش پاسخ: hit، ETag/304، بی‌اعتبار شدن با پست تازه و به‌روز شدن شمارنده‌ها
+"""
+import pytest
+
+
+@pytest.fixture
+def cached(app, db, monkeypatch):
+    from app import flush_like_buffer, response_cache
+    monkeypatch.setitem(app.config, 'RESPONSE_CACHE_MAX_AGE', 30)
+    monkeypatch.setattr(response_cache, 'max_age', 30)
+    yield app
+    flush_like_buffer()
+
+
+def feed(client, viewer, **headers):
+    return client.get(f'/api/posts?username={viewer.username}&limit=5', headers=headers)
+
+
+def find(payload, post):
+    return next(item for item in payload['posts'] if item['id'] == post.id)
+
+
+def test_second_request_is_a_hit_without_queries(cached, client, factory, count_queries):
+    viewer = factory.user('viewer')
+    factory.post(factory.user('author'))
+    first = feed(client, viewer)
+    with count_queries() as statements:
+        second = feed(client, viewer)
+    assert statements == []
+    assert second.data == first.data
+
+
+def test_matching_etag_gets_304(cached, client, factory):
+    viewer = factory.user('viewer')
+    etag = feed(client, viewer).headers['ETag']
+    response = feed(client, viewer, **{'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+
+
+def test_new_post_invalidates_feed(cached, client, factory, upload):
+    viewer, author = factory.user('viewer'), factory.user('author')
+    feed(client, viewer)
+    created = upload(author)
+    assert feed(client, viewer).get_json()['posts'][0]['id'] == created['post']['id']
+
+
+def test_like_updates_counts_without_rebuilding_other_viewers(cached, client, factory, count_queries):
+    reader, fan, author = factory.user('reader'), factory.user('fan'), factory.user('author')
+    post = factory.post(author)
+    before = feed(client, reader)
+    feed(client, fan)
+
+    assert client.post(f'/api/posts/{post.id}/like', json={'username': fan.username}).get_json()['success']
+    with count_queries() as statements:
+        after = feed(client, reader)
+    assert statements == []  # پاسخ بیننده دیگر از کش سرو می‌شود
+    assert find(after.get_json(), post)['likes_count'] == 1
+    assert find(after.get_json(), post)['is_liked'] is False
+    assert after.headers['ETag'] != before.headers['ETag']
+
+    # وضعیت is_liked خود لایک‌کننده تازه ساخته می‌شود
+    assert find(feed(client, fan).get_json(), post)['is_liked'] is True
+
+
+def test_comment_count_reaches_cached_profile(cached, client, factory):
+    author, reader = factory.user('author'), factory.user('reader')
+    post = factory.post(author)
+    url = f'/api/users/{author.username}'
+    assert find(client.get(url).get_json(), post)['comments_count'] == 0
+    client.post(f'/api/posts/{post.id}/comments', json={'username': reader.username, 'text': 'سلام'})
+    assert find(client.get(url).get_json(), post)['comments_count'] == 1
+
+
+def test_projected_response_keeps_its_fields(cached, client, factory):
+    author, reader = factory.user('author'), factory.user('reader')
+    post = factory.post(author)
+    url = f'/api/users/{author.username}?fields=id,comments_count'
+    client.get(url)
+    client.post(f'/api/posts/{post.id}/comments', json={'username': reader.username, 'text': 'سلام'})
+    assert find(client.get(url).get_json(), post) == {'id': post.id, 'comments_count': 1}
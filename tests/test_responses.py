@@ -0,0 +1,71 @@
+"""
+تست قالب پاسخ‌ها: ?fields=، جدول کناری کاربران، فشرده‌سازی و JSON سریع
+"""
+import gzip
+from datetime import datetime
+
+from responses import parse_fields, project
+
+
+def test_parse_fields_always_keeps_id():
+    assert parse_fields('likes_count, caption ,') == {'id', 'likes_count', 'caption'}
+    assert parse_fields('') is None
+    assert parse_fields(None) is None
+
+
+def test_project_keeps_only_requested_keys():
+    items = [{'id': 1, 'caption': 'a', 'likes_count': 3}]
+    assert project(items, {'id', 'likes_count'}) == [{'id': 1, 'likes_count': 3}]
+    assert project(items, None) is items
+
+
+def test_feed_projection_and_user_table(client, factory):
+    author, other = factory.user('author'), factory.user('other')
+    factory.post(author)
+    factory.post(author)
+    factory.post(other)
+
+    payload = client.get('/api/posts?limit=3').get_json()
+    assert [post['user_id'] for post in payload['posts']] == [other.id, author.id, author.id]
+    # هر نویسنده یک‌بار در جدول کناری، کلیدها شناسه کاربر
+    assert payload['users'] == {
+        str(author.id): {'username': author.username, 'display_name': 'author', 'profile_pic': author.profile_pic},
+        str(other.id): {'username': other.username, 'display_name': 'other', 'profile_pic': other.profile_pic},
+    }
+    assert 'username' not in payload['posts'][0]
+
+    projected = client.get('/api/posts?limit=3&fields=likes_count').get_json()
+    assert all(set(post) == {'id', 'likes_count'} for post in projected['posts'])
+    assert projected['users'] == {}  # بدون user_id جدول کاربران لازم نیست
+    with_authors = client.get('/api/posts?limit=3&fields=user_id').get_json()
+    assert len(with_authors['users']) == 2
+
+
+def test_large_json_is_gzipped_with_weak_etag(app, client, factory, monkeypatch):
+    monkeypatch.setitem(app.config, 'COMPRESS_MIN_SIZE', 10)
+    factory.post(factory.user('author'))
+    plain = client.get('/api/posts?limit=5')
+    response = client.get('/api/posts?limit=5', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert gzip.decompress(response.data) == plain.data
+
+
+def test_small_json_is_not_compressed(client):
+    response = client.get('/api/users/search?q=a', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    assert 'Accept-Encoding' in response.headers['Vary']
+
+
+def test_json_provider_serializes_like_flask(app):
+    body = app.json.dumps({'b': 1, 'a': 'سلام', 'at': datetime(2024, 1, 2, 3, 4, 5)})
+    assert app.json.loads(body) == {'a': 'سلام', 'at': 'Tue, 02 Jan 2024 03:04:05 GMT', 'b': 1}
+    assert body.index('"a"') < body.index('"b"')  # sort_keys
+    assert 'سلام' in body  # ensure_ascii=False
+
+
+def test_media_files_have_no_vary(client, factory, upload):
+    created = upload(factory.user('author'))
+    response = client.get(created['post']['image_url'], headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert 'Vary' not in response.headers and 'Content-Encoding' not in response.headers
@@ -0,0 +1,73 @@
+"""
+تست نرمال‌سازی متن فارسی و جستجوی کاربران
+"""
+import pytest
+
+from search import initial_match_query, match_query, match_rank, normalize_text
+
+ARABIC_YEH, PERSIAN_YEH = 'ي', 'ی'
+ARABIC_KAF, PERSIAN_KAF = 'ك', 'ک'
+ZWNJ = '‌'
+
+
+def test_arabic_letters_match_persian():
+    assert normalize_text(f'{ARABIC_KAF}ت{ARABIC_YEH}') == normalize_text(f'{PERSIAN_KAF}ت{PERSIAN_YEH}')
+
+
+def test_zwnj_kashida_and_digits():
+    assert normalize_text(f'می{ZWNJ}خواهم') == 'میخواهم'
+    assert normalize_text('سـلام') == 'سلام'
+    assert normalize_text('علی۱۲٣') == 'علی123'
+    assert normalize_text('ALI') == 'ali'
+
+
+def test_match_query_prefixes_every_token():
+    assert match_query(f'Ali  رض{ARABIC_YEH}') == f'"ali"* "رض{PERSIAN_YEH}"*'
+    assert match_query(' - ') is None
+
+
+def test_initial_match_query_anchors_phrase():
+    assert initial_match_query('ali re', 'display_name') == 'display_name : ^ "ali" + "re"*'
+    assert initial_match_query('!', 'display_name') is None
+
+
+@pytest.mark.parametrize('username, display_name, rank', [
+    ('ali', 'x', 0),
+    ('ALI', 'x', 0),
+    ('alireza', 'x', 1),
+    ('reza', f'Ali{ZWNJ}رضا', 2),
+    ('reza', 'mohammad ali', 3),
+])
+def test_match_rank(username, display_name, rank):
+    assert match_rank('ali', username, display_name) == rank
+
+
+def search(client, query):
+    return [user['username'] for user in client.get(f'/api/users/search?q={query}').get_json()['users']]
+
+
+def rename(db, user, display_name):
+    user.display_name = display_name
+    db.session.commit()
+    return user
+
+
+def test_search_finds_persian_name_typed_with_arabic_letters(client, db, factory):
+    user = rename(db, factory.user('fa'), f'{PERSIAN_KAF}امران')
+    assert user.username in search(client, f'{ARABIC_KAF}امر')
+
+
+def test_display_name_prefix_survives_candidate_limit(app, client, db, factory, monkeypatch):
+    monkeypatch.setitem(app.config, 'SEARCH_CANDIDATES', 3)
+    for _ in range(6):
+        rename(db, factory.user('noise'), 'aaa qwzeta')
+    boss = rename(db, factory.user('boss'), 'qwzeta boss')
+    assert search(client, 'qwz')[0] == boss.username
+
+
+def test_username_prefix_ranks_first(app, client, db, factory, monkeypatch):
+    monkeypatch.setitem(app.config, 'SEARCH_CANDIDATES', 3)
+    for _ in range(6):
+        rename(db, factory.user('filler'), 'qxprefix')
+    owner = factory.user('qxprefixowner')
+    assert search(client, 'qxprefix')[0] == owner.username
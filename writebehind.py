@@ -0,0 +1,340 @@
+"""
+نوشتن تأخیری با commit گروهی
+
+درخواست‌ها فقط آیتم را در صف حافظه می‌گذارند. یک کار پس‌زمینه آیتم‌ها را
+جمع می‌کند و هر max_delay ثانیه یا با رسیدن به max_batch آیتم، همه را در یک
+تراکنش (یک fsync) ذخیره می‌کند و سپس callback هر آیتم را صدا می‌زند.
+صف و کار پس‌زمینه از همان async_mode سرور Socket.IO ساخته می‌شوند تا با
+eventlet و threading هر دو کار کنند.
+
+LikeBuffer وضعیت لایک‌ها را در حافظه نگه می‌دارد و فقط تغییر خالص هر
+(کاربر، پست) را به صورت دوره‌ای ذخیره می‌کند؛ LikeJournal هر تغییر را پیش
+از پاسخ در فایل append-only می‌نویسد تا پس از crash بازیابی شود.
+"""
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # ویندوز: بدون قفل فایل، همه ژورنال‌های دیگر رها شده فرض می‌شوند
+    fcntl = None
+
+
+class GroupCommitWriter:
+    """صف نوشتن با commit گروهی
+
+    flush(items) باید همه آیتم‌ها را در یک تراکنش ذخیره کند و لیست نتیجه‌ها
+    را به همان ترتیب برگرداند. on_durable(result, error) هر آیتم پس از
+    ذخیره شدن دسته صدا زده می‌شود؛ در صورت خطا result برابر None است.
+    """
+
+    def __init__(self, socketio, flush, max_batch=200, max_delay=0.005):
+        self.socketio = socketio
+        self.flush = flush
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = None
+        self._empty = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """ساخت صف و اجرای کار پس‌زمینه (فقط یک‌بار)"""
+        with self._lock:
+            if self._queue is None:
+                eio = self.socketio.server.eio
+                self._empty = eio.get_queue_empty_exception()
+                self._queue = eio.create_queue()
+                self.socketio.start_background_task(self._run)
+        return self._queue
+
+    def submit(self, item, on_durable=None):
+        self.start().put((item, on_durable))
+
+    def _collect(self):
+        """انتظار برای اولین آیتم و جمع کردن بقیه تا پر شدن دسته یا پایان مهلت"""
+        queue = self._queue
+        batch = [queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(queue.get(timeout=remaining) if remaining > 0 else queue.get_nowait())
+            except self._empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            self._commit(self._collect())
+
+    def _commit(self, batch):
+        items = [item for item, _ in batch]
+        try:
+            results, error = self.flush(items), None
+        except Exception as e:
+            results, error = [None] * len(items), e
+        for (_, on_durable), result in zip(batch, results):
+            if on_durable is not None:
+                try:
+                    on_durable(result, error)
+                except Exception as e:
+                    print(f"❌ خطا در callback نوشتن گروهی: {e}")
+
+    def drain(self):
+        """ذخیره همزمان آیتم‌های باقیمانده در صف (هنگام خاموش شدن)"""
+        if self._queue is None:
+            return
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except self._empty:
+                break
+            if len(batch) >= self.max_batch:
+                self._commit(batch)
+                batch = []
+        if batch:
+            self._commit(batch)
+
+
+class LikeJournal:
+    """ژورنال append-only تغییرهای بافر لایک
+
+    هر پردازه یک شناسه writer دارد و در segment های شماره‌دار خودش
+    می‌نویسد و تا زنده است روی آن‌ها قفل انحصاری دارد. هر خط
+    «user_id post_id durable liked time» وضعیت نهایی یک کلید، وضعیتی که
+    بافر در دیتابیس می‌دانست و زمان تغییر است. flush همراه با تغییرها
+    شماره آخرین segment بسته‌شده را در همان تراکنش ثبت می‌کند (checkpoint)،
+    پس segment هایی که پیش از حذف شدن crash کرده‌اند دوباره بازپخش نمی‌شوند.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.writer = f'{time.time_ns():020d}-{os.getpid()}'
+        self._seq = 0
+        self._file = None
+        self._lines = 0
+        self._sealed = []
+
+    def _open_segment(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._seq += 1
+        path = os.path.join(self.directory, f'{self.writer}-{self._seq:06d}.log')
+        self._file = open(path, 'a', encoding='ascii')
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._lines = 0
+
+    def append(self, user_id, post_id, durable, liked):
+        if self._file is None:
+            self._open_segment()
+        self._file.write(f'{user_id} {post_id} {int(durable)} {int(liked)} {time.time():.6f}\n')
+        self._file.flush()  # تا اینجا در برابر crash پردازه ماندگار است
+        self._lines += 1
+
+    def seal(self):
+        """بستن segment فعلی؛ خروجی: شماره آخرین segment بسته‌شده یا None
+
+        تغییرهای بعدی در segment تازه با شماره بزرگ‌تر نوشته می‌شوند.
+        """
+        if self._file is not None and self._lines:
+            self._sealed.append(self._file)
+            self._file = None
+        return max((self.parse_name(segment.name)[1] for segment in self._sealed), default=None)
+
+    def discard_sealed(self):
+        """حذف segment های بسته‌شده پس از commit موفق"""
+        self.discard(self._sealed)
+        self._sealed = []
+
+    @staticmethod
+    def discard(segments):
+        for segment in segments:
+            os.remove(segment.name)
+            segment.close()
+
+    @staticmethod
+    def parse_name(path):
+        """(writer, seq) از نام فایل segment"""
+        writer, seq = os.path.basename(path)[:-len('.log')].rsplit('-', 1)
+        return writer, int(seq)
+
+    def writers(self):
+        """شناسه writer هایی که هنوز segment دارند"""
+        if not os.path.isdir(self.directory):
+            return set()
+        return {self.parse_name(name)[0] for name in os.listdir(self.directory) if name.endswith('.log')}
+
+    def orphaned(self):
+        """segment های پردازه‌های مرده (بدون قفل) به ترتیب writer و شماره"""
+        if not os.path.isdir(self.directory):
+            return []
+        segments = []
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if not name.endswith('.log') or self.parse_name(name)[0] == self.writer:
+                continue
+            segment = open(path, 'a+', encoding='ascii')
+            if fcntl is not None:
+                try:
+                    fcntl.flock(segment, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    segment.close()  # صاحبش هنوز زنده است
+                    continue
+            segments.append(segment)
+        return segments
+
+    @staticmethod
+    def replay(segments):
+        """آخرین خط هر (user_id, post_id) در segment ها: {key: (durable, liked, time)}
+
+        خط ناقص آخر فایل (crash وسط نوشتن) نادیده گرفته می‌شود.
+        """
+        states = {}
+        for segment in segments:
+            segment.seek(0)
+            for line in segment:
+                parts = line.split()
+                if not line.endswith('\n') or len(parts) != 5:
+                    continue
+                user_id, post_id, durable, liked, changed_at = parts
+                states[(int(user_id), int(post_id))] = (durable == '1', liked == '1', float(changed_at))
+        return states
+
+
+class LikeBuffer:
+    """بافر درون‌حافظه‌ای لایک‌ها با ذخیره دسته‌ای تغییرهای خالص
+
+    برای هر (user_id, post_id) لمس‌شده وضعیت ذخیره‌شده در دیتابیس و وضعیت
+    فعلی نگه داشته می‌شود؛ toggle فقط وضعیت فعلی را برمی‌گرداند و پاسخ را
+    از همان می‌سازد. likes_count پاسخ برابر آخرین مقدار دیتابیس به اضافه
+    تغییرهای ذخیره‌نشده است.
+
+    write(changes, checkpoints) باید همه تغییرها را در یک تراکنش ذخیره کند
+    و {post_id: likes_count تازه} برگرداند. هر تغییر
+    (user_id, post_id, durable, liked, since) است؛ since برای تغییرهای
+    بازپخش‌شده از ژورنال زمان تغییر است و write باید تغییری را که وضعیت
+    دیتابیسش از آن زمان با durable فرق کرده نادیده بگیرد. checkpoints
+    {writer: seq} در همان تراکنش ثبت می‌شود.
+    """
+
+    def __init__(self, journal=None):
+        self.journal = journal
+        self._entries = {}  # (user_id, post_id) -> [وضعیت در دیتابیس, وضعیت فعلی]
+        self._deltas = {}   # post_id -> تغییر ذخیره‌نشده likes_count
+        self._counts = {}   # post_id -> آخرین likes_count دیده‌شده در دیتابیس
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def toggle(self, user_id, post_id, load):
+        """تغییر وضعیت لایک و برگرداندن (is_liked, likes_count)
+
+        load() فقط برای کلید یا پست ناشناخته صدا زده می‌شود و باید
+        (likes_count, liked) دیتابیس یا None (پست وجود ندارد) برگرداند.
+        """
+        key = (user_id, post_id)
+        with self._lock:
+            if key in self._entries and post_id in self._counts:
+                return self._toggle(key)
+        # هم‌زمان با flush خوانده نمی‌شود تا وضعیت دیتابیس نیمه‌کاره دیده نشود
+        with self._flush_lock:
+            loaded = load()
+            if loaded is None:
+                return None
+            with self._lock:
+                likes_count, liked = loaded
+                self._counts.setdefault(key[1], likes_count)
+                self._entries.setdefault(key, [liked, liked])
+                return self._toggle(key)
+
+    def _toggle(self, key):
+        user_id, post_id = key
+        entry = self._entries[key]
+        entry[1] = not entry[1]
+        delta = self._deltas.get(post_id, 0) + (1 if entry[1] else -1)
+        self._deltas[post_id] = delta
+        if self.journal is not None:
+            self.journal.append(user_id, post_id, entry[0], entry[1])
+        return entry[1], self._counts[post_id] + delta
+
+    def pending_delta(self, post_id):
+        """تغییر ذخیره‌نشده likes_count پست (برای نمایش شمارنده خوانده‌شده از دیتابیس)"""
+        return self._deltas.get(post_id, 0)
+
+    def overlay_liked(self, user_id, post_ids, liked_ids):
+        """اعمال وضعیت‌های بافرشده کاربر روی مجموعه لایک‌های خوانده‌شده از دیتابیس"""
+        liked_ids = set(liked_ids)
+        with self._lock:
+            for post_id in post_ids:
+                entry = self._entries.get((user_id, post_id))
+                if entry is not None:
+                    (liked_ids.add if entry[1] else liked_ids.discard)(post_id)
+        return liked_ids
+
+    def flush(self, write):
+        """ذخیره تغییرهای خالص؛ خروجی: تعداد کلیدهای ذخیره‌شده
+
+        در صورت خطای write تغییرها در بافر و ژورنال می‌مانند و دفعه بعد
+        دوباره تلاش می‌شود.
+        """
+        with self._flush_lock:
+            with self._lock:
+                changes = [
+                    (user_id, post_id, durable, liked, None)
+                    for (user_id, post_id), (durable, liked) in self._entries.items()
+                    if durable != liked
+                ]
+                checkpoint = self.journal.seal() if self.journal is not None else None
+            # segment هایی که فقط تغییر خنثی دارند بدون نوشتن دور ریخته می‌شوند
+            checkpoints = {self.journal.writer: checkpoint} if checkpoint else {}
+            counts = write(changes, checkpoints) if changes else {}
+            with self._lock:
+                self._committed(changes, counts)
+                if self.journal is not None:
+                    self.journal.discard_sealed()
+            return len(changes)
+
+    def _committed(self, changes, counts):
+        for user_id, post_id, _, liked, _ in changes:
+            entry = self._entries[(user_id, post_id)]
+            entry[0] = liked
+            self._deltas[post_id] -= 1 if liked else -1
+        for post_id, likes_count in counts.items():
+            if likes_count is not None:
+                self._counts[post_id] = likes_count
+        # کلیدهای همگام حذف می‌شوند تا حافظه فقط به اندازه تغییرهای در جریان باشد
+        for key in [key for key, (durable, liked) in self._entries.items() if durable == liked]:
+            del self._entries[key]
+        active = {post_id for _, post_id in self._entries}
+        for post_id in list(self._counts):
+            if post_id not in active:
+                self._counts.pop(post_id)
+                self._deltas.pop(post_id, None)
+
+    def recover(self, write, checkpoints):
+        """بازپخش ژورنال پردازه‌های مرده (پیش از پذیرفتن درخواست)
+
+        checkpoints: {writer: seq} ثبت‌شده در دیتابیس؛ segment هایی که
+        شماره‌شان از checkpoint writer بزرگ‌تر نیست commit شده‌اند و فقط
+        حذف می‌شوند.
+        خروجی: تعداد کلیدهای بازپخش‌شده
+        """
+        if self.journal is None:
+            return 0
+        segments = self.journal.orphaned()
+        pending, replayed = [], {}
+        for segment in segments:
+            writer, seq = self.journal.parse_name(segment.name)
+            if seq > checkpoints.get(writer, 0):
+                pending.append(segment)
+                replayed[writer] = max(seq, replayed.get(writer, 0))
+        changes = [
+            (user_id, post_id, durable, liked, changed_at)
+            for (user_id, post_id), (durable, liked, changed_at) in self.journal.replay(pending).items()
+            if durable != liked
+        ]
+        if changes:
+            write(changes, replayed)
+        self.journal.discard(segments)
+        return len(changes)